@@ -0,0 +1,76 @@
+"""合成基准语料：仿照 Data/testdata.txt 生成中文文档，仿照 Data/AI_DA.json 生成 chunk 导入文件
+
+句子取自 Data/testdata.txt 并按固定种子重新组合，同一规模、同一种子每次生成的内容完全相同。
+"""
+import json
+import os
+import random
+import re
+import uuid
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Data")
+# 规模：(文档数, 每篇文档的段落数, 导入文件的 chunk 数)
+SIZES = {
+    "small": (10, 6, 1000),
+    "medium": (50, 12, 10000),
+    "large": (200, 24, 50000),
+}
+SENTENCES_PER_PARAGRAPH = 6
+
+
+def load_sentences(path=os.path.join(DATA_DIR, "testdata.txt")):
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    return [sentence for sentence in re.findall(r"[^。！？\n]+[。！？]", text) if len(sentence) > 5]
+
+
+def make_document(rng, sentences, paragraphs, title):
+    """生成一篇带编号小标题的文档"""
+    lines = [title, ""]
+    for p in range(paragraphs):
+        if p % 3 == 0:
+            lines.extend([f"{p // 3 + 1}. 第{p // 3 + 1}部分", ""])
+        # 句子末尾附加段落编号，避免不同文档出现完全相同的段落
+        lines.append("".join(rng.choice(sentences) for _ in range(SENTENCES_PER_PARAGRAPH)) + f"（段落{p + 1}）")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def make_chunk_record(rng, sentences, index, collection_id):
+    """生成一条与 AI_DA.json 中 chunks 结构一致的记录"""
+    question = rng.choice(sentences).rstrip("。！？") + "？"
+    answer = "".join(rng.choice(sentences) for _ in range(3))
+    source = "".join(rng.choice(sentences) for _ in range(SENTENCES_PER_PARAGRAPH))
+    return {
+        "chunk_id": uuid.UUID(int=rng.getrandbits(128)).hex[:24],
+        "record_id": None,
+        "collection_id": collection_id,
+        "content": f"问题：{question}（{index}）\n答案：{answer}\n原文：{source}",
+        "num_tokens": None,
+        "metadata": {},
+        "updated_timestamp": None,
+        "created_timestamp": None,
+    }
+
+
+def build_corpus(size, out_dir, seed=0):
+    """在 out_dir 下生成 docs/*.txt 和 chunks.json，返回 (文档路径列表, chunk 文件路径)"""
+    documents, paragraphs, chunk_count = SIZES[size]
+    rng = random.Random(seed)
+    sentences = load_sentences()
+    docs_dir = os.path.join(out_dir, "docs")
+    os.makedirs(docs_dir, exist_ok=True)
+    paths = []
+    for i in range(documents):
+        path = os.path.join(docs_dir, f"doc_{i:04d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(make_document(rng, sentences, paragraphs, f"合成文档 {i + 1}"))
+        paths.append(path)
+    chunks_path = os.path.join(out_dir, "chunks.json")
+    with open(chunks_path, "w", encoding="utf-8") as f:
+        f.write('{\n    "chunks": [\n')
+        for i in range(chunk_count):
+            record = make_chunk_record(rng, sentences, i, "bench")
+            f.write(("        " if i == 0 else ",\n        ") + json.dumps(record, ensure_ascii=False))
+        f.write("\n    ]\n}\n")
+    return paths, chunks_path
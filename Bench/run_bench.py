@@ -0,0 +1,303 @@
+"""可重复的基准测试：在本地替身服务上测量解析、生成、写入和导出的吞吐量、延迟分位数与峰值内存
+
+示例：
+    python Bench/run_bench.py --size small --benchmarks parse,generate,insert,export --latency 0.05
+    python Bench/run_bench.py --size medium --error-rate 0.02 --rate-limit 200 --output bench.json
+
+替身服务在独立进程中运行，不与被测代码争用 GIL；同一规模、同一种子生成的语料完全相同。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "Code"))
+
+from corpus import SIZES, build_corpus  # noqa: E402
+from stub_servers import StubBehavior, serve_forever  # noqa: E402
+
+BENCHMARKS = ("parse", "generate", "insert", "export")
+
+
+class LatencyRecorder:
+    """记录每次操作的耗时（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+
+    def wrap(self, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.samples.append(time.perf_counter() - start)
+        return timed
+
+    def percentile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class PeakRSS:
+    """后台线程定期采样当前进程的常驻内存，记录测量区间内的峰值（字节）"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def _current(self):
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self._page_size
+        except OSError:
+            # 非 Linux 平台退回到进程生命周期内的峰值（macOS 单位为字节，Linux 为 KB）
+            usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return usage if sys.platform == "darwin" else usage * 1024
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._current())
+
+    def __enter__(self):
+        self.peak = self._current()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._current())
+
+
+def _timed_parse(name, data):
+    """在子进程中解析单个文件，返回 (文本块数, 错误信息, 耗时)"""
+    from doc_parsing import parse_file
+
+    start = time.perf_counter()
+    chunks, error = parse_file(name, data)
+    return len(chunks or []), error, time.perf_counter() - start
+
+
+def bench_parse(ctx):
+    files = []
+    for path in ctx["doc_paths"]:
+        with open(path, "rb") as f:
+            files.append((os.path.basename(path), f.read()))
+    recorder = LatencyRecorder()
+    chunk_texts = []
+    errors = 0
+    with ProcessPoolExecutor(max_workers=ctx["parse_workers"]) as executor:
+        futures = [executor.submit(_timed_parse, name, data) for name, data in files]
+        for future in as_completed(futures):
+            count, error, elapsed = future.result()
+            recorder.samples.append(elapsed)
+            errors += bool(error)
+    # 生成阶段使用的文本块在当前进程中分割，避免把 Document 对象跨进程传回
+    from doc_parsing import parse_file
+
+    for name, data in files:
+        chunks, _ = parse_file(name, data)
+        chunk_texts.extend(chunk.page_content for chunk in chunks or [])
+    ctx["chunk_texts"] = chunk_texts
+    return len(files), errors, recorder
+
+
+def bench_generate(ctx):
+    import AutoQAG
+    from llm_pool import run_ordered
+
+    recorder = LatencyRecorder()
+    complete = recorder.wrap(lambda text: AutoQAG.complete_chunk(text, use_cache=False))
+    texts = ctx.get("chunk_texts") or [f"第{i}段用于生成测试的文本。" * 20 for i in range(ctx["generate_count"])]
+    texts = texts[:ctx["generate_count"]]
+    results = run_ordered(complete, texts, max_workers=ctx["workers"])
+    return len(texts), sum(1 for result in results if result is None), recorder
+
+
+def _create_collection(name):
+    import AutoQAG
+    from ingest import get_session
+
+    response = get_session().post(
+        f"{AutoQAG.base_url}collections",
+        headers=AutoQAG.headers,
+        json={"name": name, "capacity": 10 ** 9, "embedding_model_id": "bench"},
+        timeout=60,
+    )
+    response.raise_for_status()
+    return response.json()["data"]["collection_id"]
+
+
+def bench_insert(ctx):
+    import AutoQAG
+    from ingest import ChunkIngestor
+    from json_stream import JsonRecordStream, record_content
+
+    recorder = LatencyRecorder()
+    ingestor = ChunkIngestor(AutoQAG.base_url, AutoQAG.headers, max_workers=ctx["workers"])
+    ingestor.create_chunk = recorder.wrap(ingestor.create_chunk)
+    with open(ctx["chunks_path"], "rb") as f:
+        contents = [record_content(record) for record in JsonRecordStream(f)]
+    collection_id = _create_collection("bench_insert")
+    report = ingestor.ingest(collection_id, contents)
+    ctx["export_collection_id"] = collection_id
+    return len(contents), len(report.failures()), recorder
+
+
+def bench_export(ctx):
+    import AutoQAG
+    from export import CollectionExporter
+
+    collection_id = ctx["export_collection_id"]
+    recorder = LatencyRecorder()
+    exporter = CollectionExporter(AutoQAG.base_url, AutoQAG.headers, max_workers=ctx["workers"])
+    exporter._get = recorder.wrap(exporter._get)
+    count = exporter.export_jsonl(collection_id, os.path.join(ctx["data_dir"], "export.jsonl"))
+    return count, 0, recorder
+
+
+def use_data_dir(data_dir):
+    """把 AutoQAG 的缓存、索引、清单、会话存储、任务和导出路径都指向 data_dir，基准测试不读写 Code/.cache"""
+    import AutoQAG
+
+    cache_dir = os.path.join(data_dir, "cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    AutoQAG.COMPLETION_CACHE_PATH = os.path.join(cache_dir, "completions.sqlite3")
+    AutoQAG.SHARD_MANIFEST_PATH = os.path.join(cache_dir, "shards.sqlite3")
+    AutoQAG.RECORD_INDEX_PATH = os.path.join(cache_dir, "records.sqlite3")
+    AutoQAG.DOCUMENT_MANIFEST_PATH = os.path.join(cache_dir, "documents.sqlite3")
+    AutoQAG.DEDUP_INDEX_PATH = os.path.join(cache_dir, "fingerprints.sqlite3")
+    AutoQAG.JOB_DB_PATH = os.path.join(cache_dir, "jobs.sqlite3")
+    AutoQAG.JOB_DIR = os.path.join(cache_dir, "jobs")
+    AutoQAG.QA_STORE_DIR = os.path.join(cache_dir, "sessions")
+    AutoQAG.EXPORT_DIR = os.path.join(data_dir, "exports")
+
+
+def run_benchmark(name, ctx):
+    func = globals()[f"bench_{name}"]
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        records, errors, recorder = func(ctx)
+        elapsed = time.perf_counter() - start
+    return {
+        "benchmark": name,
+        "records": records,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "records_per_second": round(records / elapsed, 1) if elapsed else None,
+        "p50_ms": _ms(recorder.percentile(50)),
+        "p99_ms": _ms(recorder.percentile(99)),
+        "peak_rss_mb": round(rss.peak / 1024 / 1024, 1),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def _serve(args, ready):
+    # StubBehavior 含锁，不能跨进程传递，在子进程中构造
+    serve_forever(
+        args.llm_port,
+        args.taskingai_port,
+        StubBehavior(args.latency, error_rate=args.error_rate, rate_limit=args.rate_limit, seed=args.seed + 1),
+        StubBehavior(args.taskingai_latency, error_rate=args.error_rate, rate_limit=args.rate_limit, seed=args.seed + 2),
+        ready=ready,
+    )
+
+
+def start_stub_servers(args):
+    """在独立进程中启动替身服务，返回 (进程, 大模型地址, TaskingAI 地址)"""
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=_serve, args=(args, ready), daemon=True)
+    process.start()
+    if not ready.wait(30):
+        process.terminate()
+        raise RuntimeError("替身服务启动失败")
+    return process, f"http://127.0.0.1:{args.llm_port}/v1/", f"http://127.0.0.1:{args.taskingai_port}/v1/"
+
+
+def print_table(rows):
+    columns = ["benchmark", "records", "errors", "seconds", "records_per_second", "p50_ms", "p99_ms", "peak_rss_mb"]
+    widths = [max(len(column), *(len(str(row[column])) for row in rows)) for column in columns]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row[column]).ljust(width) for column, width in zip(columns, widths)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="在本地替身服务上运行 AutoQAG 基准测试")
+    parser.add_argument("--size", choices=sorted(SIZES), default="small", help="合成语料规模")
+    parser.add_argument("--benchmarks", default=",".join(BENCHMARKS), help="逗号分隔的基准项：parse,generate,insert,export")
+    parser.add_argument("--data-dir", help="语料、导出文件以及缓存和索引数据库的目录，默认使用临时目录")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=8, help="生成、写入和导出的并发数")
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 1, help="解析进程数")
+    parser.add_argument("--generate-count", type=int, default=200, help="最多生成的文本块数")
+    parser.add_argument("--latency", type=float, default=0.05, help="替身大模型接口平均延迟（秒）")
+    parser.add_argument("--taskingai-latency", type=float, default=0.005, help="替身 TaskingAI 接口平均延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="替身服务返回 503 的概率")
+    parser.add_argument("--rate-limit", type=int, help="替身服务每秒请求数上限，超过返回 429")
+    parser.add_argument("--llm-port", type=int, default=18080)
+    parser.add_argument("--taskingai-port", type=int, default=18081)
+    parser.add_argument("--output", help="将结果写入 JSON 文件")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    names = [name.strip() for name in args.benchmarks.split(",") if name.strip()]
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        print(f"未知的基准项: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="autoqag_bench_")
+    doc_paths, chunks_path = build_corpus(args.size, data_dir, seed=args.seed)
+    process, llm_url, taskingai_url = start_stub_servers(args)
+    try:
+        import AutoQAG
+
+        AutoQAG.configure(taskingai_base_url=taskingai_url, taskingai_api_key="bench",
+                          llm_base_url=llm_url, llm_api_key="bench")
+        use_data_dir(data_dir)
+        ctx = {"doc_paths": doc_paths, "chunks_path": chunks_path, "data_dir": data_dir, "workers": args.workers,
+               "parse_workers": args.parse_workers, "generate_count": args.generate_count}
+        rows = []
+        if "export" in names and "insert" not in names[:names.index("export")]:
+            # 导出需要先写入语料，单独运行导出时写入耗时不计入结果
+            bench_insert(ctx)
+        for name in names:
+            rows.append(run_benchmark(name, ctx))
+            print(f"{name} 完成", file=sys.stderr)
+    finally:
+        process.terminate()
+        process.join()
+
+    print_table(rows)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"size": args.size, "seed": args.seed, "latency": args.latency, "error_rate": args.error_rate,
+                       "rate_limit": args.rate_limit, "workers": args.workers, "results": rows}, f,
+                      ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
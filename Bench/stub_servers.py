@@ -0,0 +1,279 @@
+"""本地替身服务：OpenAI 兼容的 chat/completions 接口与 TaskingAI collections/chunks 接口
+
+延迟、错误率和限流均可配置，用于在没有真实大模型和 TaskingAI 后端时运行基准测试或手动试用界面。
+
+单独运行：
+    python Bench/stub_servers.py --llm-port 18080 --taskingai-port 18081 --latency 0.2 --error-rate 0.02
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StubBehavior:
+    """替身服务的行为：平均延迟（秒）及抖动比例、返回 5xx 的概率、每秒请求数上限（超过返回 429）"""
+
+    def __init__(self, latency=0.0, jitter=0.2, error_rate=0.0, rate_limit=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    def delay(self):
+        if self.latency <= 0:
+            return 0.0
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter)
+        return self.latency * factor
+
+    def should_fail(self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def rate_limited(self):
+        """固定一秒窗口计数，超过 rate_limit 时返回 True"""
+        if not self.rate_limit:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1:
+                self._window_start = now
+                self._window_count = 0
+            self._window_count += 1
+            return self._window_count > self.rate_limit
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    behavior = StubBehavior()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def _simulate(self):
+        """按配置模拟限流、延迟和服务端错误，已经返回错误响应时返回 False"""
+        if self.behavior.rate_limited():
+            self._send_json(429, {"error": {"message": "rate limited"}}, {"Retry-After": "1"})
+            return False
+        time.sleep(self.behavior.delay())
+        if self.behavior.should_fail():
+            self._send_json(503, {"error": {"message": "service unavailable"}})
+            return False
+        return True
+
+
+class StubLLMHandler(_Handler):
+    """chat/completions：普通提示返回两个以空行分隔的 Q:/A: 问答对，批量提示（<<<文本 i>>>）返回 JSON 结果，支持 stream"""
+
+    _SECTION_PATTERN = re.compile(r"<<<文本 (\d+)>>>\n(.*?)\n<<<文本 \1 结束>>>", re.S)
+    _TEXT_PATTERN = re.compile(r"给定文本：\s*(.*?)\s*请基于这个文本生成问答对", re.S)
+
+    def _answer(self, prompt):
+        sections = self._SECTION_PATTERN.findall(prompt)
+        if sections:
+            results = [
+                {"id": int(i), "pairs": [
+                    {"question": f"第{i}段文本讲了什么？", "answer": text.strip()[:60]},
+                    {"question": f"第{i}段文本的结尾是什么？", "answer": text.strip()[-60:]},
+                ]}
+                for i, text in sections
+            ]
+            return "```json\n" + json.dumps({"results": results}, ensure_ascii=False) + "\n```"
+        match = self._TEXT_PATTERN.search(prompt)
+        text = match.group(1) if match else prompt
+        return f"Q: 这段文本的主要内容是什么？\nA: {text[:80]}\n\nQ: 这段文本的结尾是什么？\nA: {text[-80:]}"
+
+    def do_POST(self):
+        body = self._read_json()
+        if not urlparse(self.path).path.endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": "not found"}})
+        if not self._simulate():
+            return
+        content = self._answer(body["messages"][-1]["content"])
+        usage = {"prompt_tokens": len(body["messages"][-1]["content"]), "completion_tokens": len(content)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if body.get("stream"):
+            return self._stream(content, body.get("model", "stub"))
+        self._send_json(200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": usage,
+        })
+
+    def _stream(self, content, model):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for start in range(0, len(content), 8):
+            event = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": content[start:start + 8]}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+class StubTaskingAIHandler(_Handler):
+    """collections 与 chunks 接口（创建、更新、删除、列表、详情），数据保存在内存中"""
+
+    collections = {}
+    chunks = {}
+    store_lock = threading.Lock()
+
+    def _parts(self):
+        parsed = urlparse(self.path)
+        return [part for part in parsed.path.strip("/").split("/") if part != "v1"], parse_qs(parsed.query)
+
+    def do_POST(self):
+        body = self._read_json()
+        parts, _ = self._parts()
+        if not self._simulate():
+            return
+        with self.store_lock:
+            if parts == ["collections"]:
+                collection_id = uuid.uuid4().hex[:24]
+                collection = {"collection_id": collection_id, "name": body.get("name"),
+                              "capacity": body.get("capacity", 1000),
+                              "embedding_model_id": body.get("embedding_model_id"), "num_chunks": 0}
+                self.collections[collection_id] = collection
+                self.chunks[collection_id] = {}
+                return self._send_json(200, {"status": "success", "data": collection})
+            if len(parts) == 3 and parts[0] == "collections" and parts[2] == "chunks":
+                collection_id = parts[1]
+                collection = self.collections.setdefault(
+                    collection_id, {"collection_id": collection_id, "name": collection_id, "capacity": 10 ** 9,
+                                    "embedding_model_id": None, "num_chunks": 0}
+                )
+                store = self.chunks.setdefault(collection_id, {})
+                if len(store) >= collection["capacity"]:
+                    return self._send_json(400, {"error": {"message": "collection is full"}})
+                now = int(time.time() * 1000)
+                chunk = {"chunk_id": uuid.uuid4().hex[:24], "record_id": None, "collection_id": collection_id,
+                         "content": body.get("content"), "num_tokens": len(body.get("content") or ""),
+                         "metadata": {}, "updated_timestamp": now, "created_timestamp": now}
+                store[chunk["chunk_id"]] = chunk
+                collection["num_chunks"] = len(store)
+                return self._send_json(200, {"status": "success", "data": chunk})
+            if len(parts) == 4 and parts[0] == "collections" and parts[2] == "chunks":
+                chunk = self.chunks.get(parts[1], {}).get(parts[3])
+                if chunk is None:
+                    return self._send_json(404, {"error": {"message": "chunk not found"}})
+                chunk["content"] = body.get("content", chunk["content"])
+                chunk["updated_timestamp"] = int(time.time() * 1000)
+                return self._send_json(200, {"status": "success", "data": chunk})
+        self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_DELETE(self):
+        parts, _ = self._parts()
+        if not self._simulate():
+            return
+        with self.store_lock:
+            if len(parts) == 4 and parts[0] == "collections" and parts[2] == "chunks":
+                store = self.chunks.get(parts[1], {})
+                if store.pop(parts[3], None) is not None:
+                    self.collections[parts[1]]["num_chunks"] = len(store)
+                    return self._send_json(200, {"status": "success"})
+        self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_GET(self):
+        parts, query = self._parts()
+        if not self._simulate():
+            return
+        with self.store_lock:
+            if parts == ["collections"]:
+                return self._send_json(200, {"status": "success", "data": list(self.collections.values())})
+            if len(parts) == 2 and parts[0] == "collections" and parts[1] in self.collections:
+                return self._send_json(200, {"status": "success", "data": self.collections[parts[1]]})
+            if len(parts) == 3 and parts[0] == "collections" and parts[2] == "chunks":
+                items = list(self.chunks.get(parts[1], {}).values())
+                after = query.get("after", [None])[0]
+                if after:
+                    ids = [chunk["chunk_id"] for chunk in items]
+                    items = items[ids.index(after) + 1:] if after in ids else []
+                limit = int(query.get("limit", [20])[0])
+                return self._send_json(200, {"status": "success", "data": items[:limit],
+                                             "has_more": len(items) > limit})
+            if len(parts) == 4 and parts[0] == "collections" and parts[2] == "chunks":
+                chunk = self.chunks.get(parts[1], {}).get(parts[3])
+                if chunk is not None:
+                    return self._send_json(200, {"status": "success", "data": chunk})
+        self._send_json(404, {"error": {"message": "not found"}})
+
+
+def start_server(handler, behavior, port=0, host="127.0.0.1"):
+    """在后台线程中启动替身服务，返回 (server, base_url)"""
+    handler_class = type(handler.__name__, (handler,), {"behavior": behavior})
+    if handler is StubTaskingAIHandler:
+        handler_class.collections = {}
+        handler_class.chunks = {}
+    server = ThreadingHTTPServer((host, port), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/v1/"
+
+
+def serve_forever(llm_port, taskingai_port, llm_behavior, taskingai_behavior, ready=None):
+    """在当前进程中运行两个替身服务，ready 为 multiprocessing.Event 时启动完成后置位"""
+    start_server(StubLLMHandler, llm_behavior, llm_port)
+    start_server(StubTaskingAIHandler, taskingai_behavior, taskingai_port)
+    if ready is not None:
+        ready.set()
+    while True:
+        time.sleep(3600)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="运行本地大模型与 TaskingAI 替身服务")
+    parser.add_argument("--llm-port", type=int, default=18080)
+    parser.add_argument("--taskingai-port", type=int, default=18081)
+    parser.add_argument("--latency", type=float, default=0.2, help="大模型接口平均延迟（秒）")
+    parser.add_argument("--taskingai-latency", type=float, default=0.02, help="TaskingAI 接口平均延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的概率")
+    parser.add_argument("--rate-limit", type=int, help="每秒请求数上限，超过返回 429")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(f"大模型接口: http://127.0.0.1:{args.llm_port}/v1/")
+    print(f"TaskingAI 接口: http://127.0.0.1:{args.taskingai_port}/v1/")
+    serve_forever(
+        args.llm_port,
+        args.taskingai_port,
+        StubBehavior(args.latency, error_rate=args.error_rate, rate_limit=args.rate_limit, seed=1),
+        StubBehavior(args.taskingai_latency, error_rate=args.error_rate, rate_limit=args.rate_limit, seed=2),
+    )
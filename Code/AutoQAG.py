@@ -1,26 +1,38 @@
 import streamlit as st
 import requests
-import tempfile
 import os
 import json
 import math
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from openai import OpenAI
-from langchain.docstore.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import (
-    CSVLoader,
-    EverNoteLoader,
-    PyMuPDFLoader,
-    TextLoader,
-    UnstructuredEmailLoader,
-    UnstructuredEPubLoader,
-    UnstructuredHTMLLoader,
-    UnstructuredMarkdownLoader,
-    UnstructuredODTLoader,
-    UnstructuredPowerPointLoader,
-    UnstructuredWordDocumentLoader,
+from llm_pool import run_ordered
+from llm_router import LLMRouter
+from completion_cache import DEFAULT_CACHE_PATH, open_cache
+from ingest import ChunkIngestor, get_session, request_with_retry
+from export import EXPORT_FORMATS, QA_EXPORT_FIELDS, QA_EXPORT_TYPES, CollectionExporter, export_records, to_export_record
+from json_stream import JsonRecordStream, iter_batches, record_content
+from doc_parsing import (
+    CHUNK_OVERLAP, CHUNK_SIZE, parse_file, parse_file_with_metrics,
+)
+from prompts import QA_PROMPT
+from dedup import DEFAULT_INDEX_PATH, NearDuplicateIndex
+from pipeline import Pipeline, Stage
+from qa_filter import QAFilter
+from sharding import DEFAULT_MANIFEST_PATH, DEFAULT_SHARD_CAPACITY, ShardManifest
+from record_index import DEFAULT_INDEX_PATH as DEFAULT_RECORD_INDEX_PATH, RecordIndex, Upserter
+from metrics import REGISTRY as METRICS
+from doc_manifest import DEFAULT_MANIFEST_PATH as DEFAULT_DOCUMENT_MANIFEST_PATH, DocumentManifest
+from qa_store import DEFAULT_STORE_DIR as DEFAULT_QA_STORE_DIR, QASessionStore
+import qa_workflow
+from qa_workflow import (
+    DEFAULT_LLM_MODEL, CollectionClient, build_qa_content, ingest_pages, insert_qa_pairs, open_sharded_collection,
+    parse_documents, parse_qa_response,
+)
+from jobs import (
+    CANCELLED, DEFAULT_JOB_DB_PATH, DEFAULT_JOB_DIR, FAILED, FINISHED_STATES, QUEUED, RUNNING, SUCCEEDED, get_scheduler,
 )
-from typing import List
 
 # 配置（请在使用时替换为实际的URL和API密钥）
 base_url = 'YOUR_BASE_URL_HERE'
@@ -33,93 +45,258 @@ client = OpenAI(
     base_url="YOUR_OPENAI_BASE_URL_HERE",
 )
 
-# Document loaders mapping
-LOADER_MAPPING = {
-    ".csv": (CSVLoader, {}),
-    ".doc": (UnstructuredWordDocumentLoader, {}),
-    ".docx": (UnstructuredWordDocumentLoader, {}),
-    ".enex": (EverNoteLoader, {}),
-    ".eml": (UnstructuredEmailLoader, {}),
-    ".epub": (UnstructuredEPubLoader, {}),
-    ".html": (UnstructuredHTMLLoader, {}),
-    ".md": (UnstructuredMarkdownLoader, {}),
-    ".odt": (UnstructuredODTLoader, {}),
-    ".pdf": (PyMuPDFLoader, {}),
-    ".ppt": (UnstructuredPowerPointLoader, {}),
-    ".pptx": (UnstructuredPowerPointLoader, {}),
-    ".txt": (TextLoader, {"encoding": "utf8"}),
+def configure(taskingai_base_url=None, taskingai_api_key=None, llm_base_url=None, llm_api_key=None, llm_endpoints=None):
+    """在运行时覆盖 TaskingAI 和大模型的连接配置（供命令行等非界面入口使用）"""
+    global base_url, api_key, headers, client, LLM_ENDPOINTS
+    if llm_endpoints:
+        LLM_ENDPOINTS = list(llm_endpoints)
+    if taskingai_base_url:
+        base_url = taskingai_base_url
+    if taskingai_api_key:
+        api_key = taskingai_api_key
+        headers = {"Authorization": f"Bearer {api_key}"}
+    if llm_base_url or llm_api_key:
+        client = OpenAI(
+            api_key=llm_api_key or client.api_key,
+            base_url=llm_base_url or client.base_url,
+        )
+
+# 并发生成配置：同时进行的请求数，以及每个端点每分钟的请求数/Token数上限（None 表示不限制）
+LLM_MAX_WORKERS = 8
+LLM_REQUESTS_PER_MINUTE = None
+LLM_TOKENS_PER_MINUTE = None
+
+# 多端点配置：多个 OpenAI 兼容推理服务，按权重、并发上限和观测延迟分配请求，失败时自动换端点重试。
+# 每项形如 {"base_url": ..., "api_key": ..., "weight": 1, "max_concurrency": 8}；为空时只使用上面的 client。
+LLM_ENDPOINTS = []
+# 端点连续失败多少次后熔断，熔断多少秒后再试探
+LLM_FAILURE_THRESHOLD = 3
+LLM_CIRCUIT_COOLDOWN = 30
+
+# 生成缓存配置：版本号取自 prompts.py 中的模板，修改模板时请同步更新其版本号，使旧缓存失效
+LLM_MODEL = DEFAULT_LLM_MODEL
+PROMPT_TEMPLATE_VERSION = QA_PROMPT.version
+COMPLETION_CACHE_PATH = DEFAULT_CACHE_PATH
+COMPLETION_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# 导入配置：并行写入 chunk 的线程数（同时也是连接池大小）
+INGEST_MAX_WORKERS = 8
+
+# 分片配置：新建 Collection 使用的 Embedding 模型ID（请替换为实际的模型ID），
+# 自动分片时新分片的默认容量（未能获取原 Collection 容量时使用），以及记录所在分片的本地清单路径
+EMBEDDING_MODEL_ID = 'YOUR_EMBEDDING_MODEL_ID_HERE'
+SHARD_CAPACITY = DEFAULT_SHARD_CAPACITY
+SHARD_MANIFEST_PATH = DEFAULT_MANIFEST_PATH
+
+# 幂等写入配置：记录内容哈希与远端 chunk_id 对应关系的本地索引路径
+RECORD_INDEX_PATH = DEFAULT_RECORD_INDEX_PATH
+
+# JSON 导入配置：流式读取时每批写入的记录数
+IMPORT_BATCH_SIZE = 500
+
+# 文件解析配置：并行解析文件的进程数（None 表示使用全部CPU核心）
+PARSE_MAX_WORKERS = None
+
+# Token 预算分割配置：每次请求的输入Token上限（含提示词模板）及相邻文本块的重叠Token数
+LLM_PROMPT_TOKEN_BUDGET = 2048
+CHUNK_OVERLAP_TOKENS = 0
+
+# 批量提示配置：合并到一次请求中的文本块总Token数上限
+BATCH_PROMPT_TOKEN_BUDGET = 6000
+
+# QA对过滤配置：答案与原文字符二元组重合度下限，以及问题相似度达到多少视为重复
+QA_FILTER_MIN_OVERLAP = 0.2
+QA_FILTER_DUPLICATE_THRESHOLD = 0.9
+
+# 流水线模式配置：阶段之间队列的容量（上游生成过快时在此处等待下游插入）
+PIPELINE_QUEUE_SIZE = 32
+
+# QA对会话存储配置：生成结果保存在磁盘上，插入时每页读取的条数，以及预览每页显示的条数
+QA_STORE_DIR = DEFAULT_QA_STORE_DIR
+QA_STORE_PAGE_SIZE = 200
+QA_PREVIEW_PAGE_SIZE = 5
+
+# 增量模式配置：按文件名记录每个文档各文本块的哈希及生成的 chunk，再次上传时只处理变化的部分
+DOCUMENT_MANIFEST_PATH = DEFAULT_DOCUMENT_MANIFEST_PATH
+
+# 去重配置：相似度（MinHash 估计的 Jaccard 相似度）不低于阈值的文本块视为近重复，不再调用大模型
+DEDUP_THRESHOLD = 0.85
+DEDUP_INDEX_PATH = DEFAULT_INDEX_PATH
+
+# 导出配置：导出文件（JSONL、JSONL.GZ、Parquet 及其分片）的保存目录
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "exports")
+# 下载Collection的格式选项 -> export 模块的格式名，None 为一次性生成的 JSON
+EXPORT_FORMAT_OPTIONS = {
+    "JSONL（流式写入磁盘，适合大集合）": "jsonl",
+    "JSONL.GZ（gzip 压缩）": "jsonl.gz",
+    "Parquet（需要 pyarrow）": "parquet",
+    "JSON": None,
 }
 
-def get_completion(prompt, model="qwen25-72b"):
+# 后台任务配置：同时运行的任务总数，各类任务同时运行数上限，以及任务运行时长上限的默认值（分钟，0 表示不限制）
+JOB_DB_PATH = DEFAULT_JOB_DB_PATH
+JOB_DIR = DEFAULT_JOB_DIR
+JOB_MAX_CONCURRENT = 4
+JOB_KIND_LIMITS = {"parse": 2, "generate": 2, "insert": 2, "export": 2, "import": 2}
+JOB_DEFAULT_TIMEOUT_MINUTES = 0
+
+_llm_router = None
+_llm_router_config = None
+
+def get_llm_router():
+    """按当前配置获取共享的端点路由，配置变化时重新创建"""
+    global _llm_router, _llm_router_config
+    endpoints = LLM_ENDPOINTS or [{"base_url": str(client.base_url), "api_key": client.api_key}]
+    endpoints = [
+        {"requests_per_minute": LLM_REQUESTS_PER_MINUTE, "tokens_per_minute": LLM_TOKENS_PER_MINUTE, **endpoint}
+        for endpoint in endpoints
+    ]
+    config = (endpoints, LLM_FAILURE_THRESHOLD, LLM_CIRCUIT_COOLDOWN)
+    if _llm_router is None or _llm_router_config != config:
+        _llm_router = LLMRouter.from_config(
+            endpoints, failure_threshold=LLM_FAILURE_THRESHOLD, cooldown=LLM_CIRCUIT_COOLDOWN
+        )
+        _llm_router_config = config
+    return _llm_router
+
+def request_completion(prompt, model=LLM_MODEL):
+    """获取模型的响应，出错时抛出异常（可在工作线程中调用）"""
+    return qa_workflow.request_completion(get_llm_router(), prompt, model=model)
+
+def get_completion(prompt, model=LLM_MODEL):
     """获取模型的响应"""
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
-        )
-        return response.choices[0].message.content
+        return request_completion(prompt, model=model)
     except Exception as e:
         st.error(f"调用API时发生错误: {e}")
         return None
 
 
-def generate_qa_pairs_with_progress(text_chunks):
-    """生成问答对并显示进度"""
-    qa_pairs = []
+def build_qa_prompt(chunk_text):
+    """构造生成问答对的提示词"""
+    return QA_PROMPT.render(chunk_text=chunk_text)
+
+def prompt_overhead_tokens():
+    """提示词模板本身（不含文本块）的Token数"""
+    return QA_PROMPT.overhead_tokens
+
+def estimate_generation_cost(text_chunks, batch_size=1):
+    """预估生成阶段的大模型调用次数和输入Token数，batch_size 大于 1 时按批量提示分组计算"""
+    return qa_workflow.estimate_generation_cost(text_chunks, batch_size, BATCH_PROMPT_TOKEN_BUDGET)
+
+def chunk_token_budget(prompt_budget=None):
+    """扣除提示词模板后，每个文本块可用的Token数"""
+    return qa_workflow.chunk_token_budget(prompt_budget or LLM_PROMPT_TOKEN_BUDGET)
+
+def get_completion_cache():
+    """获取生成缓存"""
+    return open_cache(COMPLETION_CACHE_PATH, COMPLETION_CACHE_MAX_BYTES)
+
+def complete_chunk(chunk_text, model=LLM_MODEL, use_cache=True, on_text=None, cancel_event=None):
+    """为单个文本块生成响应，优先读取缓存（可在工作线程中调用）
+
+    传入 on_text 时以流式方式请求，参数含义同 qa_workflow.stream_completion。
+    """
+    return qa_workflow.complete_chunk(get_llm_router(), chunk_text, model=model,
+                                      cache=get_completion_cache() if use_cache else None, on_text=on_text,
+                                      cancel_event=cancel_event)
+
+def complete_batch(chunk_texts, model=LLM_MODEL, use_cache=True):
+    """在一次请求中为多个文本块生成响应（可在工作线程中调用），返回与输入对应的 [(响应, 错误)]"""
+    return qa_workflow.complete_batch(get_llm_router(), chunk_texts, model=model,
+                                      cache=get_completion_cache() if use_cache else None)
+
+def render_live_qa_pairs(container, live_parsers):
+    """在 container 中实时展示正在流式生成的问答对"""
+    with container.container():
+        for i, parser in sorted(live_parsers.items()):
+            st.markdown(f"**文本段 {i + 1}（生成中）**")
+            for qa_pair in parser.snapshot():
+                st.markdown(f"Q: {qa_pair['question']}")
+                st.markdown(f"A: {qa_pair['answer']}")
+
+def show_endpoint_stats():
+    """显示各大模型端点的请求数、失败数、平均延迟和熔断状态"""
+    stats = get_llm_router().stats()
+    if len(stats) <= 1:
+        return
+    state_labels = {"closed": "正常", "open": "熔断中", "half-open": "待试探"}
+    with st.expander("大模型端点状态"):
+        for stat in stats:
+            latency = f"{stat['latency']:.2f}s" if stat["latency"] is not None else "-"
+            st.text(f"{stat['name']} | {state_labels[stat['state']]} | 请求: {stat['requests']} | "
+                    f"失败: {stat['failures']} | 平均延迟: {latency}")
+
+def show_run_metrics():
+    """在侧边栏显示各阶段的耗时分布与计数，并提供 Prometheus 文本和 JSON 运行报告下载"""
+    report = METRICS.report()
+    with st.sidebar.expander("运行指标"):
+        if not report["histograms"] and not report["counters"]:
+            st.caption("暂无数据，处理文件或操作知识库后显示。")
+            return
+        if report["histograms"]:
+            st.table([
+                {
+                    "指标": item["name"].replace("autoqag_", "").replace("_seconds", ""),
+                    "标签": ", ".join(f"{k}={v}" for k, v in item["labels"].items()),
+                    "次数": item["count"],
+                    "平均(s)": f"{item['mean']:.3f}",
+                    "p50(s)": f"{item['p50']:.3f}",
+                    "p95(s)": f"{item['p95']:.3f}",
+                    "p99(s)": f"{item['p99']:.3f}",
+                }
+                for item in report["histograms"]
+            ])
+        if report["counters"]:
+            st.table([
+                {
+                    "计数器": item["name"].replace("autoqag_", ""),
+                    "标签": ", ".join(f"{k}={v}" for k, v in item["labels"].items()),
+                    "值": item["value"],
+                }
+                for item in report["counters"]
+            ])
+        st.download_button("下载 Prometheus 指标", METRICS.to_prometheus(), file_name="autoqag_metrics.prom",
+                           mime="text/plain")
+        st.download_button("下载 JSON 运行报告", METRICS.to_json(), file_name="autoqag_run_report.json",
+                           mime="application/json")
+        if st.button("清空运行指标"):
+            METRICS.reset()
+            st.rerun()
+
+def generate_qa_pairs_with_progress(text_chunks, max_workers=None, use_cache=True, on_chunk_done=None, batch_size=1,
+                                    stream=False, store=None):
+    """并发生成问答对并显示进度，结果保持输入顺序，参数含义同 qa_workflow.generate_qa_pairs
+
+    stream 为 True 时实时展示解析出的问答对；脚本被中断（如点击停止）时取消所有进行中的请求。
+    """
     progress_bar = st.progress(0)
-    for i, chunk in enumerate(text_chunks):
-        prompt = f"""基于以下给定的文本，生成一组高质量的问答对。请遵循以下指南：
-        
-                1. 问题部分：
-                - 为同一个主题创建尽可能多的（如K个）不同表述的问题，确保问题的多样性。
-                - 每个问题应考虑用户可能的多种问法，例如：
-                - 直接询问（如“什么是...？”）
-                - 请求确认（如“是否可以说...？”）
-                - 寻求解释（如“请解释一下...的含义。”）
-                - 假设性问题（如“如果...会怎样？”）
-                - 例子请求（如“能否举个例子说明...？”）
-                - 问题应涵盖文本中的关键信息、主要概念和细节，确保不遗漏重要内容。
-
-                2. 答案部分：
-                - 提供一个全面、信息丰富的答案，涵盖问题的所有可能角度，确保逻辑连贯。
-                - 答案应直接基于给定文本，确保准确性和一致性。
-                - 包含相关的细节，如日期、名称、职位等具体信息，必要时提供背景信息以增强理解。
-
-                3. 格式：
-                - 使用 "Q:" 标记问题集合的开始，所有问题应在一个段落内，问题之间用空格分隔。
-                - 使用 "A:" 标记答案的开始，答案应清晰分段，便于阅读。
-                - 问答对之间用两个空行分隔，以提高可读性。
-
-                4. 内容要求：
-                - 确保问答对紧密围绕文本主题，避免偏离主题。
-                - 避免添加文本中未提及的信息，确保信息的真实性。
-                - 如果文本信息不足以回答某个方面，可以在答案中说明 "根据给定信息无法确定"，并尽量提供相关的上下文。
-
-                5. 示例结构（仅供参考，实际内容应基于给定文本）：
-                
-            给定文本：
-            {chunk}
-
-            请基于这个文本生成问答对。
-            """
-        response = get_completion(prompt)
-        if response:
-            try:
-                parts = response.split("A:", 1)
-                if len(parts) == 2:
-                    question = parts[0].replace("Q:", "").strip()
-                    answer = parts[1].strip()
-                    qa_pairs.append({"question": question, "answer": answer})
-                else:
-                    st.warning(f"无法解析响应: {response}")
-            except Exception as e:
-                st.warning(f"处理响应时出错: {str(e)}")
-        
-        progress = (i + 1) / len(text_chunks)
-        progress_bar.progress(progress)
-    
-    return qa_pairs
+    cache = get_completion_cache() if use_cache else None
+    if cache is not None:
+        cache_stats = cache.stats()
+    live_box = st.empty() if stream else None
+
+    def on_done(i, qa_pairs, error):
+        if isinstance(error, ValueError):
+            st.warning(str(error))
+        elif error is not None:
+            st.error(f"调用API时发生错误: {error}")
+        if on_chunk_done is not None:
+            on_chunk_done(i, qa_pairs, error)
+
+    result = qa_workflow.generate_qa_pairs(
+        get_llm_router(), text_chunks, model=LLM_MODEL, cache=cache, max_workers=max_workers or LLM_MAX_WORKERS,
+        batch_size=batch_size, batch_max_tokens=BATCH_PROMPT_TOKEN_BUDGET, stream=stream, store=store,
+        on_chunk_done=on_done, on_progress=lambda completed, total: progress_bar.progress(completed / total),
+        on_tick=(lambda live_parsers: render_live_qa_pairs(live_box, live_parsers)) if stream else None,
+        cancel_event=threading.Event(),
+    )
+    if live_box is not None:
+        live_box.empty()
+    if cache is not None:
+        stats = cache.stats()
+        st.caption(f"缓存命中: {stats['hits'] - cache_stats['hits']} | 未命中: {stats['misses'] - cache_stats['misses']}")
+    return result
 
 def api_request(method, url, **kwargs):
     """通用API请求处理函数"""
@@ -140,6 +317,45 @@ def create_collection(name, embedding_model_id, capacity):
     }
     return api_request("POST", f"{base_url}collections", json=data)
 
+def get_collection_client():
+    """按当前配置创建 Collection 接口客户端，请求失败时抛出异常（可在工作线程中调用）"""
+    return CollectionClient(base_url, headers)
+
+def get_sharded_collection(collection_id):
+    """以 collection_id 所在的分片组创建 ShardedCollection，写满后自动创建新的分片 Collection（可在工作线程中调用）"""
+    return open_sharded_collection(get_collection_client(), ShardManifest(SHARD_MANIFEST_PATH), collection_id,
+                                   capacity=SHARD_CAPACITY, embedding_model_id=EMBEDDING_MODEL_ID)
+
+def show_shard_usage(sharded):
+    """显示分片组中各 Collection 的已用容量，有新分片时刷新 Collection 列表"""
+    shards = sharded.manifest.shards(sharded.group)
+    if len(shards) > 1:
+        st.info("分片使用情况：" + "，".join(
+            f"{shard['collection_id']} {shard['used']}/{shard['capacity']}" for shard in shards
+        ))
+        st.session_state.collections = api_request("GET", f"{base_url}collections")
+
+def record_scope(collection_id):
+    """记录索引和文档清单的范围：Collection 所在的分片组，不在分片组中时为 collection_id"""
+    return qa_workflow.record_scope(ShardManifest(SHARD_MANIFEST_PATH), collection_id)
+
+def get_upserter(collection_id, ingestor, sharded=None):
+    """创建按本地记录索引幂等写入的 Upserter"""
+    return Upserter(RecordIndex(RECORD_INDEX_PATH), ingestor, collection_id, sharded=sharded,
+                    scope=record_scope(collection_id))
+
+def rebuild_record_index(collection_id):
+    """从 Collection（及其所在分片组的全部分片）中已有的 chunk 重建本地记录索引，返回登记的记录数"""
+    manifest = ShardManifest(SHARD_MANIFEST_PATH)
+    group = manifest.group_of(collection_id)
+    collection_ids = [shard["collection_id"] for shard in manifest.shards(group)] if group else [collection_id]
+    chunks = []
+    for shard_id in collection_ids:
+        for chunk in fetch_all_chunks_from_collection(shard_id):
+            chunk.setdefault("collection_id", shard_id)
+            chunks.append(chunk)
+    return RecordIndex(RECORD_INDEX_PATH).rebuild(group or collection_id, chunks)
+
 def create_chunk(collection_id, content):
     """创建chunk"""
     data = {
@@ -148,164 +364,447 @@ def create_chunk(collection_id, content):
     }
     endpoint = f"{base_url}collections/{collection_id}/chunks"  # 确保使用正确的端点
     try:
-        response = requests.post(endpoint, headers=headers, json=data)
-        response.raise_for_status()
+        with METRICS.timer("autoqag_chunk_write_seconds", op="create"):
+            response, _ = request_with_retry(get_session(INGEST_MAX_WORKERS), "POST", endpoint, headers=headers, json=data)
         return response.json()['data']
     except requests.RequestException as e:
         st.error(f"创建chunk失败: {e}")
         return None
 
-def load_single_document(file_path: str) -> List[Document]:
-    """加载单个文档"""
-    ext = "." + file_path.rsplit(".", 1)[-1]
-    if ext in LOADER_MAPPING:
-        loader_class, loader_args = LOADER_MAPPING[ext]
-        loader = loader_class(file_path, **loader_args)
-        return loader.load()
-    raise ValueError(f"Unsupported file extension '{ext}'")
-
 def process_file(uploaded_file):
     """处理上传的文件并生成文本块"""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-        tmp_file.write(uploaded_file.getvalue())
-        tmp_file_path = tmp_file.name
-    try:
-        documents = load_single_document(tmp_file_path)
-        if not documents:
-            st.error("文件处理失败，请检查文件格式是否正确。")
-            return []
-
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=500)
-        text_chunks = text_splitter.split_documents(documents)
-        return text_chunks
-    except Exception as e:
-        st.error(f"处理文件时发生错误: {e}")
+    text_chunks, error = parse_file(uploaded_file.name, uploaded_file.getvalue())
+    if error:
+        st.error(f"处理文件时发生错误: {error}")
         return []
-    finally:
-        os.unlink(tmp_file_path)
-
-def process_files(uploaded_files):
-    """处理上传的多个文件并生成文本块"""
-    all_text_chunks = []
-    for uploaded_file in uploaded_files:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            tmp_file_path = tmp_file.name
-        try:
-            documents = load_single_document(tmp_file_path)
-            if not documents:
-                st.error(f"文件 {uploaded_file.name} 处理失败，请检查文件格式是否正确。")
-                continue
+    if text_chunks is None:
+        st.error("文件处理失败，请检查文件格式是否正确。")
+        return []
+    return text_chunks
+
+def process_files(uploaded_files, max_workers=None, chunking=None):
+    """多进程并行处理上传的多个文件并生成文本块，文本块保持文件上传顺序
+
+    chunking 为 (分割方式, 块大小, 重叠)，分割方式 "chars" 按字符、"tokens" 按Token，默认按字符分割。
+    """
+    progress_bar = st.progress(0)
+    completed = 0
+
+    def on_done(i):
+        nonlocal completed
+        completed += 1
+        progress_bar.progress(completed / len(uploaded_files))
+
+    text_chunks, errors = parse_documents(
+        [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files],
+        max_workers=max_workers or PARSE_MAX_WORKERS,
+        chunking=chunking,
+        on_done=on_done,
+    )
+    for error in errors:
+        st.error(error)
+    return text_chunks
+
+def deduplicate_chunks(text_chunks, threshold=None, use_history=True):
+    """过滤近重复的文本块，返回 (保留的文本块, 去重统计)"""
+    index = NearDuplicateIndex(DEDUP_INDEX_PATH, threshold=threshold or DEDUP_THRESHOLD)
+    return qa_workflow.deduplicate_chunks(text_chunks, index, use_history=use_history)
+
+def new_qa_store(source=None):
+    """为当前会话创建新的QA对存储（给出 source 时复制其内容），替换并删除上一次的存储
+
+    会话只删除自己创建的存储；后台任务读写的是任务目录中自己的副本，不受影响。
+    """
+    old_path = st.session_state.get("qa_store_path")
+    if old_path:
+        QASessionStore.remove(old_path)
+    store = QASessionStore.create(QA_STORE_DIR, source=source)
+    st.session_state.qa_store_path = store.path
+    return store
+
+def get_qa_store():
+    """返回当前会话的QA对存储，尚未生成时返回 None"""
+    path = st.session_state.get("qa_store_path")
+    if path and os.path.exists(path):
+        return QASessionStore(path)
+    return None
+
+def show_qa_preview(store):
+    """分页预览存储中的QA对，每页 QA_PREVIEW_PAGE_SIZE 条"""
+    total = store.count()
+    if not total:
+        return
+    pages = math.ceil(total / QA_PREVIEW_PAGE_SIZE)
+    st.subheader(f"QA对预览（共 {total} 个）")
+    page = st.number_input("页码", min_value=1, max_value=pages, value=1, help=f"共 {pages} 页")
+    offset = (page - 1) * QA_PREVIEW_PAGE_SIZE
+    for k, (_, qa) in enumerate(store.page(offset, QA_PREVIEW_PAGE_SIZE)):
+        with st.expander(f"**QA对 {offset + k + 1}**", expanded=True):
+            st.markdown("**问题:**")
+            st.markdown(qa['question'])
+            st.markdown("**答案:**")
+            st.markdown(qa['answer'])
+            st.markdown("**原文:**")
+            st.markdown(qa['chunk'])
+        st.markdown("---")
+
+def remember_generated_chunks(chunk_texts, threshold=None):
+    """记录已成功生成QA对的文本块指纹，后续运行可跳过与之近重复的文本块"""
+    index = NearDuplicateIndex(DEDUP_INDEX_PATH, threshold=threshold or DEDUP_THRESHOLD)
+    index.remember(chunk_texts)
+
+def prepare_text_chunks(uploaded_files, chunking=None, dedup_options=None):
+    """解析、分割并去重上传的文件，返回待生成的文本块
 
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=500)
-            text_chunks = text_splitter.split_documents(documents)
-            all_text_chunks.extend(text_chunks)
-        except Exception as e:
-            st.error(f"处理文件 {uploaded_file.name} 时发生错误: {e}")
-        finally:
-            os.unlink(tmp_file_path)
-    
-    return all_text_chunks
-
-def insert_qa_pairs_to_database(collection_id):
-    """将问答对插入到数据库"""
+    chunking 为 (分割方式, 块大小, 重叠)，dedup_options 为 (相似度阈值, 是否与历史运行去重)，None 表示不去重。
+    """
+    text_chunks = process_files(uploaded_files, chunking=chunking)
+    if not text_chunks:
+        st.error("文件处理失败，请检查文件格式是否正确。")
+        return []
+    st.info(f"文件已分割成 {len(text_chunks)} 个文本段")
+    if dedup_options:
+        text_chunks, dedup_report = deduplicate_chunks(text_chunks, *dedup_options)
+        st.info(
+            f"跳过近重复文本段 {dedup_report.saved_calls} 个（本次上传内 {dedup_report.duplicates_in_run} 个，"
+            f"与以往运行重复 {dedup_report.duplicates_of_history} 个），节省 {dedup_report.saved_calls} 次大模型调用"
+        )
+        if not text_chunks:
+            st.warning("所有文本段均已处理过，无需重新生成。")
+    return text_chunks
+
+def delete_removed_chunks(ingestor, manifest, scope, removed, sharded=None):
+    """删除文档新版本中已不存在的文本块对应的远端 chunk，并同步清单、记录索引和分片容量，返回 (删除数, 失败数)"""
+    shared = manifest.shared_chunk_ids(scope, removed)
+    targets = [(collection_id, chunk_id) for _, collection_id, chunk_id in removed if chunk_id and chunk_id not in shared]
+
+    def delete(target):
+        ingestor.delete_chunk(*target)
+        return target
+
+    deleted = [target for target in run_ordered(delete, targets, max_workers=ingestor.max_workers) if target]
+    deleted_ids = {chunk_id for _, chunk_id in deleted}
+    failed = {target for target in targets if target[1] not in deleted_ids}
+    # 删除失败的行保留在清单中，下次导入时重试
+    manifest.remove([row_id for row_id, collection_id, chunk_id in removed if (collection_id, chunk_id) not in failed])
+    RecordIndex(RECORD_INDEX_PATH).remove_chunks(scope, deleted_ids)
+    if sharded is not None:
+        sharded.release([collection_id for collection_id, _ in deleted if collection_id in sharded.collection_ids])
+    return len(deleted), len(failed)
+
+def run_generate_and_insert_pipeline(uploaded_files, collection_id, chunking=None, dedup_options=None, max_workers=None,
+                                     ingest_workers=None, use_cache=True, auto_shard=False, idempotent=True,
+                                     incremental=False, store=None, batch_size=1, qa_filter_options=None):
+    """流水线模式：解析、生成和插入三个阶段同时运行，QA对生成后立即写入 Collection
+
+    阶段之间通过容量为 PIPELINE_QUEUE_SIZE 的有界队列连接。去重只在单个文件内及与以往运行之间进行。
+    batch_size 大于 1 时同一文件中相邻的文本块合并为一次请求；传入 qa_filter_options（最低重合度, 问题相似度阈值）时
+    每个文本块生成的QA对在插入前过滤，由于QA对生成后立即插入，重复问题只在同一文本块内检测。
+    auto_shard 为 True 时 Collection 写满后自动创建分片继续写入；idempotent 为 True 时不重复写入已写入过的QA对。
+    incremental 为 True 时按文件名与上次导入的文档清单比较，只生成和写入新增或变化的文本块，
+    并删除已移除的文本块对应的 chunk。返回 (生成的QA对列表, 插入成功数, 插入失败数)；
+    传入 store（QASessionStore）时生成的QA对写入 store，返回值的第一项为 store。
+    """
+    mode, chunk_size, chunk_overlap = chunking or ("chars", CHUNK_SIZE, CHUNK_OVERLAP)
+    dedup_index = None
+    if dedup_options:
+        dedup_index = NearDuplicateIndex(DEDUP_INDEX_PATH, threshold=dedup_options[0] or DEDUP_THRESHOLD)
+    ingestor = ChunkIngestor(base_url, headers, max_workers=ingest_workers or INGEST_MAX_WORKERS)
+    try:
+        sharded = get_sharded_collection(collection_id) if auto_shard else None
+    except requests.RequestException as e:
+        st.error(f"获取 Collection 信息失败: {e}")
+        return [] if store is None else store, 0, 0
+    upserter = get_upserter(collection_id, ingestor, sharded) if idempotent else None
+    manifest = DocumentManifest(DOCUMENT_MANIFEST_PATH) if incremental else None
+    scope = record_scope(collection_id)
+    diffs = []
+    parse_workers = min(PARSE_MAX_WORKERS or os.cpu_count() or 1, len(uploaded_files))
+    qa_filter = QAFilter(*qa_filter_options) if qa_filter_options else None
+    counts = {"files": 0, "chunks": 0, "skipped": 0, "unchanged": 0, "generated": 0, "filtered": 0, "success": 0,
+              "fail": 0}
+    counts_lock = threading.Lock()
+    # 生成阶段按批处理文本块，单个文本块的失败记录在这里，由 on_event 在调用线程中显示
+    generate_errors = []
+    cancel_event = threading.Event()
+    qa_pairs = []
     progress_bar = st.progress(0)
     status_text = st.empty()
-    success_count = 0
-    fail_count = 0
-    for i, qa_pair in enumerate(st.session_state.qa_pairs):
-        try:
-            if "question" in qa_pair and "answer" in qa_pair and "chunk" in qa_pair:
-                content = f"问题：{qa_pair['question']}\n答案：{qa_pair['answer']}\n原文：{qa_pair['chunk']}"
-                # 如果content的字数超过4000，截取前4000字
-                if len(content) > 4000:
-                    content = content[:4000]  # 只保留前4000字
-                if create_chunk(collection_id=collection_id, content=content):
-                    success_count += 1
-                else:
-                    fail_count += 1
-                    st.warning(f"插入QA对 {i+1} 失败")
+
+    def parse(item):
+        name, data = item
+        (text_chunks, error), snapshot = executor.submit(
+            parse_file_with_metrics, name, data, chunk_size, chunk_overlap, mode
+        ).result()
+        METRICS.merge(snapshot)
+        if error:
+            raise RuntimeError(f"处理文件 {name} 时发生错误: {error}")
+        if text_chunks is None:
+            raise RuntimeError(f"文件 {name} 处理失败，请检查文件格式是否正确。")
+        if manifest is not None:
+            diff = manifest.diff(scope, name, [chunk.page_content for chunk in text_chunks])
+            for i in diff.added:
+                text_chunks[i].metadata["chunk_hash"] = diff.hashes[i]
+            with counts_lock:
+                diffs.append(diff)
+                counts["unchanged"] += len(diff.unchanged)
+            text_chunks = [text_chunks[i] for i in diff.added]
+        if dedup_index is not None:
+            kept, report = dedup_index.filter([chunk.page_content for chunk in text_chunks], use_history=dedup_options[1])
+            with counts_lock:
+                counts["skipped"] += report.saved_calls
+            text_chunks = [text_chunks[i] for i in kept]
+        groups = qa_workflow.group_chunks_for_batching(
+            [chunk.page_content for chunk in text_chunks], batch_size, BATCH_PROMPT_TOKEN_BUDGET
+        )
+        return [[text_chunks[i] for i in group] for group in groups]
+
+    def generate(batch):
+        if len(batch) == 1:
+            try:
+                results = [(complete_chunk(batch[0].page_content, use_cache=use_cache, cancel_event=cancel_event), None)]
+            except Exception as e:
+                results = [(None, e)]
+        else:
+            results = complete_batch([chunk.page_content for chunk in batch], use_cache=use_cache)
+        outputs = []
+        for chunk, (response, error) in zip(batch, results):
+            qa_pairs = parse_qa_response(response, chunk.page_content) if error is None else []
+            if not qa_pairs:
+                with counts_lock:
+                    generate_errors.append(error or ValueError(f"无法解析响应: {response}"))
+                continue
+            if qa_filter is not None:
+                kept, report = qa_filter.filter(qa_pairs)
+                with counts_lock:
+                    counts["filtered"] += len(report.dropped)
+                qa_pairs = kept
+            outputs.extend((chunk, qa_pair) for qa_pair in qa_pairs)
+        return outputs
+
+    def insert(item):
+        _, qa_pair = item
+        content = build_qa_content(qa_pair)
+        if content is None:
+            raise ValueError("QA对格式无效")
+        if upserter is not None:
+            return [upserter.upsert_one(content)[0]]
+        if sharded is not None:
+            return [sharded.create_chunk(ingestor, content)]
+        chunk, _ = ingestor.create_chunk(collection_id, content)
+        return [chunk]
+
+    def on_event(stage, item, outputs, error):
+        if error is not None:
+            st.warning(str(error))
+        if stage == "parse":
+            counts["files"] += 1
+            counts["chunks"] += sum(len(batch) for batch in outputs)
+        elif stage == "generate":
+            with counts_lock:
+                errors, generate_errors[:] = list(generate_errors), []
+            for e in errors:
+                st.warning(str(e))
+            # 整批出错时（如被取消）其中每个文本块都计为失败
+            counts["fail"] += len(errors) + (len(item) if error is not None else 0)
+            counts["generated"] += len(outputs)
+            if store is not None:
+                store.add_many((counts["generated"] - len(outputs) + k, qa_pair, chunk.metadata)
+                               for k, (chunk, qa_pair) in enumerate(outputs))
             else:
-                fail_count += 1
-                st.warning(f"QA对 {i+1} 格式无效")
-        except Exception as e:
-            st.error(f"插入QA对 {i+1} 时发生错误: {str(e)}")
-            fail_count += 1
-        
-        progress = (i + 1) / len(st.session_state.qa_pairs)
-        progress_bar.progress(progress)
-        status_text.text(f"进度: {progress:.2%} | 成功: {success_count} | 失败: {fail_count}")
+                qa_pairs.extend(qa_pair for _, qa_pair in outputs)
+        elif stage == "insert":
+            counts["success" if error is None else "fail"] += 1
+            if manifest is not None and error is None:
+                chunk = item[0]
+                for remote in outputs:
+                    # 没有 chunk_id 的记录不写入清单，否则无法判断远端 chunk 是否被其他文本块共用
+                    if remote.get("chunk_id"):
+                        manifest.add(scope, chunk.metadata["source"], chunk.metadata["chunk_hash"],
+                                     remote.get("collection_id", collection_id), remote["chunk_id"])
+        if counts["chunks"]:
+            progress_bar.progress(min(1.0, (counts["success"] + counts["fail"]) / counts["chunks"]))
+        status_text.text(
+            f"已解析文件: {counts['files']}/{len(uploaded_files)} | 文本段: {counts['chunks']} | "
+            f"已生成: {counts['generated']} | 已插入: {counts['success']} | 失败: {counts['fail']}"
+        )
 
-    return success_count, fail_count
+    pipeline = Pipeline(
+        [
+            Stage("parse", parse, workers=parse_workers),
+            Stage("generate", generate, workers=max_workers or LLM_MAX_WORKERS),
+            Stage("insert", insert, workers=ingest_workers or INGEST_MAX_WORKERS),
+        ],
+        queue_size=PIPELINE_QUEUE_SIZE,
+    )
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, parse_workers)) as executor:
+        pipeline.run(
+            ((uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files),
+            on_event=on_event, cancel_event=cancel_event,
+        )
+    if counts["skipped"]:
+        st.info(f"跳过近重复文本段 {counts['skipped']} 个，节省 {counts['skipped']} 次大模型调用")
+    if qa_filter is not None:
+        st.info(f"插入前过滤掉过短、与原文无关或问题重复的QA对 {counts['filtered']} 个")
+    if manifest is not None:
+        removed = [row for diff in diffs for row in diff.removed]
+        deleted, delete_failed = delete_removed_chunks(ingestor, manifest, scope, removed, sharded) if removed else (0, 0)
+        st.info(f"增量模式：未变化文本段 {counts['unchanged']} 个（未重新生成），"
+                f"删除已移除段落对应的 chunk {deleted} 个" + (f"，删除失败 {delete_failed} 个（下次导入时重试）" if delete_failed else ""))
+    st.caption(f"总耗时: {time.perf_counter() - start:.1f} 秒")
+    if sharded is not None:
+        show_shard_usage(sharded)
+    return qa_pairs if store is None else store, counts["success"], counts["fail"]
 
-# Function to list chunks from a collection
-def list_chunks(collection_id, limit=20, after=None):
-    """List chunks from the specified collection."""
-    url = f"{base_url}collections/{collection_id}/chunks"   
-    params = {
-        "limit": limit,
-        "order": "desc"
-    }
-    if after:
-        params["after"] = after
+def filter_generated_qa_pairs(qa_pairs, min_overlap=None, duplicate_threshold=None):
+    """过滤过短、答案与原文重合度过低以及问题重复的QA对，显示被过滤的内容，返回保留的QA对
 
-    response = api_request("GET", url, params=params)
-    if response is not None:
-        return response  # Assuming the response is a list of chunks
+    qa_pairs 为 QASessionStore 时从中删除被过滤的QA对并返回 store。
+    """
+    qa_filter = QAFilter(
+        min_overlap=QA_FILTER_MIN_OVERLAP if min_overlap is None else min_overlap,
+        duplicate_threshold=duplicate_threshold or QA_FILTER_DUPLICATE_THRESHOLD,
+    )
+    store = qa_pairs if isinstance(qa_pairs, QASessionStore) else None
+    if store is not None:
+        # 逐页读取，内存中只保留已保留问题的向量
+        report = qa_filter.filter_pages(page for _, page in store.iter_pages(QA_STORE_PAGE_SIZE))
     else:
-        st.error("列出 chunks 失败。")
-        return []
+        kept, report = qa_filter.filter(qa_pairs)
+    st.info(
+        f"过滤掉 {report.total - report.kept} 个QA对（过短 {report.count('too_short')} 个，"
+        f"答案与原文重合度过低 {report.count('low_overlap')} 个，问题重复 {report.count('duplicate')} 个），"
+        f"保留 {report.kept} 个"
+    )
+    if report.samples:
+        reasons = {"too_short": "过短", "low_overlap": "重合度过低", "duplicate": "问题重复"}
+        with st.expander("查看被过滤的QA对"):
+            for _, reason, score, qa_pair in report.samples:
+                answer = f" / A: {qa_pair['answer']}" if qa_pair["answer"] is not None else ""
+                st.markdown(f"**{reasons[reason]}（{score:.2f}）** Q: {qa_pair['question']}{answer}")
+    if store is not None:
+        store.delete([row_id for row_id, _, _ in report.dropped])
+        return store
+    return kept
 
-# Function to get chunk details from a collection
-def get_chunk_details(chunk_id, collection_id):
-    """Get details of a specific chunk."""
-    url = f"{base_url}collections/{collection_id}/chunks/{chunk_id}" 
-    response = api_request("GET", url)
-    if response is not None:
-        return response  # Assuming the response contains chunk details
-    else:
-        st.error("获取 chunk 详细信息失败。")
-        return None
+def show_generation_projection(text_chunks, batch_size=1):
+    """显示生成阶段预计的大模型调用次数和Token数"""
+    projection = estimate_generation_cost(text_chunks, batch_size)
+    st.info(
+        f"预计调用大模型 {projection['calls']} 次，输入约 {projection['input_tokens']} Token"
+        f"（其中文本 {projection['chunk_tokens']} Token，提示词模板 {projection['input_tokens'] - projection['chunk_tokens']} Token，"
+        f"模板版本 {PROMPT_TEMPLATE_VERSION}）"
+    )
+
+def insert_qa_pairs_to_database(collection_id, qa_pairs=None, on_result=None, max_workers=None, auto_shard=False,
+                                idempotent=True):
+    """将问答对插入到数据库并显示进度
+
+    qa_pairs 默认为当前会话的QA对存储（按页读取写入）；on_result(index, chunk) 在每条记录处理后回调，失败时 chunk 为 None。
+    auto_shard 为 True 时 Collection 写满后自动创建分片继续写入；idempotent 为 True 时不重复写入已写入过的QA对。
+    """
+    qa_pairs = get_qa_store() if qa_pairs is None else qa_pairs
+    if qa_pairs is None:
+        return 0, 0
+    total = qa_pairs.count() if isinstance(qa_pairs, QASessionStore) else len(qa_pairs)
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    counts = {"done": 0, "success": 0}
+
+    def on_done(i, result):
+        counts["done"] += 1
+        if result is None:
+            st.warning(f"QA对 {i+1} 格式无效")
+        elif result["ok"]:
+            counts["success"] += 1
+        else:
+            st.warning(f"插入记录 {i+1} 失败: {result['error']}")
+        if on_result is not None:
+            on_result(i, result["chunk"] if result else None)
+        progress = min(1.0, counts["done"] / total) if total else 1.0
+        progress_bar.progress(progress)
+        status_text.text(f"进度: {progress:.2%} | 成功: {counts['success']} | 失败: {counts['done'] - counts['success']}")
+
+    ingestor = ChunkIngestor(base_url, headers, max_workers=max_workers or INGEST_MAX_WORKERS)
+    try:
+        sharded = get_sharded_collection(collection_id) if auto_shard else None
+    except requests.RequestException as e:
+        st.error(f"获取 Collection 信息失败: {e}")
+        return 0, total
+    upserter = get_upserter(collection_id, ingestor, sharded) if idempotent else None
+    report, invalid = insert_qa_pairs(ingestor, collection_id, qa_pairs, upserter=upserter, sharded=sharded,
+                                      on_result=on_done, page_size=QA_STORE_PAGE_SIZE)
+    if idempotent:
+        st.caption(f"跳过未变化的记录: {report.skipped_count} | 更新: {report.updated_count}")
+    st.caption(f"写入速度: {report.records_per_second:.1f} 条/秒")
+    if sharded is not None:
+        show_shard_usage(sharded)
+    return report.success_count, invalid + report.fail_count
 
 # Function to fetch chunks from a collection
 def fetch_all_chunks_from_collection(collection_id):
     """Fetch all chunks from the specified collection."""
-    all_chunks = []
-    after = None
-
-    while True:
-        chunk_list = list_chunks(collection_id, after=after)
-        if not chunk_list:
-            break
-        # Get details for each chunk
-        for chunk in chunk_list:
-            chunk_id = chunk['chunk_id']
-            chunk_details = get_chunk_details(chunk_id, collection_id)
-            if chunk_details:
-                all_chunks.append(chunk_details)
-        # Check if we need to continue fetching
-        if len(chunk_list) < 20:  # Assuming 20 is the limit
-            break
-        # Set the after parameter for the next request
-        after = chunk_list[-1]['chunk_id']
-    return all_chunks
+    try:
+        return list(CollectionExporter(base_url, headers).iter_chunks(collection_id))
+    except requests.RequestException as e:
+        st.error(f"获取集合内容失败: {e}")
+        return []
+
+EXPORT_MIME_TYPES = {"jsonl": "application/x-ndjson", "jsonl.gz": "application/gzip", "parquet": "application/vnd.apache.parquet"}
+
+def offer_export_files(paths, fmt, key=None):
+    """单个导出文件提供下载按钮，多个分片文件列出磁盘路径"""
+    if len(paths) == 1:
+        with open(paths[0], "rb") as f:
+            st.download_button(
+                label=f"下载 {os.path.basename(paths[0])}",
+                data=f,
+                file_name=os.path.basename(paths[0]),
+                mime=EXPORT_MIME_TYPES[fmt],
+                key=key
+            )
+    else:
+        st.info("分片文件已写入:\n\n" + "\n\n".join(paths))
+
+# Function to export chunks as JSONL / JSONL.GZ / Parquet
+def export_collection(collection_id, collection_name, fmt="jsonl", shards=1):
+    """Stream all chunks of a collection into fmt files on disk (optionally sharded) and offer them for download."""
+    status_text = st.empty()
+    try:
+        count, paths = CollectionExporter(base_url, headers).export(
+            collection_id, EXPORT_DIR, collection_name, fmt=fmt, shards=shards,
+            on_progress=lambda n: status_text.text(f"已导出 {n} 个 chunk")
+        )
+    except requests.RequestException as e:
+        st.error(f"导出集合内容失败: {e}")
+        return 0
+    except RuntimeError as e:
+        st.error(str(e))
+        return 0
+    st.info(f"已写入 {EXPORT_DIR}")
+    offer_export_files(paths, fmt)
+    return count
+
+def export_qa_pairs(store, name, fmt="jsonl.gz", shards=1):
+    """把会话存储中的QA对连同原文、来源和元数据导出为离线数据集文件"""
+    status_text = st.empty()
+    try:
+        count, paths = export_records(
+            store.iter_export_records(), EXPORT_DIR, name, fmt=fmt, shards=shards, fields=QA_EXPORT_FIELDS,
+            types=QA_EXPORT_TYPES, on_progress=lambda n: status_text.text(f"已导出 {n} 个QA对")
+        )
+    except RuntimeError as e:
+        st.error(str(e))
+        return 0
+    offer_export_files(paths, fmt)
+    return count
 
 # Function to download chunks as JSON
 def download_chunks_as_json(chunks, collection_name):
     """Download chunks as a JSON file with clear formatting."""
     if chunks:
-        json_data = {"chunks": []}
-        for chunk in chunks:
-            json_data["chunks"].append({
-                "chunk_id": chunk.get("chunk_id"),
-                "record_id": chunk.get("record_id"),
-                "collection_id": chunk.get("collection_id"),
-                "content": chunk.get("content"),
-                "num_tokens": chunk.get("num_tokens"),
-                "metadata": chunk.get("metadata", {}),
-                "updated_timestamp": chunk.get("updated_timestamp"),
-                "created_timestamp": chunk.get("created_timestamp"),
-            })
+        json_data = {"chunks": [to_export_record(chunk) for chunk in chunks]}
         
         # Pretty print the JSON data for better readability
         json_str = json.dumps(json_data, ensure_ascii=False, indent=4)
@@ -319,53 +818,290 @@ def download_chunks_as_json(chunks, collection_name):
         )
 
 # Function to upload JSON chunks
-def upload_json_chunks(uploaded_json_file, collection_id):
-    """Upload chunks from a JSON file to the specified collection."""
-    try:
-        data = json.load(uploaded_json_file)
-        
-        if 'chunks' not in data:
-            st.error("JSON 文件中缺少 'chunks' 键。")
-            return
-        
-        chunks = data['chunks']
-        total_records = len(chunks)
-        records_per_collection = 1000
-        num_collections = math.ceil(total_records / records_per_collection)
+def upload_json_chunks(uploaded_json_file, collection_id, batch_size=None, auto_shard=False, idempotent=True):
+    """Stream chunks from a JSON/JSONL file into the specified collection in batches.
 
-        st.write(f"总记录数: {total_records}")
-        st.write(f"每个集合的记录数: {records_per_collection}")
-        st.write(f"需要创建的集合数: {num_collections}")
+    With auto_shard, new shard collections are created whenever the current ones are full.
+    With idempotent, records already present in the local record index are skipped (changed ones are updated).
+    """
+    try:
+        sharded = get_sharded_collection(collection_id) if auto_shard else None
+        skipped_count = 0
+        stream = JsonRecordStream(uploaded_json_file)
+        total_bytes = getattr(uploaded_json_file, "size", None)
+        ingestor = ChunkIngestor(base_url, headers, max_workers=INGEST_MAX_WORKERS)
+        upserter = get_upserter(collection_id, ingestor, sharded) if idempotent else None
+        progress_bar = st.progress(0)
+        status_text = st.empty()
+        start = time.perf_counter()
+        total_records = 0
+        success_count = 0
+        fail_count = 0
 
-        for i in range(num_collections):
-            st.write(f"\n导入集合 {i+1}/{num_collections}...")
-            start_index = i * records_per_collection
-            end_index = min((i + 1) * records_per_collection, total_records)
-            
-            progress_bar = st.progress(0)
-            for j, chunk in enumerate(chunks[start_index:end_index]):
-                # Ensure the chunk has the required structure
-                if 'content' in chunk:
-                    content = chunk['content']
-                    try:
-                        create_chunk(
-                            collection_id=collection_id,
-                            content=content
-                        )
-                    except Exception as e:
-                        st.error(f"创建 chunk 时出错: {str(e)}")
-                        break
-                else:
-                    st.warning(f"第 {start_index + j + 1} 条记录缺少 'content' 键。")
+        for batch in iter_batches(stream, batch_size or IMPORT_BATCH_SIZE):
+            contents = []
+            for record in batch:
+                total_records += 1
+                content = record_content(record)
+                if content is None:
+                    st.warning(f"第 {total_records} 条记录缺少 'content' 键。")
                     continue
+                contents.append(content)
 
-                progress = (j + 1) / (end_index - start_index)
-                progress_bar.progress(progress)
+            if upserter is not None:
+                report = upserter.upsert(contents)
+                skipped_count += report.skipped_count
+            elif sharded is not None:
+                report = sharded.ingest(ingestor, contents)
+            else:
+                report = ingestor.ingest(collection_id, contents)
+            success_count += report.success_count
+            fail_count += report.fail_count
+            for failure in report.failures():
+                st.warning(f"创建 chunk 时出错: {failure['error']}")
+
+            if total_bytes:
+                progress_bar.progress(min(stream.bytes_read / total_bytes, 1.0))
+            elapsed = time.perf_counter() - start
+            status_text.text(
+                f"已读取: {total_records} | 成功: {success_count} | 失败: {fail_count} | "
+                f"{total_records / elapsed if elapsed > 0 else 0:.1f} 条/秒"
+            )
 
+        progress_bar.progress(1.0)
+        st.write(f"总记录数: {total_records}")
+        if skipped_count:
+            st.info(f"跳过已写入过的记录 {skipped_count} 条")
+        if sharded is not None:
+            show_shard_usage(sharded)
         st.success("所有数据导入完成。")
     except Exception as e:
         st.error(f"上传 JSON 文件时发生错误: {str(e)}")
         
+# 后台任务：处理函数在工作线程中运行，不调用 Streamlit 组件，通过 ctx 报告进度
+JOB_KIND_LABELS = {"parse": "解析文件", "generate": "生成QA对", "insert": "插入QA对", "export": "导出Collection",
+                   "import": "导入JSON文件"}
+JOB_STATUS_LABELS = {QUEUED: "排队中", RUNNING: "运行中", SUCCEEDED: "已完成", FAILED: "失败", CANCELLED: "已取消"}
+
+def parse_job_inputs(ctx, chunking=None):
+    """解析任务附带的文件，返回 (文本块列表, 错误信息列表)"""
+    files = []
+    for path in ctx.inputs:
+        with open(path, "rb") as f:
+            # 去掉保存输入文件时加的序号前缀，文本块的来源仍为原文件名
+            files.append((os.path.basename(path).split("_", 1)[1], f.read()))
+    completed = 0
+
+    def on_done(i):
+        nonlocal completed
+        completed += 1
+        ctx.progress(completed, len(files), f"已解析 {completed}/{len(files)} 个文件")
+
+    text_chunks, errors = parse_documents(files, max_workers=PARSE_MAX_WORKERS, chunking=chunking, on_done=on_done)
+    ctx.check_cancelled()
+    return text_chunks, errors
+
+def run_parse_job(ctx, chunking=None):
+    """解析并分割文件，文本块写入任务目录下的 chunks.jsonl"""
+    text_chunks, errors = parse_job_inputs(ctx, chunking)
+    path = os.path.join(ctx.work_dir, "chunks.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in text_chunks:
+            f.write(json.dumps({"content": chunk.page_content, "metadata": chunk.metadata}, ensure_ascii=False, default=str) + "\n")
+    return {"files": len(ctx.inputs), "chunks": len(text_chunks), "errors": errors, "path": path}
+
+def run_generate_job(ctx, chunking=None, use_cache=True, batch_size=1, dedup_options=None, qa_filter_options=None):
+    """解析文件并生成QA对，结果写入任务目录下的QA对存储；dedup_options、qa_filter_options 含义同页面上的对应选项"""
+    text_chunks, errors = parse_job_inputs(ctx, chunking)
+    skipped = 0
+    if dedup_options:
+        text_chunks, dedup_report = deduplicate_chunks(text_chunks, *dedup_options)
+        skipped = dedup_report.saved_calls
+    store = QASessionStore(os.path.join(ctx.work_dir, "qa_pairs.sqlite3"))
+    counts = {"generated": 0, "failed": 0, "filtered": 0}
+
+    def on_chunk_done(i, qa_pairs, error):
+        counts["generated"] += len(qa_pairs)
+        counts["failed"] += 0 if qa_pairs else 1
+
+    def on_progress(completed, total):
+        ctx.progress(completed, total, f"已生成 {counts['generated']} 个QA对，{counts['failed']} 个文本块失败")
+        ctx.check_cancelled()
+
+    try:
+        qa_workflow.generate_qa_pairs(
+            get_llm_router(), text_chunks, model=LLM_MODEL, cache=get_completion_cache() if use_cache else None,
+            max_workers=ctx.limits.get("max_workers") or LLM_MAX_WORKERS, batch_size=batch_size,
+            batch_max_tokens=BATCH_PROMPT_TOKEN_BUDGET, store=store, on_chunk_done=on_chunk_done,
+            on_progress=on_progress, cancel_event=ctx.cancel_event,
+        )
+        if dedup_options:
+            remember_generated_chunks(store.chunk_texts(), dedup_options[0])
+        if qa_filter_options:
+            report = QAFilter(*qa_filter_options).filter_pages(page for _, page in store.iter_pages(QA_STORE_PAGE_SIZE))
+            store.delete([row_id for row_id, _, _ in report.dropped])
+            counts["filtered"] = len(report.dropped)
+    except BaseException:
+        store.close()
+        QASessionStore.remove(store.path)
+        raise
+    result = {"store_path": store.path, "chunks": len(text_chunks), "skipped_duplicates": skipped,
+              "generated": counts["generated"] - counts["filtered"], "failed": counts["failed"],
+              "filtered": counts["filtered"], "errors": errors}
+    store.close()
+    return result
+
+def job_ingest_targets(ctx, collection_id, auto_shard=True, idempotent=True):
+    """为写入类任务创建 (ChunkIngestor, ShardedCollection 或 None, Upserter 或 None)"""
+    ingestor = ChunkIngestor(base_url, headers, max_workers=ctx.limits.get("max_workers") or INGEST_MAX_WORKERS)
+    sharded = get_sharded_collection(collection_id) if auto_shard else None
+    upserter = get_upserter(collection_id, ingestor, sharded) if idempotent else None
+    return ingestor, sharded, upserter
+
+def run_insert_job(ctx, collection_id, auto_shard=True, idempotent=True):
+    """把任务附带的QA对存储副本按页写入 Collection，每页写完（并登记写入索引）后检查是否取消"""
+    ingestor, sharded, upserter = job_ingest_targets(ctx, collection_id, auto_shard, idempotent)
+    store = QASessionStore(ctx.inputs[0])
+    counts = {"done": 0, "success": 0, "fail": 0}
+
+    def on_result(i, result):
+        counts["done"] += 1
+        counts["success" if result and result["ok"] else "fail"] += 1
+        ctx.progress(counts["done"], total, f"已写入 {counts['success']} 条QA对，失败 {counts['fail']} 条")
+
+    try:
+        total = store.count()
+        report, invalid = insert_qa_pairs(ingestor, collection_id, store, upserter=upserter, sharded=sharded,
+                                          on_result=on_result, after_page=ctx.check_cancelled,
+                                          page_size=QA_STORE_PAGE_SIZE)
+    finally:
+        store.close()
+    return {"total": total, "success": report.success_count, "fail": report.fail_count + invalid,
+            "skipped": report.skipped_count}
+
+def run_export_job(ctx, collection_id, name, fmt="jsonl.gz", shards=1):
+    """把 Collection 导出到 EXPORT_DIR"""
+    def on_progress(count):
+        ctx.progress(count, message=f"已导出 {count} 个 chunk")
+        ctx.check_cancelled()
+
+    count, paths = CollectionExporter(
+        base_url, headers, max_workers=ctx.limits.get("max_workers") or INGEST_MAX_WORKERS
+    ).export(collection_id, EXPORT_DIR, name, fmt=fmt, shards=shards, on_progress=on_progress)
+    return {"count": count, "paths": paths}
+
+def run_import_job(ctx, collection_id, batch_size=None, auto_shard=True, idempotent=True):
+    """把任务附带的 JSON/JSONL 文件按批写入 Collection，进度按已读取的字节数计算，每批写完后检查是否取消"""
+    total_bytes = sum(os.path.getsize(path) for path in ctx.inputs)
+    counts = {"records": 0, "missing": 0, "read": 0}
+
+    def content_pages():
+        for path in ctx.inputs:
+            with open(path, "rb") as f:
+                stream = JsonRecordStream(f)
+                for batch in iter_batches(stream, batch_size or IMPORT_BATCH_SIZE):
+                    contents = [content for content in map(record_content, batch) if content is not None]
+                    counts["records"] += len(batch)
+                    counts["missing"] += len(batch) - len(contents)
+                    ctx.progress(counts["read"] + stream.bytes_read, total_bytes, f"已读取 {counts['records']} 条记录")
+                    if contents:
+                        yield contents
+            counts["read"] += os.path.getsize(path)
+
+    ingestor, sharded, upserter = job_ingest_targets(ctx, collection_id, auto_shard, idempotent)
+    report = ingest_pages(ingestor, collection_id, content_pages(), upserter=upserter, sharded=sharded,
+                          after_page=ctx.check_cancelled)
+    return {"records": counts["records"], "success": report.success_count, "fail": report.fail_count,
+            "skipped": report.skipped_count, "missing_content": counts["missing"]}
+
+JOB_HANDLERS = {
+    "parse": run_parse_job,
+    "generate": run_generate_job,
+    "insert": run_insert_job,
+    "export": run_export_job,
+    "import": run_import_job,
+}
+
+def get_job_scheduler():
+    """获取进程内共享的后台任务调度器（页面重新运行时不会重新创建）"""
+    return get_scheduler(JOB_HANDLERS, path=JOB_DB_PATH, max_jobs=JOB_MAX_CONCURRENT, kind_limits=JOB_KIND_LIMITS,
+                         job_dir=JOB_DIR)
+
+def job_limits_input(max_workers, key):
+    """显示后台任务运行时长上限输入框，返回任务的资源限制"""
+    minutes = st.number_input("后台任务运行时长上限（分钟，0 表示不限制）", min_value=0, value=JOB_DEFAULT_TIMEOUT_MINUTES,
+                              key=f"{key}_job_timeout")
+    return {"max_workers": int(max_workers), "timeout": minutes * 60 or None}
+
+def submit_job(kind, params, name, limits, inputs=None):
+    """提交后台任务并提示到“后台任务”页面查看进度"""
+    job_id = get_job_scheduler().submit(kind, params, name=name, limits=limits, inputs=inputs)
+    st.success(f"已提交后台任务 {job_id[:8]}（{JOB_KIND_LABELS[kind]}），可在“后台任务”页面查看进度或取消。")
+    return job_id
+
+def show_job_result(job):
+    """显示已完成任务的结果，并提供载入QA对或下载导出文件等后续操作"""
+    result = job["result"] or {}
+    for error in result.get("errors") or []:
+        st.warning(error)
+    if job["kind"] == "parse":
+        st.write(f"文件: {result['files']} | 文本块: {result['chunks']} | 已保存到 {result['path']}")
+    elif job["kind"] == "generate":
+        st.write(f"文本块: {result['chunks']} | 生成QA对: {result['generated']} | 失败文本块: {result['failed']} | "
+                 f"过滤: {result['filtered']} | 跳过近重复: {result['skipped_duplicates']}")
+        if os.path.exists(result["store_path"]) and st.button("载入QA对到当前会话", key=f"load_{job['id']}"):
+            # 复制到会话自己的存储，任务的存储仍归任务所有，删除任务时一并删除
+            source = QASessionStore(result["store_path"])
+            try:
+                new_qa_store(source)
+            finally:
+                source.close()
+            st.success("已载入，可在“上传文件”页面预览，或在“插入现有Collection”页面插入。")
+    elif job["kind"] in ("insert", "import"):
+        st.write(f"成功: {result['success']} | 失败: {result['fail']} | 跳过未变化: {result['skipped']}")
+    elif job["kind"] == "export":
+        st.write(f"已导出 {result['count']} 个 chunk")
+        existing = [path for path in result["paths"] if os.path.exists(path)]
+        if existing:
+            offer_export_files(existing, next(fmt for fmt in EXPORT_FORMATS if existing[0].endswith(fmt)),
+                               key=f"download_{job['id']}")
+
+def show_jobs_page():
+    """后台任务列表：显示进度，取消排队中或运行中的任务，删除已结束的任务"""
+    st.header("后台任务")
+    scheduler = get_job_scheduler()
+    jobs = scheduler.store.list()
+    col1, col2 = st.columns(2)
+    if col1.button("刷新"):
+        st.rerun()
+    if col2.button("删除已结束的任务"):
+        scheduler.remove([job["id"] for job in jobs if job["status"] in FINISHED_STATES])
+        st.rerun()
+    if not jobs:
+        st.info("暂无后台任务。")
+        return
+    for job in jobs:
+        title = f"{JOB_STATUS_LABELS[job['status']]} · {JOB_KIND_LABELS.get(job['kind'], job['kind'])} · {job['name']}"
+        with st.expander(title, expanded=job["status"] in (QUEUED, RUNNING)):
+            st.caption(f"任务 {job['id'][:8]} | 提交于 {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(job['created_at']))}")
+            if job["total"]:
+                st.progress(min(1.0, job["done"] / job["total"]))
+            if job["message"]:
+                st.text(job["message"])
+            if job["status"] in (QUEUED, RUNNING):
+                if job["cancel_requested"]:
+                    st.caption("正在取消…")
+                elif st.button("取消任务", key=f"cancel_{job['id']}"):
+                    scheduler.cancel(job["id"])
+                    st.rerun()
+            elif job["status"] == SUCCEEDED:
+                show_job_result(job)
+            elif job["error"]:
+                st.error(job["error"])
+    if any(job["status"] in (QUEUED, RUNNING) for job in jobs) and st.checkbox("自动刷新（每 2 秒）", value=True):
+        time.sleep(2)
+        st.rerun()
+
 def main():
     """主函数，设置Streamlit界面"""
     st.set_page_config(page_title="RAG管理员界面", layout="wide")
@@ -377,7 +1113,7 @@ def main():
 
     # 侧边栏
     st.sidebar.title("操作面板")
-    operation = st.sidebar.radio("选择操作", ["上传文件", "管理知识库"])
+    operation = st.sidebar.radio("选择操作", ["上传文件", "管理知识库", "后台任务"])
 
     if operation == "上传文件":
         st.header("文件上传与QA对生成")
@@ -385,31 +1121,121 @@ def main():
         uploaded_files = st.file_uploader("上传非结构化文件", type=["txt", "pdf", "docx"], accept_multiple_files=True)
         if uploaded_files:
             st.success("文件上传成功！")
-            
-            if st.button("处理文件并生成QA对"):
+            max_workers = st.number_input("并发请求数", min_value=1, max_value=64, value=LLM_MAX_WORKERS)
+            use_cache = st.checkbox("使用生成缓存（跳过已处理过的文本块）", value=True)
+            # 流水线模式的复选框在下方，这里读取其上次的取值
+            pipeline_mode = st.session_state.get("pipeline_mode", False)
+            stream = st.checkbox("流式生成（实时显示生成中的问答对，格式异常时提前终止）", value=False,
+                                 disabled=pipeline_mode)
+            if pipeline_mode:
+                st.info("流水线模式下QA对生成后立即插入，不实时显示生成中的问答对，流式生成不可用。")
+            batch_size = st.number_input("每次请求合并的文本块数（1 表示不合并，适合大量短文本块）", min_value=1, max_value=16, value=1)
+            use_dedup = st.checkbox("跳过近重复的文本块", value=True)
+            if use_dedup:
+                dedup_threshold = st.slider("近重复相似度阈值", min_value=0.5, max_value=1.0, value=DEDUP_THRESHOLD, step=0.05)
+                dedup_history = st.checkbox("同时跳过与以往运行中已生成过的文本块近重复的文本块", value=True)
+
+            chunking_mode = st.radio("分割方式", ("按字符（2000字，重叠500字）", "按Token预算"))
+            if chunking_mode == "按Token预算":
+                prompt_budget = st.number_input(
+                    "每次请求的输入Token上限（含提示词模板）",
+                    min_value=prompt_overhead_tokens() + 100, max_value=32000, value=LLM_PROMPT_TOKEN_BUDGET,
+                )
+                overlap_tokens = st.number_input("相邻文本块重叠Token数", min_value=0, max_value=1000, value=CHUNK_OVERLAP_TOKENS)
+                chunking = ("tokens", chunk_token_budget(prompt_budget), overlap_tokens)
+            else:
+                chunking = ("chars", CHUNK_SIZE, CHUNK_OVERLAP)
+            dedup_options = (dedup_threshold, dedup_history) if use_dedup else None
+
+            use_qa_filter = st.checkbox("生成后过滤过短、与原文无关或问题重复的QA对", value=False)
+            if use_qa_filter:
+                qa_filter_overlap = st.slider("答案与原文重合度下限", min_value=0.0, max_value=1.0,
+                                              value=QA_FILTER_MIN_OVERLAP, step=0.05)
+                qa_filter_duplicate = st.slider("问题相似度阈值（达到即视为重复）", min_value=0.5, max_value=1.0,
+                                                value=QA_FILTER_DUPLICATE_THRESHOLD, step=0.05)
+
+            pipeline_collection_id = None
+            if st.checkbox("流水线模式（边生成边插入到Collection，无需等待全部生成完成）", value=False, key="pipeline_mode"):
+                if st.session_state.collections:
+                    collection_names = [c['name'] for c in st.session_state.collections]
+                    pipeline_collection = st.selectbox("插入到Collection", collection_names)
+                    pipeline_collection_id = next(
+                        c['collection_id'] for c in st.session_state.collections if c['name'] == pipeline_collection
+                    )
+                    pipeline_auto_shard = st.checkbox("Collection 写满后自动创建分片继续写入", value=True)
+                    pipeline_incremental = st.checkbox(
+                        "增量模式（同名文件只处理新增或变化的文本段，并删除已移除段落对应的 chunk）", value=False
+                    )
+                else:
+                    st.warning("没有可用的 Collections，请先在“管理知识库”中创建。")
+
+            if st.button("预估调用量"):
+                with st.spinner("正在处理文件..."):
+                    text_chunks = prepare_text_chunks(uploaded_files, chunking, dedup_options)
+                if text_chunks:
+                    show_generation_projection(text_chunks, batch_size)
+
+            with st.expander("后台运行（提交后可切换页面或进行其他操作，不受页面刷新影响）"):
+                generate_limits = job_limits_input(max_workers, "generate")
+                job_name = uploaded_files[0].name + (f" 等 {len(uploaded_files)} 个文件" if len(uploaded_files) > 1 else "")
+                col1, col2 = st.columns(2)
+                if col1.button("提交生成任务"):
+                    submit_job(
+                        "generate",
+                        {"chunking": chunking, "use_cache": use_cache, "batch_size": batch_size,
+                         "dedup_options": dedup_options,
+                         "qa_filter_options": (qa_filter_overlap, qa_filter_duplicate) if use_qa_filter else None},
+                        job_name, generate_limits, [(f.name, f.getvalue()) for f in uploaded_files],
+                    )
+                if col2.button("提交解析任务"):
+                    submit_job("parse", {"chunking": chunking}, job_name, generate_limits,
+                               [(f.name, f.getvalue()) for f in uploaded_files])
+
+            if pipeline_collection_id and st.button("处理文件、生成并插入QA对"):
+                with st.spinner("正在生成并插入QA对..."):
+                    store, success_count, fail_count = run_generate_and_insert_pipeline(
+                        uploaded_files, pipeline_collection_id, chunking, dedup_options,
+                        max_workers=max_workers, use_cache=use_cache, auto_shard=pipeline_auto_shard,
+                        incremental=pipeline_incremental, store=new_qa_store(), batch_size=batch_size,
+                        qa_filter_options=(qa_filter_overlap, qa_filter_duplicate) if use_qa_filter else None,
+                    )
+                    if dedup_options:
+                        remember_generated_chunks(store.chunk_texts(), dedup_threshold)
+                    st.success(f"已生成 {store.count()} 个QA对 | 插入成功: {success_count} | 失败: {fail_count}")
+                    show_endpoint_stats()
+
+            if not pipeline_collection_id and st.button("处理文件并生成QA对"):
                 with st.spinner("正在处理文件..."):
-                    text_chunks = process_files(uploaded_files)
+                    text_chunks = prepare_text_chunks(uploaded_files, chunking, dedup_options)
                     if not text_chunks:
-                        st.error("文件处理失败，请检查文件格式是否正确。")
                         return
-                    st.info(f"文件已分割成 {len(text_chunks)} 个文本段")
+                    show_generation_projection(text_chunks, batch_size)
 
                 with st.spinner("正在生成QA对..."):
-                    st.session_state.qa_pairs = generate_qa_pairs_with_progress(text_chunks)
-                    st.success(f"已生成 {len(st.session_state.qa_pairs)} 个QA对")
-
-                if st.session_state.qa_pairs:
-                    st.subheader("前3个QA对预览")
-                    cols = st.columns(3)
-                    for i, qa in enumerate(st.session_state.qa_pairs[:3]):
-                        with st.expander(f"**QA对 {i + 1}**", expanded=True):
-                            st.markdown("**问题:**")
-                            st.markdown(qa['question'])
-                            st.markdown("**答案:**")
-                            st.markdown(qa['answer'])
-                            st.markdown("**原文:**")
-                            st.markdown(qa['chunk'])
-                        st.markdown("---") 
+                    store = generate_qa_pairs_with_progress(
+                        text_chunks, max_workers=max_workers, use_cache=use_cache, batch_size=batch_size, stream=stream,
+                        store=new_qa_store(),
+                    )
+                    if dedup_options:
+                        remember_generated_chunks(store.chunk_texts(), dedup_threshold)
+                    if use_qa_filter:
+                        filter_generated_qa_pairs(store, qa_filter_overlap, qa_filter_duplicate)
+                    st.success(f"已生成 {store.count()} 个QA对")
+                    show_endpoint_stats()
+
+            store = get_qa_store()
+            if store is not None:
+                show_qa_preview(store)
+                if store.count():
+                    with st.expander("导出QA对数据集"):
+                        qa_format = st.selectbox("导出格式", EXPORT_FORMATS, index=EXPORT_FORMATS.index("jsonl.gz"))
+                        qa_shards = st.number_input("分片文件数", min_value=1, max_value=64, value=1, key="qa_export_shards")
+                        if st.button("导出QA对"):
+                            with st.spinner("正在导出QA对..."):
+                                count = export_qa_pairs(store, f"qa_pairs_{time.strftime('%Y%m%d_%H%M%S')}",
+                                                        qa_format, qa_shards)
+                                if count:
+                                    st.success(f"已导出 {count} 个QA对")
         else:
             st.warning("请上传文件。")
     elif operation == "管理知识库":
@@ -422,24 +1248,48 @@ def main():
                 selected_collection = st.selectbox("选择Collection", collection_names)
                 selected_id = next(c['collection_id'] for c in st.session_state.collections if c['name'] == selected_collection)
 
+                max_workers = st.number_input("并行写入数", min_value=1, max_value=64, value=INGEST_MAX_WORKERS)
+                auto_shard = st.checkbox("Collection 写满后自动创建分片继续写入", value=True)
+                idempotent = st.checkbox("跳过已写入过的QA对（已变化的原地更新）", value=True)
+
                 if st.button("插入QA对到选定的Collection"):
-                    if hasattr(st.session_state, 'qa_pairs') and st.session_state.qa_pairs:
+                    store = get_qa_store()
+                    if store is not None and store.count():
                         with st.spinner("正在插入QA对..."):
-                            success_count, fail_count = insert_qa_pairs_to_database(selected_id)
-                            st.success(f"数据插入完成！总计: {len(st.session_state.qa_pairs)} | 成功: {success_count} | 失败: {fail_count}")
+                            success_count, fail_count = insert_qa_pairs_to_database(
+                                selected_id, max_workers=max_workers, auto_shard=auto_shard, idempotent=idempotent
+                            )
+                            st.success(f"数据插入完成！总计: {store.count()} | 成功: {success_count} | 失败: {fail_count}")
+                    else:
+                        st.warning("没有可用的QA对。请先上传文件并生成QA对。")
+
+                insert_limits = job_limits_input(max_workers, "insert")
+                if st.button("提交为后台插入任务"):
+                    store = get_qa_store()
+                    if store is not None and store.count():
+                        # 任务使用提交时的副本，会话之后重新生成或清理存储不影响任务
+                        submit_job("insert", {"collection_id": selected_id, "auto_shard": auto_shard,
+                                              "idempotent": idempotent},
+                                   f"{store.count()} 个QA对 -> {selected_collection}", insert_limits,
+                                   inputs=[("qa_pairs.sqlite3", store.backup)])
                     else:
                         st.warning("没有可用的QA对。请先上传文件并生成QA对。")
+
+                if st.button("从Collection重建本地写入索引"):
+                    with st.spinner("正在读取集合内容..."):
+                        count = rebuild_record_index(selected_id)
+                        st.success(f"本地写入索引已重建，共 {count} 条记录。")
             else:
                 st.warning("没有可用的 Collections，请创建新的 Collection。")
 
         elif option == "创建新Collection":
             new_collection_name = st.text_input("输入新Collection名称")
-            capacity = st.number_input("设置Collection容量", min_value=1, max_value=1000, value=1000)
+            capacity = st.number_input("设置Collection容量", min_value=1, value=SHARD_CAPACITY)
             if st.button("创建新Collection"):
                 with st.spinner("正在创建新Collection..."):
                     new_collection = create_collection(
                         name=new_collection_name,
-                        embedding_model_id=embedding,  # 这里可以替换为实际的模型ID
+                        embedding_model_id=EMBEDDING_MODEL_ID,
                         capacity=capacity
                     )
                     if new_collection:
@@ -456,32 +1306,65 @@ def main():
                 selected_collection = st.selectbox("选择Collection", collection_names)
                 selected_id = next(c['collection_id'] for c in st.session_state.collections if c['name'] == selected_collection)
 
+                export_format = st.radio("导出格式", EXPORT_FORMAT_OPTIONS)
+                shards = 1
+                if EXPORT_FORMAT_OPTIONS[export_format]:
+                    shards = st.number_input("分片文件数", min_value=1, max_value=64, value=1, help="各分片并行写入")
+
                 if st.button("下载选定Collection的内容"):
                     with st.spinner("正在获取集合内容..."):
-                        chunks = fetch_all_chunks_from_collection(selected_id)  # Pass the API key
-                        if chunks:
-                            download_chunks_as_json(chunks, selected_collection)  # Pass the collection name
-                            st.success(f"成功获取 {len(chunks)} 个 chunk。")
+                        if export_format == "JSON":
+                            chunks = fetch_all_chunks_from_collection(selected_id)  # Pass the API key
+                            count = len(chunks)
+                            if chunks:
+                                download_chunks_as_json(chunks, selected_collection)  # Pass the collection name
+                        else:
+                            count = export_collection(selected_id, selected_collection,
+                                                      EXPORT_FORMAT_OPTIONS[export_format], shards)
+                        if count:
+                            st.success(f"成功获取 {count} 个 chunk。")
                         else:
                             st.error("未能获取集合内容。")
+                if EXPORT_FORMAT_OPTIONS[export_format]:
+                    export_limits = job_limits_input(INGEST_MAX_WORKERS, "export")
+                    if st.button("提交为后台导出任务"):
+                        submit_job("export", {"collection_id": selected_id, "name": selected_collection,
+                                              "fmt": EXPORT_FORMAT_OPTIONS[export_format], "shards": shards},
+                                   selected_collection, export_limits)
             else:
                 st.warning("没有可用的 Collections，请创建新的 Collection。")
 
 
         elif option == "上传JSON文件":
-            uploaded_json_file = st.file_uploader("选择一个 JSON 文件", type=["json"])
+            uploaded_json_file = st.file_uploader("选择一个 JSON 或 JSONL 文件", type=["json", "jsonl"])
             
             if st.session_state.collections:
                 collection_names = [c['name'] for c in st.session_state.collections]
                 selected_collection = st.selectbox("选择Collection", collection_names)
                 selected_id = next(c['collection_id'] for c in st.session_state.collections if c['name'] == selected_collection)
 
+                auto_shard = st.checkbox("Collection 写满后自动创建分片继续写入", value=True)
+                idempotent = st.checkbox("跳过已写入过的记录（已变化的原地更新）", value=True)
+
                 if uploaded_json_file is not None:
                     if st.button("上传并插入到选定的Collection"):
                         with st.spinner("正在上传 JSON 文件并插入数据..."):
-                            upload_json_chunks(uploaded_json_file, selected_id)
+                            upload_json_chunks(
+                                uploaded_json_file, selected_id, auto_shard=auto_shard, idempotent=idempotent
+                            )
+                    import_limits = job_limits_input(INGEST_MAX_WORKERS, "import")
+                    if st.button("提交为后台导入任务"):
+                        submit_job("import", {"collection_id": selected_id, "auto_shard": auto_shard,
+                                              "idempotent": idempotent},
+                                   f"{uploaded_json_file.name} -> {selected_collection}", import_limits,
+                                   [(uploaded_json_file.name, uploaded_json_file.getvalue())])
             else:
                 st.warning("没有可用的 Collections，请创建新的 Collection。")
 
+    elif operation == "后台任务":
+        show_jobs_page()
+
+    show_run_metrics()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
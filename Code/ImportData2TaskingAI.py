@@ -1,7 +1,10 @@
 import requests
-import json
 from tqdm import tqdm
-import math
+import time
+from ingest import ChunkIngestor
+from json_stream import JsonRecordStream, iter_batches, record_content
+from record_index import RecordIndex, Upserter
+from sharding import ShardedCollection
 
 base_url = 'http://your-api-url/v1/'
 api_key = 'your-api-key'
@@ -26,81 +29,51 @@ def create_collection(name, embedding_model_id, capacity):
     else:
         raise Exception(f"Failed to create collection: {response.text}")
 
-def get_collection_details(collection_id):
-    response = requests.get(f"{base_url}collections/{collection_id}", headers=headers)
-    print(f"Get collection details response: {response.status_code} - {response.text}")
-    if response.status_code == 200:
-        return response.json()['data']
-    else:
-        raise Exception(f"Failed to get collection details: {response.text}")
-
-def create_chunk(collection_id, content):
-    data = {
-        "collection_id": collection_id,
-        "content": content
-    }
-    # 尝试不同的 API 端点
-    endpoints = [
-        f"{base_url}chunks",
-        f"{base_url}collections/{collection_id}/chunks",
-        f"{base_url}embeddings"
-    ]
-    for endpoint in endpoints:
-        response = requests.post(endpoint, headers=headers, json=data)
-        print(f"Create chunk response ({endpoint}): {response.status_code} - {response.text}")
-        if response.status_code == 200:
-            return response.json()['data']
-    raise Exception(f"Failed to create chunk: All endpoints failed")
-
 try:
     print("列出现有集合...")
     collections = list_collections()
     collection_ids = [collection['collection_id'] for collection in collections]
     print(f"现有集合 IDs: {collection_ids}")
 
-    # 读取 BNUGPT_Optimized_qa_pair.json 文件
-    with open('BNUGPT_Optimized_qa_pair_V3.json', 'r', encoding='utf-8') as file:
-        data = json.load(file)
-
-    qa_pairs = data['qa_pairs']
-    total_records = len(qa_pairs)
     records_per_collection = 1000
-    num_collections = math.ceil(total_records / records_per_collection)
-
-    print(f"\n总记录数: {total_records}")
-    print(f"每个集合的记录数: {records_per_collection}")
-    print(f"需要创建的集合数: {num_collections}")
+    print(f"\n每个分片集合的容量: {records_per_collection}")
 
-    for i in range(num_collections):
-        print(f"\n创建集合 {i+1}/{num_collections}...")
-        new_collection = create_collection(
-            name=f"BNUGPT_Optimized_qa_pair_v3_part{i+1}",
-            embedding_model_id="TpO9MbEa",
-            capacity=records_per_collection
-        )
-        print(f"新创建的集合 ID: {new_collection['collection_id']}")
+    # 记录只通过 ChunkIngestor 写入 collections/{id}/chunks 端点，不再尝试 chunks、embeddings 等旧端点
+    ingestor = ChunkIngestor(base_url, headers, max_workers=8)
+    # 写满一个集合后自动创建 BNUGPT_Optimized_qa_pair_v3_partN，已有的 _partN 集合会被沿用，记录所在分片保存在本地清单中
+    sharded = ShardedCollection(
+        "BNUGPT_Optimized_qa_pair_v3",
+        lambda name, capacity: create_collection(name, embedding_model_id="TpO9MbEa", capacity=capacity),
+        capacity=records_per_collection,
+        collections=collections,
+    )
+    # 重复运行或中断后重跑时跳过已导入过的记录
+    upserter = Upserter(RecordIndex(), ingestor, None, sharded=sharded)
+    total_records = 0
+    start_time = time.perf_counter()
 
-        # 获取并打印集合详情
-        collection_details = get_collection_details(new_collection['collection_id'])
-        print(f"集合详情: {json.dumps(collection_details, indent=2)}")
+    # 流式读取 BNUGPT_Optimized_qa_pair.json 文件，按批分配到各分片集合并行导入
+    with open('BNUGPT_Optimized_qa_pair_V3.json', 'rb') as file:
+        for qa_pairs in iter_batches(JsonRecordStream(file, keys=("qa_pairs",)), records_per_collection):
+            start_index = total_records
+            total_records += len(qa_pairs)
 
-        start_index = i * records_per_collection
-        end_index = min((i + 1) * records_per_collection, total_records)
-        
-        print(f"导入记录 {start_index+1} 到 {end_index}...")
-        for j, qa_pair in enumerate(tqdm(qa_pairs[start_index:end_index], desc=f"Adding QA pairs to collection {i+1}")):
-            content = f"{qa_pair['question']}\n{qa_pair['answer']}"
-            try:
-                chunk = create_chunk(
-                    collection_id=new_collection['collection_id'],
-                    content=content
-                )
-                # time.sleep(0.5)  # 每次请求后暂停0.5秒
-            except Exception as e:
-                print(f"Error creating chunk for QA pair {start_index + j + 1}: {str(e)}")
-                print(f"QA pair content: {content[:100]}...")
-                raise
+            print(f"\n导入记录 {start_index+1} 到 {total_records}...")
+            contents = [record_content(qa_pair) for qa_pair in qa_pairs]
+            with tqdm(total=len(contents), desc="Adding QA pairs") as pbar:
+                report = upserter.upsert(contents, on_result=lambda j, result: pbar.update(1))
+            print(f"成功: {report.success_count}（跳过已导入 {report.skipped_count}） | 失败: {report.fail_count} | "
+                  f"{report.records_per_second:.1f} 条/秒")
+            for failure in report.failures():
+                print(f"Error creating chunk for QA pair {start_index + failure['index'] + 1}: {failure['error']}")
+                print(f"QA pair content: {contents[failure['index']][:100]}...")
+            if report.fail_count:
+                raise Exception(f"Failed to create {report.fail_count} chunks")
 
+    for shard in sharded.manifest.shards(sharded.group):
+        print(f"集合 {shard['collection_id']}: {shard['used']}/{shard['capacity']}")
+    elapsed = time.perf_counter() - start_time
+    print(f"\n总记录数: {total_records} | 平均 {total_records / elapsed if elapsed > 0 else 0:.1f} 条/秒")
     print("所有数据导入完成。")
 
 except Exception as e:
@@ -0,0 +1,48 @@
+"""只追加的 JSONL 检查点日志，用于中断后恢复批量任务"""
+import hashlib
+import json
+import os
+
+
+def content_hash(text):
+    """计算文本内容的哈希，用于识别同一个文本块"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CheckpointJournal:
+    """按行追加事件记录，每条记录写入后立即落盘，进程崩溃时最多丢失正在写入的一行"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def read(self):
+        """按顺序读取全部事件，忽略末尾未写完的行"""
+        if not os.path.exists(self.path):
+            return []
+        events = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+        return events
+
+    def append(self, event):
+        """追加一条事件"""
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def latest(self, stage):
+        """返回某个阶段中每个键最后一次记录的事件 {key: event}"""
+        state = {}
+        for event in self.read():
+            if event.get("stage") == stage:
+                state[event["key"]] = event
+        return state
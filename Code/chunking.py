@@ -0,0 +1,183 @@
+"""按 Token 预算分割文档：尽量在标题、分页和段落边界断开，重叠长度可调（可为 0）"""
+import re
+from functools import lru_cache
+
+from langchain.docstore.document import Document
+
+from llm_pool import estimate_tokens
+
+# 单个文本块的默认 Token 上限与重叠 Token 数
+DEFAULT_MAX_TOKENS = 1500
+DEFAULT_OVERLAP_TOKENS = 0
+
+_HEADING_PATTERN = re.compile(
+    r"^\s*(#{1,6}\s+\S"                                # Markdown 标题
+    r"|第[一二三四五六七八九十百零〇\d]+[章节篇部分条]"    # 第一章 / 第3节
+    r"|[一二三四五六七八九十]+、"                        # 一、
+    r"|[（(][一二三四五六七八九十]+[）)]"                # （一）
+    r"|\d+(\.\d+)*[.、]\s*\S"                            # 1. / 3、
+    r"|\d+(\.\d+)+\s+\S)"                                # 1.2 标题
+)
+_SENTENCE_PATTERN = re.compile(r"[^。！？!?；;\n]*[。！？!?；;\n]+|[^。！？!?；;\n]+$")
+# 标题行最多字符数，过长的编号行视为普通段落
+_MAX_HEADING_CHARS = 40
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text):
+    """计算文本的Token数：安装了 tiktoken 时使用 cl100k_base 编码，否则按字符粗略估算"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def is_heading(line):
+    line = line.strip()
+    return 0 < len(line) <= _MAX_HEADING_CHARS and bool(_HEADING_PATTERN.match(line))
+
+
+def split_blocks(text):
+    """按空行和标题行把文本切成段落块，返回 [(块文本, 是否以标题开头)]"""
+    blocks = []
+    lines = []
+    heading = False
+    for line in text.splitlines():
+        if not line.strip() or is_heading(line):
+            if lines:
+                blocks.append(("\n".join(lines), heading))
+                lines = []
+            heading = bool(line.strip())
+        if line.strip():
+            lines.append(line)
+    if lines:
+        blocks.append(("\n".join(lines), heading))
+    return blocks
+
+
+def _split_oversized(text, max_tokens):
+    """把超过预算的段落按句子切开，单句仍超长时按字符硬切"""
+    pieces = []
+    current = ""
+    for sentence in _SENTENCE_PATTERN.findall(text):
+        if count_tokens(current + sentence) <= max_tokens:
+            current += sentence
+            continue
+        if current:
+            pieces.append(current)
+        while count_tokens(sentence) > max_tokens:
+            # 按比例估算切分位置
+            cut = max(1, int(len(sentence) * max_tokens / count_tokens(sentence)))
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:]
+        current = sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+class TokenBudgetSplitter:
+    """将文档打包为不超过 max_tokens 的文本块
+
+    同一来源的连续文档（如 PDF 的各页）会被合并打包，遇到标题或换页时，
+    若当前文本块已达到预算的 min_fill 比例则另起新块；overlap_tokens 为相邻块之间重复的 Token 数。
+    """
+
+    def __init__(self, max_tokens=DEFAULT_MAX_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS, min_fill=0.5):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("重叠 Token 数必须小于文本块 Token 上限")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_fill = min_fill
+
+    def _units(self, documents):
+        """产出 (文本, Token数, 是否为强边界, 来源文档)"""
+        previous_source = None
+        for document in documents:
+            source = document.metadata.get("source")
+            new_page = True
+            for text, heading in split_blocks(document.page_content):
+                boundary = heading or new_page
+                new_page = False
+                pieces = [text]
+                if count_tokens(text) > self.max_tokens:
+                    pieces = _split_oversized(text, self.max_tokens)
+                for piece in pieces:
+                    if source != previous_source:
+                        # 不同文件之间必须断开
+                        boundary = "file"
+                        previous_source = source
+                    yield piece, count_tokens(piece), boundary, document
+                    boundary = False
+
+    def _make_chunk(self, units):
+        first = units[0][3]
+        metadata = dict(first.metadata)
+        pages = sorted({unit[3].metadata["page"] for unit in units if "page" in unit[3].metadata})
+        if len(pages) > 1:
+            metadata["page_end"] = pages[-1]
+        return Document(page_content="\n\n".join(unit[0] for unit in units), metadata=metadata)
+
+    def _overlap(self, units):
+        """取上一个文本块末尾不超过 overlap_tokens 的内容，段落放不下时取其末尾的若干句"""
+        carried = []
+        tokens = 0
+        for unit in reversed(units):
+            if tokens + unit[1] <= self.overlap_tokens:
+                carried.insert(0, unit)
+                tokens += unit[1]
+                continue
+            tail = ""
+            for sentence in reversed(_SENTENCE_PATTERN.findall(unit[0])):
+                if tokens + count_tokens(sentence + tail) > self.overlap_tokens:
+                    break
+                tail = sentence + tail
+            if tail:
+                carried.insert(0, (tail, count_tokens(tail), False, unit[3]))
+                tokens += carried[0][1]
+            break
+        return carried, tokens
+
+    def split_documents(self, documents):
+        chunks = []
+        current = []
+        current_tokens = 0
+        fresh = 0  # 当前块中非重叠部分的单元数
+        for unit in self._units(documents):
+            text, tokens, boundary, _ = unit
+            must_break = boundary == "file" or current_tokens + tokens > self.max_tokens
+            prefer_break = boundary and current_tokens >= self.max_tokens * self.min_fill
+            if fresh and (must_break or prefer_break):
+                chunks.append(self._make_chunk(current))
+                if boundary == "file":
+                    current, current_tokens = [], 0
+                else:
+                    current, current_tokens = self._overlap(current)
+                    while current and current_tokens + tokens > self.max_tokens:
+                        current_tokens -= current.pop(0)[1]
+                fresh = 0
+            current.append(unit)
+            current_tokens += tokens
+            fresh += 1
+        if fresh:
+            chunks.append(self._make_chunk(current))
+        return chunks
+
+
+def project_generation_cost(text_chunks, prompt_overhead_tokens):
+    """预估生成阶段的大模型调用次数和输入Token数（每个文本块一次调用）"""
+    chunk_tokens = sum(count_tokens(chunk.page_content) for chunk in text_chunks)
+    calls = len(text_chunks)
+    return {
+        "calls": calls,
+        "chunk_tokens": chunk_tokens,
+        "input_tokens": chunk_tokens + calls * prompt_overhead_tokens,
+    }
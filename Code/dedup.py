@@ -0,0 +1,171 @@
+"""生成前的近重复文本块检测：MinHash 指纹 + LSH 分桶，指纹索引持久化到 SQLite 以覆盖历史运行"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import zlib
+
+import numpy as np
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "fingerprints.sqlite3")
+DEFAULT_THRESHOLD = 0.85
+DEFAULT_NUM_PERM = 128
+SHINGLE_SIZE = 5
+# LSH 分带：32 带 x 4 行，相似度约 0.42 以上的文本块即可能落入同一个桶，候选再按实际相似度与阈值比较。
+# 分带与阈值无关，调整阈值后历史索引仍然可用。
+LSH_BANDS = 32
+# 大于 2^32 的最小素数；a、b、x 均小于 2^32，a*x+b 不会超出 uint64
+_PRIME = np.uint64(4294967311)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def text_hash(text):
+    """文本内容哈希，用于识别完全相同的文本块"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """将文本规范化后切分为字符 n-gram 并计算 32 位哈希（对中文同样适用）"""
+    text = _WHITESPACE.sub(" ", text).strip().lower()
+    if len(text) <= size:
+        grams = {text}
+    else:
+        grams = {text[i:i + size] for i in range(len(text) - size + 1)}
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+class MinHasher:
+    """计算 MinHash 签名，随机参数由固定种子生成，保证不同运行之间签名可比"""
+
+    def __init__(self, num_perm=DEFAULT_NUM_PERM, seed=1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self._a = rng.randint(1, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        hashes = shingle_hashes(text)
+        # (num_perm, n) 矩阵按行取最小值
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+class DedupReport:
+    """去重统计"""
+
+    def __init__(self, total, kept, duplicates_in_run, duplicates_of_history):
+        self.total = total
+        self.kept = kept
+        self.duplicates_in_run = duplicates_in_run
+        self.duplicates_of_history = duplicates_of_history
+
+    @property
+    def saved_calls(self):
+        """节省的大模型调用次数"""
+        return self.total - self.kept
+
+
+class NearDuplicateIndex:
+    """近重复检测索引
+
+    filter() 过滤掉与本次运行中已保留的文本块、或与历史运行记录过的文本块相似度达到阈值的文本块；
+    remember() 在生成成功后把文本块的指纹写入持久化索引。
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_NUM_PERM):
+        self.path = path
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands = LSH_BANDS
+        self.rows = num_perm // LSH_BANDS
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            "id INTEGER PRIMARY KEY, text_hash TEXT UNIQUE, source TEXT, num_perm INTEGER, signature BLOB)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS buckets (band INTEGER, bucket INTEGER, fingerprint_id INTEGER)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets ON buckets(band, bucket)")
+        self._conn.commit()
+
+    def _bucket_keys(self, signature):
+        keys = []
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            digest = hashlib.blake2b(chunk, digest_size=8).digest()
+            keys.append((band, int.from_bytes(digest, "big", signed=True)))
+        return keys
+
+    def _similarity(self, a, b):
+        return float(np.mean(a == b))
+
+    def _match_history(self, digest, signature, keys):
+        if self._conn.execute("SELECT 1 FROM fingerprints WHERE text_hash = ?", (digest,)).fetchone():
+            return True
+        candidates = set()
+        for band, bucket in keys:
+            rows = self._conn.execute(
+                "SELECT fingerprint_id FROM buckets WHERE band = ? AND bucket = ?", (band, bucket)
+            ).fetchall()
+            candidates.update(row[0] for row in rows)
+        for fingerprint_id in candidates:
+            row = self._conn.execute(
+                "SELECT signature FROM fingerprints WHERE id = ? AND num_perm = ?", (fingerprint_id, self.hasher.num_perm)
+            ).fetchone()
+            if row and self._similarity(signature, np.frombuffer(row[0], dtype=np.uint32)) >= self.threshold:
+                return True
+        return False
+
+    def filter(self, texts, use_history=True):
+        """返回 (保留的下标列表, DedupReport)"""
+        kept = []
+        seen_hashes = set()
+        kept_signatures = []
+        run_buckets = {}
+        duplicates_in_run = 0
+        duplicates_of_history = 0
+        with self._lock:
+            for i, text in enumerate(texts):
+                digest = text_hash(text)
+                signature = self.hasher.signature(text)
+                keys = self._bucket_keys(signature)
+                if digest in seen_hashes or any(
+                    self._similarity(signature, kept_signatures[j]) >= self.threshold
+                    for j in {j for key in keys for j in run_buckets.get(key, ())}
+                ):
+                    duplicates_in_run += 1
+                    continue
+                if use_history and self._match_history(digest, signature, keys):
+                    duplicates_of_history += 1
+                    continue
+                seen_hashes.add(digest)
+                for key in keys:
+                    run_buckets.setdefault(key, []).append(len(kept_signatures))
+                kept_signatures.append(signature)
+                kept.append(i)
+        return kept, DedupReport(len(texts), len(kept), duplicates_in_run, duplicates_of_history)
+
+    def remember(self, texts, source=None):
+        """将文本块指纹写入持久化索引，供后续运行去重"""
+        with self._lock:
+            for text in texts:
+                signature = self.hasher.signature(text)
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO fingerprints (text_hash, source, num_perm, signature) VALUES (?, ?, ?, ?)",
+                    (text_hash(text), source, self.hasher.num_perm, signature.tobytes()),
+                )
+                if cursor.rowcount:
+                    self._conn.executemany(
+                        "INSERT INTO buckets (band, bucket, fingerprint_id) VALUES (?, ?, ?)",
+                        [(band, bucket, cursor.lastrowid) for band, bucket in self._bucket_keys(signature)],
+                    )
+            self._conn.commit()
+
+    def clear(self):
+        """清空持久化索引"""
+        with self._lock:
+            self._conn.execute("DELETE FROM buckets")
+            self._conn.execute("DELETE FROM fingerprints")
+            self._conn.commit()
@@ -0,0 +1,95 @@
+"""增量重新导入：按文件名为每个源文档保存清单，记录各文本块的内容哈希及由其生成的远端 chunk
+
+同名文档再次上传时与清单比较：哈希未变化的文本块跳过，新增或变化的文本块重新生成并写入，
+清单中有而新版本中没有的文本块（已删除或已修改的段落）对应的远端 chunk 应被删除。
+"""
+import os
+import sqlite3
+import threading
+
+from checkpoint import content_hash
+
+DEFAULT_MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "documents.sqlite3")
+
+
+class DocumentDiff:
+    """新版本文档与清单的差异
+
+    added 为需要重新生成的文本块下标（新增或内容变化），unchanged 为未变化的文本块下标，
+    removed 为需要删除的清单行 [(行号, collection_id, chunk_id)]。
+    """
+
+    def __init__(self, source, hashes, added, unchanged, removed):
+        self.source = source
+        self.hashes = hashes
+        self.added = added
+        self.unchanged = unchanged
+        self.removed = removed
+
+
+class DocumentManifest:
+    """文档清单：(范围, 文件名, 文本块哈希) -> 由该文本块生成的远端 chunk
+
+    范围与 record_index 相同，为 collection_id 或分片组名称。同一文本块可对应多行（多个远端 chunk），
+    生成失败的文本块不登记，下次导入时仍视为新增。
+    """
+
+    def __init__(self, path=DEFAULT_MANIFEST_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS doc_chunks ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, scope TEXT, source TEXT, chunk_hash TEXT, "
+            "collection_id TEXT, chunk_id TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS doc_chunks_source ON doc_chunks (scope, source)")
+        self._conn.commit()
+
+    def rows(self, scope, source):
+        """返回 [(行号, 文本块哈希, collection_id, chunk_id)]"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, chunk_hash, collection_id, chunk_id FROM doc_chunks WHERE scope = ? AND source = ? ORDER BY id",
+                (scope, source),
+            ).fetchall()
+
+    def diff(self, scope, source, texts):
+        """比较文档新版本的文本块与清单，返回 DocumentDiff"""
+        hashes = [content_hash(text) for text in texts]
+        rows = self.rows(scope, source)
+        known = {row[1] for row in rows}
+        current = set(hashes)
+        added = [i for i, chunk_hash in enumerate(hashes) if chunk_hash not in known]
+        unchanged = [i for i, chunk_hash in enumerate(hashes) if chunk_hash in known]
+        removed = [(row_id, collection_id, chunk_id) for row_id, chunk_hash, collection_id, chunk_id in rows
+                   if chunk_hash not in current]
+        return DocumentDiff(source, hashes, added, unchanged, removed)
+
+    def add(self, scope, source, chunk_hash, collection_id, chunk_id):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO doc_chunks (scope, source, chunk_hash, collection_id, chunk_id) VALUES (?, ?, ?, ?, ?)",
+                (scope, source, chunk_hash, collection_id, chunk_id),
+            )
+            self._conn.commit()
+
+    def remove(self, row_ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM doc_chunks WHERE id = ?", [(row_id,) for row_id in row_ids])
+            self._conn.commit()
+
+    def shared_chunk_ids(self, scope, removed):
+        """返回 removed 中仍被其他清单行引用的 chunk_id（例如不同文本块生成了相同的QA对），这些远端 chunk 不应删除"""
+        row_ids = {row_id for row_id, _, _ in removed}
+        chunk_ids = {chunk_id for _, _, chunk_id in removed if chunk_id}
+        if not chunk_ids:
+            return set()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, chunk_id FROM doc_chunks WHERE scope = ? AND chunk_id IN ({','.join('?' * len(chunk_ids))})",
+                (scope, *chunk_ids),
+            ).fetchall()
+        return {chunk_id for row_id, chunk_id in rows if row_id not in row_ids}
@@ -0,0 +1,182 @@
+"""文档解析与分割：多进程并行解析上传文件，能直接读取字节的格式跳过临时文件
+
+进程池以 spawn 方式（Windows、macOS 的默认方式）启动子进程时，每个子进程都会重新导入本模块，
+因此本模块不能导入 Streamlit 或 AutoQAG，否则每个子进程都会加载一遍页面脚本。
+"""
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from typing import List
+
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import (
+    CSVLoader,
+    EverNoteLoader,
+    PyMuPDFLoader,
+    TextLoader,
+    UnstructuredEmailLoader,
+    UnstructuredEPubLoader,
+    UnstructuredHTMLLoader,
+    UnstructuredMarkdownLoader,
+    UnstructuredODTLoader,
+    UnstructuredPowerPointLoader,
+    UnstructuredWordDocumentLoader,
+)
+
+from chunking import TokenBudgetSplitter
+from metrics import REGISTRY
+
+CHUNK_SIZE = 2000
+CHUNK_OVERLAP = 500
+
+# Document loaders mapping
+LOADER_MAPPING = {
+    ".csv": (CSVLoader, {}),
+    ".doc": (UnstructuredWordDocumentLoader, {}),
+    ".docx": (UnstructuredWordDocumentLoader, {}),
+    ".enex": (EverNoteLoader, {}),
+    ".eml": (UnstructuredEmailLoader, {}),
+    ".epub": (UnstructuredEPubLoader, {}),
+    ".html": (UnstructuredHTMLLoader, {}),
+    ".md": (UnstructuredMarkdownLoader, {}),
+    ".odt": (UnstructuredODTLoader, {}),
+    ".pdf": (PyMuPDFLoader, {}),
+    ".ppt": (UnstructuredPowerPointLoader, {}),
+    ".pptx": (UnstructuredPowerPointLoader, {}),
+    ".txt": (TextLoader, {"encoding": "utf8"}),
+}
+
+
+def load_single_document(file_path: str) -> List[Document]:
+    """加载单个文档"""
+    ext = "." + file_path.rsplit(".", 1)[-1]
+    if ext in LOADER_MAPPING:
+        loader_class, loader_args = LOADER_MAPPING[ext]
+        loader = loader_class(file_path, **loader_args)
+        return loader.load()
+    raise ValueError(f"Unsupported file extension '{ext}'")
+
+
+def load_text_bytes(data: bytes, name: str) -> List[Document]:
+    """直接从字节加载文本文件"""
+    return [Document(page_content=data.decode("utf8"), metadata={"source": name})]
+
+
+def load_pdf_bytes(data: bytes, name: str) -> List[Document]:
+    """直接从字节加载 PDF，每页一个文档，元数据与 PyMuPDFLoader 一致"""
+    import fitz
+
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        doc_metadata = {k: v for k, v in doc.metadata.items() if isinstance(v, (str, int))}
+        return [
+            Document(
+                page_content=page.get_text(),
+                metadata={
+                    "source": name,
+                    "file_path": name,
+                    "page": page.number,
+                    "total_pages": len(doc),
+                    **doc_metadata,
+                },
+            )
+            for page in doc
+        ]
+
+
+# 可以直接读取内存数据的格式，其余格式仍需写入临时文件后交给 LOADER_MAPPING 中的加载器
+BYTES_LOADERS = {
+    ".txt": load_text_bytes,
+    ".pdf": load_pdf_bytes,
+}
+
+
+def load_document_bytes(name: str, data: bytes) -> List[Document]:
+    """从上传文件的字节内容加载文档，source 元数据统一为原始文件名"""
+    ext = os.path.splitext(name)[1].lower()
+    with REGISTRY.timer("autoqag_document_load_seconds", ext=ext):
+        return _load_document_bytes(name, data, ext)
+
+
+def _load_document_bytes(name, data, ext):
+    if ext in BYTES_LOADERS:
+        return BYTES_LOADERS[ext](data, name)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_file:
+        tmp_file.write(data)
+        tmp_file_path = tmp_file.name
+    try:
+        documents = load_single_document(tmp_file_path)
+    finally:
+        os.unlink(tmp_file_path)
+    for document in documents:
+        document.metadata["source"] = name
+    return documents
+
+
+@lru_cache(maxsize=None)
+def get_text_splitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """复用相同参数的文本分割器"""
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def get_splitter(mode="chars", chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """mode 为 "chars" 时按字符分割，为 "tokens" 时按Token预算分割（chunk_size/chunk_overlap 以Token计）"""
+    if mode == "tokens":
+        return TokenBudgetSplitter(chunk_size, chunk_overlap)
+    return get_text_splitter(chunk_size, chunk_overlap)
+
+
+def parse_file(name, data, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, mode="chars"):
+    """解析并分割单个文件，返回 (文本块列表, 错误信息)；文件没有内容时文本块为 None
+
+    在子进程中运行，异常转换为字符串返回，避免不可序列化的异常对象。
+    """
+    try:
+        documents = load_document_bytes(name, data)
+        if not documents:
+            return None, None
+        with REGISTRY.timer("autoqag_document_split_seconds", mode=mode):
+            text_chunks = get_splitter(mode, chunk_size, chunk_overlap).split_documents(documents)
+        REGISTRY.inc("autoqag_text_chunks_total", len(text_chunks), mode=mode)
+        return text_chunks, None
+    except Exception as e:
+        return None, str(e)
+
+
+def parse_file_with_metrics(name, data, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, mode="chars"):
+    """在子进程中调用 parse_file，返回 (parse_file 的结果, 本次记录的指标快照)，父进程用 REGISTRY.merge() 合并"""
+    result = parse_file(name, data, chunk_size, chunk_overlap, mode)
+    return result, REGISTRY.drain()
+
+
+def parse_files(files, max_workers=None, on_done=None, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, mode="chars"):
+    """并行解析多个文件，files 为 [(文件名, 字节内容)]，按输入顺序返回 [(文本块列表, 错误信息)]
+
+    on_done(index) 在调用线程中按完成顺序回调。max_workers 为 1 或只有一个文件时在当前进程中解析。
+    """
+    files = list(files)
+    results = [None] * len(files)
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers <= 1 or len(files) <= 1:
+        for i, (name, data) in enumerate(files):
+            results[i] = parse_file(name, data, chunk_size, chunk_overlap, mode)
+            if on_done is not None:
+                on_done(i)
+        return results
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(files))) as executor:
+        futures = {
+            executor.submit(parse_file_with_metrics, name, data, chunk_size, chunk_overlap, mode): i
+            for i, (name, data) in enumerate(files)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i], snapshot = future.result()
+                REGISTRY.merge(snapshot)
+            except Exception as e:
+                # 子进程异常退出等情况
+                results[i] = (None, str(e))
+            if on_done is not None:
+                on_done(i)
+    return results
@@ -0,0 +1,261 @@
+"""Collection 与QA对导出
+
+- Collection：按最大页长分页，并发获取 chunk 详情，逐条流式写入
+- 输出格式：JSONL、gzip 压缩的 JSONL、Parquet（需要 pyarrow）；可拆分为多个分片文件，
+  每个分片由独立线程序列化、压缩和写入，记录按批次经有界队列分发，内存占用与数据总量无关
+"""
+import gzip
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ingest import get_session, request_with_retry
+from metrics import REGISTRY
+
+# TaskingAI 列表接口 limit 参数允许的最大值
+MAX_PAGE_SIZE = 100
+DEFAULT_MAX_WORKERS = 8
+EXPORT_FIELDS = (
+    "chunk_id",
+    "record_id",
+    "collection_id",
+    "content",
+    "num_tokens",
+    "metadata",
+    "updated_timestamp",
+    "created_timestamp",
+)
+EXPORT_FORMATS = ("jsonl", "jsonl.gz", "parquet")
+EXPORT_BATCH_SIZE = 1000
+# 每个分片写入线程最多排队的批次数
+WRITER_QUEUE_SIZE = 2
+# 各字段在 Parquet 中的类型，未列出的字段按字符串写入，字典和列表序列化为 JSON 字符串
+CHUNK_EXPORT_TYPES = {"num_tokens": "int64", "updated_timestamp": "int64", "created_timestamp": "int64"}
+QA_EXPORT_FIELDS = ("question", "answer", "chunk", "chunk_hash", "source", "page", "metadata")
+QA_EXPORT_TYPES = {"page": "int64"}
+
+
+def to_export_record(chunk):
+    """提取导出所需的字段"""
+    record = {field: chunk.get(field) for field in EXPORT_FIELDS}
+    record["metadata"] = chunk.get("metadata", {})
+    return record
+
+
+class CollectionExporter:
+    """分页读取 Collection 中的所有 chunk"""
+
+    def __init__(self, base_url, headers, page_size=MAX_PAGE_SIZE, max_workers=DEFAULT_MAX_WORKERS, session=None):
+        self.base_url = base_url
+        self.headers = headers
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.session = session or get_session(max_workers)
+
+    def _get(self, url, **kwargs):
+        response, _ = request_with_retry(self.session, "GET", url, headers=self.headers, timeout=60, **kwargs)
+        return response.json().get("data")
+
+    def list_page(self, collection_id, after=None):
+        """获取一页 chunk 列表"""
+        params = {"limit": self.page_size, "order": "desc"}
+        if after:
+            params["after"] = after
+        with REGISTRY.timer("autoqag_chunk_read_seconds", op="list"):
+            page = self._get(f"{self.base_url}collections/{collection_id}/chunks", params=params) or []
+        REGISTRY.inc("autoqag_chunks_read_total", len(page))
+        return page
+
+    def get_details(self, collection_id, chunk_id):
+        """获取单个 chunk 的详情"""
+        with REGISTRY.timer("autoqag_chunk_read_seconds", op="detail"):
+            return self._get(f"{self.base_url}collections/{collection_id}/chunks/{chunk_id}")
+
+    def iter_chunks(self, collection_id):
+        """逐条产出 chunk；列表结果已包含内容时不再请求详情，否则在有界线程池中并发获取
+
+        每次列表和详情请求的耗时记入 autoqag_chunk_read_seconds（失败时累加 autoqag_chunk_read_errors_total）。
+        """
+        after = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                page = self.list_page(collection_id, after=after)
+                if not page:
+                    return
+                if all("content" in chunk for chunk in page):
+                    details = page
+                else:
+                    details = executor.map(lambda chunk: self.get_details(collection_id, chunk["chunk_id"]), page)
+                for chunk in details:
+                    if chunk:
+                        yield chunk
+                if len(page) < self.page_size:
+                    return
+                after = page[-1]["chunk_id"]
+
+    def export_jsonl(self, collection_id, path, on_progress=None):
+        """将 Collection 流式写入 JSONL 文件（先写临时文件，完成后替换），返回写入条数
+
+        on_progress(count) 在每写完一页后回调。
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.part"
+        count = 0
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for chunk in self.iter_chunks(collection_id):
+                f.write(json.dumps(to_export_record(chunk), ensure_ascii=False) + "\n")
+                count += 1
+                if on_progress is not None and count % self.page_size == 0:
+                    on_progress(count)
+        os.replace(tmp_path, path)
+        if on_progress is not None:
+            on_progress(count)
+        return count
+
+    def export(self, collection_id, out_dir, name, fmt="jsonl.gz", shards=1, on_progress=None):
+        """将 Collection 导出为 fmt 格式的 shards 个分片文件，返回 (写入条数, 文件路径列表)"""
+        return export_records(
+            (to_export_record(chunk) for chunk in self.iter_chunks(collection_id)),
+            out_dir, name, fmt=fmt, shards=shards, fields=EXPORT_FIELDS, types=CHUNK_EXPORT_TYPES,
+            on_progress=on_progress,
+        )
+
+
+def qa_export_record(qa_pair, chunk_hash=None, metadata=None):
+    """QA对的导出记录，附带原文文本块的哈希、来源文件、页码及其他元数据"""
+    metadata = metadata or {}
+    return {
+        "question": qa_pair["question"],
+        "answer": qa_pair["answer"],
+        "chunk": qa_pair["chunk"],
+        "chunk_hash": chunk_hash,
+        "source": metadata.get("source"),
+        "page": metadata.get("page"),
+        "metadata": metadata,
+    }
+
+
+class JsonlWriter:
+    """逐批写入 JSONL，compress 为 True 时写入 gzip 压缩文件"""
+
+    def __init__(self, path, compress=False):
+        self._file = gzip.open(path, "wt", encoding="utf-8") if compress else open(path, "w", encoding="utf-8")
+
+    def write_batch(self, records):
+        self._file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """逐批写入 Parquet，每批一个行组；fields 为字段名列表，types 为 {字段名: pyarrow 类型名}"""
+
+    def __init__(self, path, fields, types=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError(f"导出 Parquet 需要安装 pyarrow: {e}") from e
+        types = types or {}
+        self._pa = pa
+        self._fields = list(fields)
+        self._schema = pa.schema([(field, getattr(pa, types.get(field, "string"))()) for field in self._fields])
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write_batch(self, records):
+        columns = {
+            field: [json.dumps(record.get(field), ensure_ascii=False) if isinstance(record.get(field), (dict, list))
+                    else record.get(field) for record in records]
+            for field in self._fields
+        }
+        self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def open_writer(path, fmt, fields=EXPORT_FIELDS, types=None):
+    if fmt == "parquet":
+        return ParquetWriter(path, fields, types)
+    if fmt in ("jsonl", "jsonl.gz"):
+        return JsonlWriter(path, compress=fmt == "jsonl.gz")
+    raise ValueError(f"不支持的导出格式: {fmt}")
+
+
+def shard_paths(out_dir, name, fmt, shards):
+    """分片文件路径：单个分片为 <name>.<fmt>，多个分片为 <name>-00000-of-00004.<fmt>"""
+    if shards <= 1:
+        return [os.path.join(out_dir, f"{name}.{fmt}")]
+    return [os.path.join(out_dir, f"{name}-{i:05d}-of-{shards:05d}.{fmt}") for i in range(shards)]
+
+
+def export_records(records, out_dir, name, fmt="jsonl.gz", shards=1, fields=EXPORT_FIELDS, types=None,
+                   batch_size=EXPORT_BATCH_SIZE, on_progress=None):
+    """把 records 流式写入 shards 个分片文件，返回 (写入条数, 文件路径列表)
+
+    记录按批次轮流分发给各分片的写入线程；全部写完后才把临时文件替换为正式文件，
+    出错时删除临时文件并抛出异常。on_progress(count) 在每分发一批后回调。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = shard_paths(out_dir, name, fmt, shards)
+    queues = [queue.Queue(maxsize=WRITER_QUEUE_SIZE) for _ in paths]
+    errors = []
+
+    def write_shard(path, batches):
+        try:
+            writer = open_writer(f"{path}.part", fmt, fields, types)
+            try:
+                while True:
+                    batch = batches.get()
+                    if batch is None:
+                        return
+                    writer.write_batch(batch)
+            finally:
+                writer.close()
+        except Exception as e:
+            errors.append(e)
+            # 继续取走剩余批次，避免分发线程在已满的队列上阻塞
+            while batches.get() is not None:
+                pass
+
+    threads = [threading.Thread(target=write_shard, args=(path, batches), daemon=True)
+               for path, batches in zip(paths, queues)]
+    for thread in threads:
+        thread.start()
+    count = 0
+    batch = []
+    shard = 0
+    try:
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                queues[shard].put(batch)
+                shard = (shard + 1) % len(queues)
+                count += len(batch)
+                batch = []
+                if on_progress is not None:
+                    on_progress(count)
+        if batch:
+            queues[shard].put(batch)
+            count += len(batch)
+    except BaseException as e:
+        # 读取记录出错或被取消时同样删除临时文件
+        errors.insert(0, e)
+    finally:
+        for batches in queues:
+            batches.put(None)
+        for thread in threads:
+            thread.join()
+    if errors:
+        for path in paths:
+            if os.path.exists(f"{path}.part"):
+                os.remove(f"{path}.part")
+        raise errors[0]
+    for path in paths:
+        os.replace(f"{path}.part", path)
+    if on_progress is not None:
+        on_progress(count)
+    return count, paths
@@ -0,0 +1,198 @@
+"""TaskingAI chunk 批量导入：连接池复用、并行写入、429/5xx 指数退避重试、逐条结果报告"""
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from llm_pool import run_ordered
+from metrics import REGISTRY
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_RETRIES = 5
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def create_session(pool_size=DEFAULT_MAX_WORKERS):
+    """创建带连接池的 Session，连接数不少于并行写入数，保证 TCP/TLS 连接被复用"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session(pool_size=DEFAULT_MAX_WORKERS):
+    """按连接池大小复用进程内共享的 Session"""
+    with _sessions_lock:
+        session = _sessions.get(pool_size)
+        if session is None:
+            session = create_session(pool_size)
+            _sessions[pool_size] = session
+        return session
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """第 attempt 次重试前的等待时间：指数退避 + 全抖动"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def request_with_retry(session, method, url, max_retries=DEFAULT_MAX_RETRIES, backoff_base=0.5, **kwargs):
+    """发送请求，遇到连接错误或 429/5xx 时退避重试，返回 (response, 尝试次数)
+
+    重试用尽或遇到其他错误状态码时抛出 requests.RequestException。
+    """
+    attempt = 0
+    while True:
+        try:
+            response = session.request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= max_retries:
+                response.raise_for_status()
+                return response, attempt + 1
+            retry_after = response.headers.get("Retry-After")
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else backoff_delay(attempt, backoff_base)
+        except requests.RequestException as e:
+            if isinstance(e, requests.HTTPError) or attempt >= max_retries or not isinstance(
+                    e, (requests.ConnectionError, requests.Timeout)):
+                e.attempts = attempt + 1
+                raise
+            delay = backoff_delay(attempt, backoff_base)
+        time.sleep(delay)
+        attempt += 1
+
+
+class IngestReport:
+    """一次导入的汇总与逐条结果"""
+
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.elapsed = elapsed
+        self.success_count = sum(1 for result in results if result["ok"])
+        self.fail_count = len(results) - self.success_count
+        self.skipped_count = sum(1 for result in results if result.get("skipped"))
+        self.updated_count = sum(1 for result in results if result["ok"] and result.get("updated"))
+
+    @property
+    def records_per_second(self):
+        return len(self.results) / self.elapsed if self.elapsed > 0 else 0.0
+
+    def failures(self):
+        return [result for result in self.results if not result["ok"]]
+
+
+class ChunkIngestor:
+    """并行向 Collection 写入 chunk
+
+    TaskingAI 的 chunk 接口每次只能创建一条记录，没有批量写入端点，
+    因此这里通过共享连接池上的并行请求来提高吞吐。
+    """
+
+    def __init__(self, base_url, headers, max_workers=DEFAULT_MAX_WORKERS, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_base=0.5, timeout=60, session=None):
+        self.base_url = base_url
+        self.headers = headers
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+        self.session = session or get_session(max_workers)
+
+    def create_chunk(self, collection_id, content):
+        """创建单个 chunk，返回 (接口返回的 data, 尝试次数)"""
+        with REGISTRY.timer("autoqag_chunk_write_seconds", op="create"):
+            response, attempts = request_with_retry(
+                self.session,
+                "POST",
+                f"{self.base_url}collections/{collection_id}/chunks",
+                max_retries=self.max_retries,
+                backoff_base=self.backoff_base,
+                headers=self.headers,
+                json={"collection_id": collection_id, "content": content},
+                timeout=self.timeout,
+            )
+        return response.json()["data"], attempts
+
+    def update_chunk(self, collection_id, chunk_id, content):
+        """更新已有 chunk 的内容，返回 (接口返回的 data, 尝试次数)"""
+        with REGISTRY.timer("autoqag_chunk_write_seconds", op="update"):
+            response, attempts = request_with_retry(
+                self.session,
+                "POST",
+                f"{self.base_url}collections/{collection_id}/chunks/{chunk_id}",
+                max_retries=self.max_retries,
+                backoff_base=self.backoff_base,
+                headers=self.headers,
+                json={"content": content},
+                timeout=self.timeout,
+            )
+        return response.json()["data"], attempts
+
+    def delete_chunk(self, collection_id, chunk_id):
+        """删除 chunk，返回尝试次数；chunk 已不存在时视为成功"""
+        with REGISTRY.timer("autoqag_chunk_write_seconds", op="delete"):
+            try:
+                _, attempts = request_with_retry(
+                    self.session,
+                    "DELETE",
+                    f"{self.base_url}collections/{collection_id}/chunks/{chunk_id}",
+                    max_retries=self.max_retries,
+                    backoff_base=self.backoff_base,
+                    headers=self.headers,
+                    timeout=self.timeout,
+                )
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code != 404:
+                    raise
+                attempts = getattr(e, "attempts", 1)
+        return attempts
+
+    def _ingest_one(self, item):
+        index, collection_id, content, chunk_id = item
+        try:
+            if chunk_id is None:
+                chunk, attempts = self.create_chunk(collection_id, content)
+            else:
+                chunk, attempts = self.update_chunk(collection_id, chunk_id, content)
+            return {"index": index, "ok": True, "chunk": chunk, "chunk_id": chunk.get("chunk_id", chunk_id),
+                    "collection_id": collection_id, "attempts": attempts, "error": None,
+                    "updated": chunk_id is not None}
+        except (requests.RequestException, ValueError, KeyError) as e:
+            return {"index": index, "ok": False, "chunk": None, "chunk_id": None,
+                    "collection_id": collection_id, "attempts": getattr(e, "attempts", 1), "error": str(e)}
+
+    def ingest(self, collection_id, contents, on_result=None):
+        """并行写入 contents 中的每条内容，返回 IngestReport
+
+        on_result(index, result) 在调用线程中按完成顺序回调，可用于更新进度条。
+        """
+        return self.ingest_routed([(collection_id, content) for content in contents], on_result=on_result)
+
+    def ingest_routed(self, items, on_result=None):
+        """并行写入 [(collection_id, content)]，不同条目可以写入不同的 Collection，返回 IngestReport
+
+        条目为 (collection_id, content, chunk_id) 且 chunk_id 不为 None 时更新已有 chunk 而不是新建。
+        """
+        start = time.perf_counter()
+        items = list(items)
+        unexpected = {}
+
+        def on_done(i, result, error):
+            if error is not None:
+                result = unexpected[i] = {"index": i, "ok": False, "chunk": None, "chunk_id": None,
+                                          "collection_id": items[i][0], "attempts": 0, "error": str(error)}
+            if on_result is not None:
+                on_result(i, result)
+
+        results = run_ordered(
+            self._ingest_one,
+            [(i, item[0], item[1], item[2] if len(item) > 2 else None) for i, item in enumerate(items)],
+            max_workers=self.max_workers,
+            on_done=on_done,
+        )
+        for i, result in unexpected.items():
+            results[i] = result
+        return IngestReport(results, time.perf_counter() - start)
@@ -0,0 +1,422 @@
+"""后台任务：解析、生成、插入、导出和导入在工作线程中运行，不阻塞 Streamlit 脚本线程
+
+任务记录保存在 SQLite 任务表中（参数、状态、进度、结果），页面重新运行或刷新后仍可查询和取消。
+每类任务可限制同时运行的数量，每个任务可单独限制内部并发数和运行时长。
+任务记录所属进程的 PID，运行中的任务定期写入心跳；多个进程可以共用一个任务表，
+启动调度器时只把所属进程已退出或心跳超时的运行中任务标记为失败，并接手这些进程留下的排队任务。
+"""
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_JOB_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "jobs.sqlite3")
+DEFAULT_JOB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "jobs")
+DEFAULT_MAX_JOBS = 4
+# 进度写入任务表的最小间隔（秒）
+PROGRESS_INTERVAL = 0.5
+# 运行中任务写心跳、检查取消请求和运行时长上限的间隔（秒），以及心跳超过多久未更新视为所属进程已中断
+HEARTBEAT_INTERVAL = 2
+HEARTBEAT_TIMEOUT = 30
+# 任务被取消或超时后，等待处理函数自行停止的最长时间（秒），超过后不再等待、直接结束任务
+CANCEL_GRACE = 10
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """任务被取消或超过运行时长上限"""
+
+
+def pid_alive(pid):
+    """pid 对应的其他进程是否仍在运行（本进程的 PID 视为已退出：本进程的调度器刚刚创建，不会有遗留任务）"""
+    if not pid or pid == os.getpid():
+        return False
+    if os.name == "nt":
+        # Windows 上 os.kill 会结束目标进程，只能依靠心跳判断
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """任务表：每行一个任务，params/limits/result 以 JSON 保存"""
+
+    COLUMNS = ("id", "kind", "name", "status", "params", "limits", "inputs", "done", "total", "message", "result",
+               "error", "cancel_requested", "created_at", "started_at", "finished_at", "owner_pid", "heartbeat_at")
+
+    def __init__(self, path=DEFAULT_JOB_DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT, name TEXT, status TEXT, params TEXT, limits TEXT, inputs TEXT, "
+            "done INTEGER DEFAULT 0, total INTEGER, message TEXT, result TEXT, error TEXT, "
+            "cancel_requested INTEGER DEFAULT 0, created_at REAL, started_at REAL, finished_at REAL, "
+            "owner_pid INTEGER, heartbeat_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created_at)")
+        self._conn.commit()
+
+    def _row(self, row):
+        job = dict(zip(self.COLUMNS, row))
+        for key in ("params", "limits", "inputs", "result"):
+            job[key] = json.loads(job[key]) if job[key] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def insert(self, job_id, kind, name, params, limits, inputs):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, name, status, params, limits, inputs, created_at, owner_pid) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, name, QUEUED, json.dumps(params, ensure_ascii=False), json.dumps(limits),
+                 json.dumps(inputs, ensure_ascii=False), time.time(), os.getpid()),
+            )
+            self._conn.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def list(self, limit=50, statuses=None):
+        """按提交时间倒序返回最近的任务"""
+        sql = f"SELECT {', '.join(self.COLUMNS)} FROM jobs"
+        params = []
+        if statuses:
+            sql += f" WHERE status IN ({','.join('?' * len(statuses))})"
+            params.extend(statuses)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(sql, (*params, limit)).fetchall()
+        return [self._row(row) for row in rows]
+
+    def update(self, job_id, **fields):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"], ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{key} = ?' for key in fields)} WHERE id = ?", (*fields.values(), job_id)
+            )
+            self._conn.commit()
+
+    def mark_started(self, job_id):
+        """排队中的任务标记为由本进程运行，任务已被取消或已被其他进程启动时返回 False"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, owner_pid = ?, heartbeat_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, now, os.getpid(), now, job_id, QUEUED),
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def finish(self, job_id, status, **fields):
+        """结束运行中的任务；任务已被其他进程判定为中断而结束时不覆盖，返回是否更新"""
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"], ensure_ascii=False)
+        fields.update(status=status, finished_at=time.time())
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{key} = ?' for key in fields)} WHERE id = ? AND status = ?",
+                (*fields.values(), job_id, RUNNING),
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def heartbeat(self, job_ids):
+        """更新运行中任务的心跳，返回其中已被请求取消的任务 ID（可能由其他进程请求）"""
+        if not job_ids:
+            return set()
+        marks = ",".join("?" * len(job_ids))
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET heartbeat_at = ? WHERE status = ? AND id IN ({marks})",
+                               (time.time(), RUNNING, *job_ids))
+            self._conn.commit()
+            rows = self._conn.execute(f"SELECT id FROM jobs WHERE cancel_requested = 1 AND id IN ({marks})",
+                                      job_ids).fetchall()
+        return {row[0] for row in rows}
+
+    @staticmethod
+    def orphaned(job, stale_after=HEARTBEAT_TIMEOUT):
+        """运行中的任务是否已无人运行：所属进程已退出，或心跳超过 stale_after 秒未更新"""
+        return not pid_alive(job["owner_pid"]) or (job["heartbeat_at"] or 0) < time.time() - stale_after
+
+    def recover(self, stale_after=HEARTBEAT_TIMEOUT):
+        """启动调度器时调用：把已无人运行的运行中任务标记为失败，返回可由本进程接手的排队任务 ID（按提交顺序）
+
+        其他仍在运行的进程的运行中任务和排队任务不受影响，由这些进程继续执行。
+        """
+        running = self.list(limit=-1, statuses=(RUNNING,))
+        for job in running:
+            if self.orphaned(job, stale_after):
+                self.finish(job["id"], FAILED, error="所属进程已退出或失去响应，任务中断")
+        queued = self.list(limit=-1, statuses=(QUEUED,))
+        return [job["id"] for job in reversed(queued) if not pid_alive(job["owner_pid"])]
+
+    def delete(self, job_ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in job_ids])
+            self._conn.commit()
+
+
+class JobContext:
+    """传给任务处理函数的运行上下文
+
+    limits 为任务的资源限制（如 max_workers、timeout），inputs 为提交时附带的输入文件路径，work_dir 为任务的工作目录。
+    处理函数用 progress() 报告进度，并在可以安全中止的位置（如一页记录写完并登记索引之后）调用 check_cancelled()，
+    任务被取消或超时时由其抛出 JobCancelled；cancel_event 在取消时同时被设置，可传给 run_ordered 等支持取消的函数。
+    """
+
+    def __init__(self, store, job, work_dir):
+        self.job_id = job["id"]
+        self.limits = job["limits"] or {}
+        self.inputs = job["inputs"] or []
+        self.work_dir = work_dir
+        self.cancel_event = threading.Event()
+        self._store = store
+        timeout = self.limits.get("timeout")
+        self._deadline = time.monotonic() + timeout if timeout else None
+        self._reason = None
+        self._flushed = 0.0
+        self.timed_out = False
+        self.cancelled_at = None
+        self.abandoned = False
+
+    @property
+    def reason(self):
+        return self._reason or "任务已取消"
+
+    def cancel(self, reason="任务已取消"):
+        self._reason = self._reason or reason
+        if self.cancelled_at is None:
+            self.cancelled_at = time.monotonic()
+        self.cancel_event.set()
+
+    def check_deadline(self):
+        """超过运行时长上限时取消任务（不抛出异常），调度器在处理函数阻塞期间也会定期调用"""
+        if self._deadline is not None and time.monotonic() > self._deadline and not self.cancel_event.is_set():
+            self.timed_out = True
+            self.cancel(f"超过运行时长上限 {self.limits['timeout']} 秒")
+
+    def check_cancelled(self):
+        self.check_deadline()
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.reason)
+
+    def progress(self, done, total=None, message=None):
+        """记录进度，按 PROGRESS_INTERVAL 节流写入任务表；任务已被调度器放弃后不再写入"""
+        if self.abandoned:
+            return
+        now = time.monotonic()
+        if now - self._flushed >= PROGRESS_INTERVAL or (total is not None and done >= total):
+            self._flushed = now
+            fields = {"done": done}
+            if total is not None:
+                fields["total"] = total
+            if message is not None:
+                fields["message"] = message
+            self._store.update(self.job_id, **fields)
+
+
+class JobScheduler:
+    """在有界线程池中运行任务
+
+    handlers 为 {任务类型: handler(ctx, **params)}，返回值（须可 JSON 序列化）保存为任务结果。
+    max_jobs 为同时运行的任务总数上限，kind_limits 为 {任务类型: 同时运行数上限}，未列出的类型只受总数限制。
+    处理函数在单独的线程中运行，调度线程每隔 heartbeat_interval 秒写心跳、检查取消请求和运行时长上限；
+    处理函数阻塞在网络请求等位置、取消或超时后 cancel_grace 秒内仍未停止时，任务直接结束，
+    处理函数的线程在阻塞调用返回后自行退出，其结果被丢弃；该线程退出前仍占用任务总数和所属类型的名额。
+    """
+
+    def __init__(self, store, handlers, max_jobs=DEFAULT_MAX_JOBS, kind_limits=None, job_dir=DEFAULT_JOB_DIR,
+                 heartbeat_interval=HEARTBEAT_INTERVAL, cancel_grace=CANCEL_GRACE):
+        self.store = store
+        self.handlers = dict(handlers)
+        self.max_jobs = max_jobs
+        self.kind_limits = dict(kind_limits or {})
+        self.job_dir = job_dir
+        self.heartbeat_interval = heartbeat_interval
+        self.cancel_grace = cancel_grace
+        self._lock = threading.Lock()
+        self._pending = []
+        self._running = {}
+        self._abandoned = {}  # 已结束但处理函数线程仍在运行的任务 -> 任务类型
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="autoqag-job")
+        for job_id in store.recover():
+            job = store.get(job_id)
+            self._pending.append((job_id, job["kind"]))
+        self._dispatch()
+
+    def submit(self, kind, params=None, name=None, limits=None, inputs=None):
+        """提交任务，返回任务 ID
+
+        inputs 为 [(文件名, 内容)]，内容为 bytes，或接收目标路径、把文件写到该路径的函数（如 QASessionStore.backup）；
+        输入文件保存到任务目录后以路径列表提供给处理函数，归任务所有，删除任务时一并删除。
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"未知的任务类型: {kind}")
+        job_id = uuid.uuid4().hex
+        paths = []
+        if inputs:
+            input_dir = os.path.join(self.job_dir, job_id, "inputs")
+            os.makedirs(input_dir, exist_ok=True)
+            for i, (file_name, data) in enumerate(inputs):
+                # 加序号前缀，避免同名文件互相覆盖
+                path = os.path.join(input_dir, f"{i:04d}_{os.path.basename(file_name)}")
+                if callable(data):
+                    data(path)
+                else:
+                    with open(path, "wb") as f:
+                        f.write(data)
+                paths.append(path)
+        self.store.insert(job_id, kind, name or kind, params or {}, limits or {}, paths)
+        with self._lock:
+            self._pending.append((job_id, kind))
+        self._dispatch()
+        return job_id
+
+    def cancel(self, job_id):
+        """取消任务：排队中的任务直接取消，运行中的任务在处理函数下一次检查取消时停止
+
+        由其他进程运行的任务只记录取消请求，由该进程在下一次写心跳时取消；该进程已退出时直接取消。
+        """
+        with self._lock:
+            self._pending = [(pending_id, kind) for pending_id, kind in self._pending if pending_id != job_id]
+            ctx, _ = self._running.get(job_id, (None, None))
+        job = self.store.get(job_id)
+        if job is None or job["status"] in FINISHED_STATES:
+            return
+        if ctx is not None:
+            self.store.update(job_id, cancel_requested=1)
+            ctx.cancel()
+        elif job["status"] == RUNNING and not self.store.orphaned(job):
+            self.store.update(job_id, cancel_requested=1)
+        elif job["status"] == RUNNING:
+            self.store.finish(job_id, CANCELLED, cancel_requested=1)
+        else:
+            self.store.update(job_id, status=CANCELLED, finished_at=time.time())
+
+    def running(self):
+        with self._lock:
+            return list(self._running)
+
+    def remove(self, job_ids):
+        """删除已结束的任务记录及其任务目录"""
+        finished = []
+        for job_id in job_ids:
+            job = self.store.get(job_id)
+            if job is not None and job["status"] in FINISHED_STATES:
+                finished.append(job_id)
+                shutil.rmtree(os.path.join(self.job_dir, job_id), ignore_errors=True)
+        self.store.delete(finished)
+
+    def _dispatch(self):
+        """按提交顺序启动排队任务，跳过所属类型已达同时运行数上限的任务"""
+        with self._lock:
+            kinds = {}
+            for kind in [kind for _, kind in self._running.values()] + list(self._abandoned.values()):
+                kinds[kind] = kinds.get(kind, 0) + 1
+            started = []
+            for job_id, kind in self._pending:
+                if len(self._running) + len(self._abandoned) + len(started) >= self.max_jobs:
+                    break
+                limit = self.kind_limits.get(kind)
+                if limit is not None and kinds.get(kind, 0) >= limit:
+                    continue
+                kinds[kind] = kinds.get(kind, 0) + 1
+                started.append((job_id, kind))
+            for job_id, kind in started:
+                self._pending.remove((job_id, kind))
+                job = self.store.get(job_id)
+                if job is None or not self.store.mark_started(job_id):
+                    continue
+                ctx = JobContext(self.store, job, os.path.join(self.job_dir, job_id))
+                self._running[job_id] = (ctx, kind)
+                self._executor.submit(self._run, ctx, job)
+
+    def _run(self, ctx, job):
+        os.makedirs(ctx.work_dir, exist_ok=True)
+        outcome = {}
+        finished = threading.Event()
+
+        def target():
+            try:
+                outcome["result"] = self.handlers[job["kind"]](ctx, **job["params"])
+            except BaseException as e:
+                outcome["error"] = e
+                outcome["traceback"] = traceback.format_exc(limit=5)
+            finally:
+                finished.set()
+                with self._lock:
+                    released = self._abandoned.pop(job["id"], None) is not None
+                if released:
+                    self._dispatch()
+
+        try:
+            threading.Thread(target=target, name=f"autoqag-job-{job['id'][:8]}", daemon=True).start()
+            while not finished.wait(self.heartbeat_interval):
+                if self.store.heartbeat([job["id"]]):
+                    ctx.cancel()
+                ctx.check_deadline()
+                if ctx.cancelled_at is not None and time.monotonic() - ctx.cancelled_at > self.cancel_grace:
+                    ctx.abandoned = True
+                    break
+            self._finish(ctx, job, outcome)
+        finally:
+            with self._lock:
+                _, kind = self._running.pop(job["id"])
+                if not finished.is_set():
+                    # 处理函数线程退出时才释放名额
+                    self._abandoned[job["id"]] = kind
+            self._dispatch()
+
+    def _finish(self, ctx, job, outcome):
+        # 超时视为失败，用户取消视为已取消
+        cancelled_status = FAILED if ctx.timed_out else CANCELLED
+        if ctx.abandoned:
+            self.store.finish(job["id"], cancelled_status,
+                              error=f"{ctx.reason}（处理函数 {self.cancel_grace} 秒内未停止，已不再等待）")
+        elif "error" not in outcome:
+            self.store.finish(job["id"], SUCCEEDED, result=outcome["result"])
+        elif isinstance(outcome["error"], JobCancelled):
+            self.store.finish(job["id"], cancelled_status, error=str(outcome["error"]))
+        else:
+            # 处理函数在回调中检测到取消时，JobCancelled 可能被包装成其他异常
+            status = cancelled_status if ctx.cancel_event.is_set() else FAILED
+            self.store.finish(job["id"], status, error=f"{outcome['error']}\n{outcome['traceback']}")
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(handlers, path=DEFAULT_JOB_DB_PATH, max_jobs=DEFAULT_MAX_JOBS, kind_limits=None,
+                  job_dir=DEFAULT_JOB_DIR):
+    """获取进程内共享的调度器（每个任务表一个）
+
+    Streamlit 每次重新运行脚本都会调用：调度器只在首次调用时创建，之后只更新处理函数，新提交的任务使用最新的处理函数。
+    """
+    with _schedulers_lock:
+        scheduler = _schedulers.get(path)
+        if scheduler is None:
+            scheduler = _schedulers[path] = JobScheduler(JobStore(path), handlers, max_jobs=max_jobs,
+                                                         kind_limits=kind_limits, job_dir=job_dir)
+        else:
+            scheduler.handlers.update(handlers)
+        return scheduler
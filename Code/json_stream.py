@@ -0,0 +1,180 @@
+"""流式读取大型 JSON / JSONL 导入文件，内存占用只与单条记录大小有关
+
+支持的格式：
+    {"chunks": [{...}, ...]}       Collection 导出文件
+    {"qa_pairs": [{...}, ...]}     QA 对文件
+    [{...}, ...]                    记录数组
+    每行一个 JSON 对象的 JSONL 文件（只有一个不含记录键的对象时视为单行 JSONL）
+
+每条记录都必须是 JSON 对象，记录键的值必须是数组，否则抛出 ValueError。
+"""
+import codecs
+import json
+
+RECORD_KEYS = ("chunks", "qa_pairs")
+READ_SIZE = 1 << 16
+WHITESPACE = " \t\r\n"
+
+
+class JsonRecordStream:
+    """逐条产出记录的迭代器
+
+    layout 在开始迭代后可用（"chunks" / "qa_pairs" / "array" / "jsonl"），
+    bytes_read 为已读取的字节数，可结合文件大小计算进度，records 为已产出的记录数。
+    """
+
+    def __init__(self, fileobj, keys=RECORD_KEYS, read_size=READ_SIZE):
+        self.fileobj = fileobj
+        self.keys = keys
+        self.read_size = read_size
+        self.layout = None
+        self.bytes_read = 0
+        self.records = 0
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._buf = ""
+        self._pos = 0
+        self._anchor = None
+        self._eof = False
+
+    # ---- 缓冲区 ----
+
+    def _fill(self):
+        """读取更多数据，到达文件末尾时返回 False"""
+        if self._eof:
+            return False
+        data = self.fileobj.read(self.read_size)
+        if isinstance(data, bytes):
+            self.bytes_read += len(data)
+            text = self._text_decoder.decode(data, final=not data)
+        else:
+            self.bytes_read += len(data.encode("utf-8"))
+            text = data
+        if not data:
+            self._eof = True
+        # 丢弃已消费的数据；设置了 _anchor 时保留其后的内容以便回退
+        cut = self._pos if self._anchor is None else self._anchor
+        if cut > self.read_size:
+            self._buf = self._buf[cut:]
+            self._pos -= cut
+            if self._anchor is not None:
+                self._anchor -= cut
+        self._buf += text
+        return bool(data)
+
+    def _peek(self):
+        """跳过空白并返回下一个字符，文件结束时返回空字符串"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char not in chars:
+            raise ValueError(f"JSON 格式错误：位置 {self.bytes_read} 附近应为 {chars!r}，实际为 {char!r}")
+        self._pos += 1
+        return char
+
+    def _decode_value(self):
+        """解码当前位置的一个完整 JSON 值，数据不足时继续读取"""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # 数字等值可能恰好在缓冲区末尾被截断，需读到后续字符才能确认完整
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    def _decode_record(self):
+        record = self._decode_value()
+        self.records += 1
+        if not isinstance(record, dict):
+            raise ValueError(f"第 {self.records} 条记录不是 JSON 对象，实际为 {type(record).__name__}")
+        return record
+
+    # ---- 迭代 ----
+
+    def __iter__(self):
+        first = self._peek()
+        if first == "[":
+            self.layout = "array"
+            self._pos += 1
+            yield from self._iter_array()
+        elif first == "{":
+            yield from self._iter_object_or_lines()
+        elif first:
+            raise ValueError(f"无法识别的文件格式，首字符为 {first!r}")
+
+    def _iter_array(self):
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self._decode_record()
+            if self._expect(",]") == "]":
+                return
+
+    def _iter_object_or_lines(self):
+        # 判断是包含记录数组的大对象，还是 JSONL 的第一行：
+        # 逐个读取顶层键，遇到记录键就开始流式读取数组；若对象先结束则按 JSONL 处理。
+        self._anchor = self._pos
+        self._pos += 1
+        while self._peek() != "}":
+            key = self._decode_value()
+            self._expect(":")
+            if key in self.keys:
+                if self._peek() != "[":
+                    self._anchor = None
+                    raise ValueError(f"{key!r} 键的值应为记录数组，实际为 {type(self._decode_value()).__name__}")
+                self.layout = key
+                self._anchor = None
+                self._pos += 1
+                yield from self._iter_array()
+                return
+            self._decode_value()
+            if self._expect(",}") == "}":
+                break
+        else:
+            self._pos += 1
+        # 回退前保持 _anchor，避免 _peek 读取更多数据时把第一行从缓冲区中丢弃
+        if self._peek() in ("{", ""):
+            self.layout = "jsonl"
+            self._pos, self._anchor = self._anchor, None
+            yield from self._iter_lines()
+        else:
+            self._anchor = None
+            raise ValueError(f"JSON 文件中缺少 {' 或 '.join(repr(key) for key in self.keys)} 键。")
+
+    def _iter_lines(self):
+        while self._peek():
+            yield self._decode_record()
+
+
+def iter_batches(records, batch_size):
+    """将记录迭代器按 batch_size 分批"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def record_content(record):
+    """从导入记录中取出写入 chunk 的内容：chunk 记录取 content，QA 对记录拼接问题和答案"""
+    if "content" in record:
+        return record["content"]
+    if "question" in record and "answer" in record:
+        return f"{record['question']}\n{record['answer']}"
+    return None
@@ -0,0 +1,127 @@
+"""LLM 并发调用工具：有界线程池与按端点的请求/Token 限流"""
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text):
+    """粗略估算文本的Token数：中文按每字1个Token，其余按每4个字符1个Token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class RateLimiter:
+    """令牌桶限流器，同时限制每分钟请求数和每分钟Token数（None 表示不限制）"""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_budget = float(requests_per_minute or 0)
+        self._token_budget = float(tokens_per_minute or 0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._request_budget = min(
+                float(self.requests_per_minute),
+                self._request_budget + elapsed * self.requests_per_minute / 60,
+            )
+        if self.tokens_per_minute:
+            self._token_budget = min(
+                float(self.tokens_per_minute),
+                self._token_budget + elapsed * self.tokens_per_minute / 60,
+            )
+
+    def _wait_time(self, tokens):
+        wait = 0.0
+        if self.requests_per_minute and self._request_budget < 1:
+            wait = max(wait, (1 - self._request_budget) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute and self._token_budget < tokens:
+            wait = max(wait, (tokens - self._token_budget) * 60 / self.tokens_per_minute)
+        return wait
+
+    def acquire(self, tokens=0):
+        """阻塞直到额度足够，然后扣除一次请求和 tokens 个Token"""
+        if self.tokens_per_minute:
+            # 单次请求超过桶容量时按桶容量计，避免永久等待
+            tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill()
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    if self.requests_per_minute:
+                        self._request_budget -= 1
+                    if self.tokens_per_minute:
+                        self._token_budget -= tokens
+                    return
+            time.sleep(wait)
+
+    def charge(self, tokens):
+        """请求完成后补扣额外的Token（如补全Token），额度可暂时为负"""
+        if not self.tokens_per_minute or tokens <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self._token_budget -= tokens
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(endpoint, requests_per_minute=None, tokens_per_minute=None):
+    """获取某个端点共享的限流器，限额变化时重新创建"""
+    with _limiters_lock:
+        limiter = _limiters.get(endpoint)
+        if (limiter is None
+                or limiter.requests_per_minute != requests_per_minute
+                or limiter.tokens_per_minute != tokens_per_minute):
+            limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+            _limiters[endpoint] = limiter
+        return limiter
+
+
+def run_ordered(func, items, max_workers=8, on_done=None, on_tick=None, tick_interval=0.5, cancel_event=None):
+    """在有界线程池中并发执行 func(item)，按输入顺序返回结果
+
+    on_done(index, result, error) 在调用线程中按完成顺序回调，
+    可安全地在其中更新 Streamlit 组件。出错的条目结果为 None。
+    on_tick() 在等待期间每隔 tick_interval 秒在调用线程中回调，可用于刷新实时进度。
+    调用线程被中断（如 Streamlit 重新运行脚本）时会设置 cancel_event 并取消尚未开始的任务。
+    """
+    items = list(items)
+    results = [None] * len(items)
+    if not items:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+        futures = {executor.submit(func, item): i for i, item in enumerate(items)}
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=tick_interval if on_tick else None, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = futures[future]
+                    error = future.exception()
+                    if error is None:
+                        results[i] = future.result()
+                    if on_done is not None:
+                        on_done(i, results[i], error)
+                if on_tick is not None and pending:
+                    on_tick()
+        except BaseException:
+            if cancel_event is not None:
+                cancel_event.set()
+            for future in pending:
+                future.cancel()
+            raise
+    return results
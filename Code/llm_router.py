@@ -0,0 +1,184 @@
+"""多端点大模型路由：按权重、并发上限和观测延迟分配请求，失败端点熔断，失败请求换端点重试
+
+所有端点须为 OpenAI 兼容接口，可在工作线程中调用。
+"""
+import threading
+import time
+
+import openai
+from openai import OpenAI
+
+from llm_pool import get_rate_limiter
+
+DEFAULT_MAX_CONCURRENCY = 8
+# 连续失败多少次后熔断，以及熔断后多久允许一次试探请求（秒）
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_COOLDOWN = 30.0
+# 延迟的指数滑动平均系数
+LATENCY_SMOOTHING = 0.3
+# 请求本身有问题的状态码，换端点重试也不会成功
+NON_RETRYABLE_STATUS_CODES = {400, 413, 422}
+
+
+class NoEndpointAvailable(RuntimeError):
+    """所有端点都已熔断或已在本次请求中失败"""
+
+
+def is_retryable(error):
+    """判断失败是否应换一个端点重试：连接错误、超时、429 和 5xx 等与端点有关的错误"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status not in NON_RETRYABLE_STATUS_CODES
+    return isinstance(error, openai.APIConnectionError)
+
+
+class Endpoint:
+    """单个推理端点及其运行状态"""
+
+    def __init__(self, base_url, api_key, weight=1.0, max_concurrency=DEFAULT_MAX_CONCURRENCY, name=None,
+                 requests_per_minute=None, tokens_per_minute=None, max_retries=2, client=None):
+        if weight <= 0:
+            raise ValueError("端点权重必须大于 0")
+        self.base_url = str(base_url)
+        self.name = name or self.base_url
+        self.weight = float(weight)
+        self.max_concurrency = max_concurrency
+        self.client = client or OpenAI(api_key=api_key, base_url=base_url, max_retries=max_retries)
+        self.limiter = get_rate_limiter(self.base_url, requests_per_minute, tokens_per_minute)
+        self.inflight = 0
+        self.latency = None
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    def state(self, now=None):
+        """熔断状态：closed 正常，open 熔断中，half-open 冷却结束、等待试探"""
+        if not self.open_until:
+            return "closed"
+        return "open" if (now or time.monotonic()) < self.open_until else "half-open"
+
+    def score(self, default_latency):
+        """负载评分，越小越优先：(排队中的请求数 + 1) x 平均延迟 / 权重"""
+        latency = self.latency if self.latency is not None else default_latency
+        return (self.inflight + 1) * latency / self.weight
+
+
+class LLMRouter:
+    """在多个端点之间分配请求
+
+    每次请求选择未熔断、未达到并发上限且评分最低的端点；端点连续失败 failure_threshold 次后熔断
+    cooldown 秒，之后放行一个试探请求，成功则恢复。与端点有关的失败会换一个尚未尝试过的端点重试。
+    """
+
+    def __init__(self, endpoints, failure_threshold=DEFAULT_FAILURE_THRESHOLD, cooldown=DEFAULT_COOLDOWN):
+        if not endpoints:
+            raise ValueError("至少需要配置一个端点")
+        self.endpoints = list(endpoints)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_config(cls, configs, **kwargs):
+        """由端点配置列表创建，每项为 {"base_url", "api_key", "weight", "max_concurrency", ...}
+
+        未配置 max_retries 的端点：多端点时为 0（失败直接换端点，不在同一端点上重试），单端点时为 2。
+        """
+        max_retries = 0 if len(configs) > 1 else 2
+        return cls([Endpoint(**{"max_retries": max_retries, **config}) for config in configs], **kwargs)
+
+    def _available(self, endpoint, now):
+        state = endpoint.state(now)
+        if state == "open" or (state == "half-open" and endpoint.probing):
+            return False
+        return endpoint.inflight < endpoint.max_concurrency
+
+    def _acquire(self, tried):
+        """选择并占用一个端点，全部端点都达到并发上限时等待"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                candidates = [e for e in self.endpoints if e not in tried and e.state(now) != "open"]
+                if not candidates:
+                    raise NoEndpointAvailable("没有可用的大模型端点（均已熔断或请求失败）")
+                available = [e for e in candidates if self._available(e, now)]
+                if available:
+                    known = [e.latency for e in self.endpoints if e.latency is not None]
+                    default_latency = min(known) if known else 1.0
+                    endpoint = min(available, key=lambda e: e.score(default_latency))
+                    endpoint.inflight += 1
+                    if endpoint.state(now) == "half-open":
+                        endpoint.probing = True
+                    return endpoint
+                # 等待其他请求释放，或熔断冷却结束
+                wakeups = [e.open_until - now for e in self.endpoints if e.state(now) == "open"]
+                self._condition.wait(timeout=min(wakeups) if wakeups else None)
+
+    def _release(self, endpoint, elapsed=None, error=None):
+        with self._condition:
+            endpoint.inflight -= 1
+            endpoint.requests += 1
+            endpoint.probing = False
+            if error is None:
+                endpoint.consecutive_failures = 0
+                endpoint.open_until = 0.0
+                if elapsed is not None:
+                    endpoint.latency = elapsed if endpoint.latency is None else (
+                        LATENCY_SMOOTHING * elapsed + (1 - LATENCY_SMOOTHING) * endpoint.latency
+                    )
+            elif error is not False:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                if endpoint.consecutive_failures >= self.failure_threshold or endpoint.open_until:
+                    endpoint.open_until = time.monotonic() + self.cooldown
+            self._condition.notify_all()
+
+    def call(self, func, can_retry=None):
+        """以 func(endpoint) 发起请求，返回其结果
+
+        与端点有关的失败会记入该端点并换端点重试；can_retry() 返回 False 时（如流式输出已部分送出）不再重试。
+        其他异常（请求本身有误、被取消等）直接抛出，不影响端点的熔断状态。
+        """
+        tried = set()
+        last_error = None
+        while True:
+            try:
+                endpoint = self._acquire(tried)
+            except NoEndpointAvailable:
+                if last_error is not None:
+                    raise last_error
+                raise
+            started = time.monotonic()
+            try:
+                result = func(endpoint)
+            except Exception as e:
+                retryable = is_retryable(e)
+                self._release(endpoint, error=e if retryable else False)
+                tried.add(endpoint)
+                if not retryable or (can_retry is not None and not can_retry()):
+                    raise
+                last_error = e
+                continue
+            except BaseException:
+                self._release(endpoint, error=False)
+                raise
+            self._release(endpoint, elapsed=time.monotonic() - started)
+            return result
+
+    def stats(self):
+        """各端点的运行状态，用于界面展示"""
+        with self._condition:
+            now = time.monotonic()
+            return [
+                {
+                    "name": e.name,
+                    "state": e.state(now),
+                    "inflight": e.inflight,
+                    "latency": e.latency,
+                    "requests": e.requests,
+                    "failures": e.failures,
+                }
+                for e in self.endpoints
+            ]
@@ -0,0 +1,244 @@
+"""运行指标：各处理阶段的耗时直方图与计数器，可导出为 Prometheus 文本格式或 JSON 运行报告
+
+进程内共享一个 REGISTRY。在进程池子进程中记录的指标通过 drain() 取出后随结果传回，由父进程 merge()。
+doc_parsing 在进程池子进程中导入本模块，因此本模块同样不能导入 Streamlit 或 AutoQAG。
+"""
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 耗时直方图的桶上界（秒），最后一个桶为 +Inf
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+# 指标说明，用于 Prometheus 的 HELP 行
+METRIC_HELP = {
+    "autoqag_document_load_seconds": "文档加载耗时",
+    "autoqag_document_split_seconds": "文档分割耗时",
+    "autoqag_text_chunks_total": "分割得到的文本块数",
+    "autoqag_llm_request_seconds": "大模型请求耗时（每次尝试）",
+    "autoqag_llm_request_errors_total": "大模型请求失败次数",
+    "autoqag_llm_prompt_tokens_total": "大模型输入Token数（流式请求为估算值）",
+    "autoqag_llm_completion_tokens_total": "大模型输出Token数（流式请求为估算值）",
+    "autoqag_prompts_total": "发送的提示词数（按模板版本）",
+    "autoqag_prompt_tokens_total": "发送的提示词Token数（按模板版本）",
+    "autoqag_chunk_write_seconds": "写入 chunk 耗时（含重试）",
+    "autoqag_chunk_write_errors_total": "写入 chunk 失败次数",
+    "autoqag_chunk_read_seconds": "读取 chunk 列表或详情耗时（含重试）",
+    "autoqag_chunk_read_errors_total": "读取 chunk 失败次数",
+    "autoqag_chunks_read_total": "分页列出的 chunk 数",
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if math.isinf(bound) else repr(bound)
+
+
+class Histogram:
+    """固定桶直方图，counts[i] 为落在第 i 个桶（不累计）的观测数"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def merge(self, counts, total, count):
+        for i, c in enumerate(counts):
+            self.counts[i] += c
+        self.sum += total
+        self.count += count
+
+    def quantile(self, q):
+        """按桶内线性插值估算分位数，落在 +Inf 桶时返回最后一个有限上界"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, c in enumerate(self.counts):
+            if c and cumulative + c >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i]
+                if math.isinf(upper):
+                    return lower
+                return lower + (upper - lower) * (rank - cumulative) / c
+            cumulative += c
+        return self.buckets[-2]
+
+
+class MetricsRegistry:
+    """线程安全的计数器与直方图集合，指标以 (名称, 标签) 区分"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._reset_state()
+
+    def _reset_state(self):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._counters = {}
+        self._histograms = {}
+        self.started_at = time.time()
+
+    def _check_fork(self):
+        # 子进程继承了父进程已记录的指标，首次使用时清空，避免合并回父进程时重复计数
+        if self._pid != os.getpid():
+            self._reset_state()
+
+    def inc(self, name, value=1, **labels):
+        self._check_fork()
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        self._check_fork()
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """记录代码块耗时到直方图 name；抛出异常时同时累加 <name 去掉 _seconds>_errors_total 计数器"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            base = name[:-len("_seconds")] if name.endswith("_seconds") else name
+            self.inc(f"{base}_errors_total", **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+            self.started_at = time.time()
+
+    def snapshot(self):
+        """返回可 JSON 序列化、可传给 merge() 的指标快照"""
+        self._check_fork()
+        with self._lock:
+            return {
+                "counters": [[name, list(map(list, labels)), value] for (name, labels), value in self._counters.items()],
+                "histograms": [
+                    [name, list(map(list, labels)), list(h.counts), h.sum, h.count]
+                    for (name, labels), h in self._histograms.items()
+                ],
+            }
+
+    def drain(self):
+        """取出快照并清空，用于把子进程中记录的指标传回父进程"""
+        snapshot = self.snapshot()
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+        return snapshot
+
+    def merge(self, snapshot):
+        """合并 snapshot()/drain() 返回的快照"""
+        if not snapshot:
+            return
+        self._check_fork()
+        with self._lock:
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                self._counters[key] = self._counters.get(key, 0) + value
+            for name, labels, counts, total, count in snapshot["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(self.buckets)
+                histogram.merge(counts, total, count)
+
+    def to_prometheus(self):
+        """Prometheus 文本格式（直方图桶为累计计数）"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h.counts), h.sum, h.count)) for key, h in self._histograms.items())
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in METRIC_HELP:
+                    lines.append(f"# HELP {name} {METRIC_HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), (counts, total, count) in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', _format_bound(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def report(self):
+        """JSON 运行报告：计数器取值，直方图给出次数、总和、均值和 p50/p95/p99 估算值"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            return {
+                "started_at": self.started_at,
+                "generated_at": time.time(),
+                "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in counters],
+                "histograms": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "count": h.count,
+                        "sum": h.sum,
+                        "mean": h.sum / h.count if h.count else None,
+                        "p50": h.quantile(0.5),
+                        "p95": h.quantile(0.95),
+                        "p99": h.quantile(0.99),
+                        "buckets": [[_format_bound(bound), c] for bound, c in zip(self.buckets, h.counts)],
+                    }
+                    for (name, labels), h in histograms
+                ],
+            }
+
+    def to_json(self):
+        return json.dumps(self.report(), ensure_ascii=False, indent=2)
+
+
+REGISTRY = MetricsRegistry()
+
+
+def write_report(path, registry=REGISTRY):
+    """按扩展名写出指标：.prom/.txt 为 Prometheus 文本格式，其余为 JSON 运行报告"""
+    text = registry.to_prometheus() if path.endswith((".prom", ".txt")) else registry.to_json()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
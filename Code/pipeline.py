@@ -0,0 +1,124 @@
+"""生产者/消费者流水线：各阶段在独立线程中并发运行，阶段之间用有界队列连接
+
+下游处理不过来时上游在 put 处阻塞（背压），内存中同时存在的记录数不超过各队列容量与工作线程数之和。
+所有回调都在调用 run() 的线程中执行。
+"""
+import queue
+import threading
+
+DEFAULT_QUEUE_SIZE = 32
+# 阻塞等待的轮询间隔（秒），用于及时响应取消
+_POLL_INTERVAL = 0.2
+_STOP = object()
+
+
+class Stage:
+    """流水线阶段：func(item) 返回交给下一阶段的记录列表（可为空），workers 为并发线程数"""
+
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+
+
+class Pipeline:
+    """按顺序连接多个阶段
+
+    run() 把 source 中的记录送入第一个阶段，每条记录处理完后回调
+    on_event(stage_name, item, outputs, error)，出错时 outputs 为空列表、error 为异常；
+    读取 source 出错时 stage_name 为 "source"。
+    最后一个阶段的输出不再传递，只通过回调报告。
+    """
+
+    def __init__(self, stages, queue_size=DEFAULT_QUEUE_SIZE):
+        self.stages = list(stages)
+        self.queue_size = queue_size
+
+    def _put(self, q, item, cancel_event):
+        while not cancel_event.is_set():
+            try:
+                q.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q, cancel_event):
+        while not cancel_event.is_set():
+            try:
+                return q.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return _STOP
+
+    def run(self, source, on_event=None, on_tick=None, cancel_event=None):
+        """运行流水线直到 source 耗尽且所有记录处理完毕
+
+        on_tick() 在等待期间定期回调。调用线程被中断（如 Streamlit 停止运行）时设置 cancel_event，
+        各阶段放弃尚未处理的记录后退出。
+        """
+        cancel_event = cancel_event or threading.Event()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        events = queue.Queue()
+        remaining = [stage.workers for stage in self.stages]
+        lock = threading.Lock()
+
+        def feed():
+            try:
+                for item in source:
+                    if not self._put(queues[0], item, cancel_event):
+                        return
+            except Exception as e:
+                events.put(("source", None, [], e))
+            finally:
+                for _ in range(self.stages[0].workers):
+                    self._put(queues[0], _STOP, cancel_event)
+
+        def work(k):
+            stage = self.stages[k]
+            downstream = queues[k + 1] if k + 1 < len(self.stages) else None
+            while True:
+                item = self._get(queues[k], cancel_event)
+                if item is _STOP:
+                    break
+                try:
+                    outputs = list(stage.func(item) or [])
+                    error = None
+                except Exception as e:
+                    outputs, error = [], e
+                events.put((stage.name, item, outputs, error))
+                if downstream is not None:
+                    for output in outputs:
+                        if not self._put(downstream, output, cancel_event):
+                            break
+            with lock:
+                remaining[k] -= 1
+                last = remaining[k] == 0
+            if last and downstream is not None:
+                # 本阶段全部结束后通知下一阶段的每个工作线程
+                for _ in range(self.stages[k + 1].workers):
+                    self._put(downstream, _STOP, cancel_event)
+
+        threads = [threading.Thread(target=feed, daemon=True)]
+        for k, stage in enumerate(self.stages):
+            threads.extend(threading.Thread(target=work, args=(k,), daemon=True) for _ in range(stage.workers))
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                try:
+                    stage_name, item, outputs, error = events.get(timeout=_POLL_INTERVAL)
+                except queue.Empty:
+                    if not any(thread.is_alive() for thread in threads) and events.empty():
+                        break
+                    if on_tick is not None:
+                        on_tick()
+                    continue
+                if on_event is not None:
+                    on_event(stage_name, item, outputs, error)
+        except BaseException:
+            cancel_event.set()
+            raise
+        finally:
+            for thread in threads:
+                thread.join(timeout=_POLL_INTERVAL if cancel_event.is_set() else None)
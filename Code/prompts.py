@@ -0,0 +1,103 @@
+"""提示词模板：模板在导入时编译一次，渲染时只做字符串拼接
+
+编译时去掉每行的缩进和行尾空白、合并连续空行，再拆分为字面量和占位符；模板带版本号，
+模板内容变化时须更新版本号，使生成缓存失效。每次实际发送的提示词都会计算Token数并计入运行指标。
+"""
+import string
+
+from chunking import count_tokens
+from metrics import REGISTRY
+
+
+def minimize_whitespace(text):
+    """去掉每行首尾空白，多个连续空行合并为一个"""
+    lines = []
+    for line in text.strip().splitlines():
+        line = line.strip()
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+class PromptTemplate:
+    """版本化的提示词模板，占位符语法同 str.format（{name}，字面量花括号写作 {{ }}）
+
+    overhead_tokens 为模板本身（不含占位符内容）的Token数，用于预估调用量和计算文本块的Token预算。
+    """
+
+    def __init__(self, version, text):
+        self.version = version
+        self.text = minimize_whitespace(text)
+        self._parts = []
+        for literal, field, spec, conversion in string.Formatter().parse(self.text):
+            if spec or conversion:
+                raise ValueError(f"模板 {version} 的占位符不支持格式说明: {field}")
+            self._parts.append((literal, field))
+        self.fields = tuple(field for _, field in self._parts if field is not None)
+        self.overhead_tokens = count_tokens("".join(literal for literal, _ in self._parts))
+
+    def render(self, **values):
+        return "".join(literal + (str(values[field]) if field is not None else "") for literal, field in self._parts)
+
+    def build(self, **values):
+        """渲染将要发送的提示词并记录其Token数，返回 (提示词, Token数)"""
+        prompt = self.render(**values)
+        tokens = count_tokens(prompt)
+        REGISTRY.inc("autoqag_prompts_total", template=self.version)
+        REGISTRY.inc("autoqag_prompt_tokens_total", tokens, template=self.version)
+        return prompt, tokens
+
+
+QA_PROMPT = PromptTemplate("qa-v2", """
+    基于以下给定的文本，生成多组高质量的问答对。请遵循以下指南：
+
+    1. 问题部分：
+    - 每组问答对围绕文本中的一个主题，为该主题创建尽可能多的不同表述的问题，确保问题的多样性。
+    - 每个问题应考虑用户可能的多种问法，例如：直接询问（如“什么是...？”）、请求确认（如“是否可以说...？”）、寻求解释（如“请解释一下...的含义。”）、假设性问题（如“如果...会怎样？”）、例子请求（如“能否举个例子说明...？”）。
+    - 问题应涵盖文本中的关键信息、主要概念和细节，确保不遗漏重要内容。
+
+    2. 答案部分：
+    - 提供一个全面、信息丰富的答案，涵盖问题的所有可能角度，确保逻辑连贯。
+    - 答案应直接基于给定文本，确保准确性和一致性。
+    - 包含相关的细节，如日期、名称、职位等具体信息，必要时提供背景信息以增强理解。
+
+    3. 格式：
+    - 使用 "Q:" 标记一组问题的开始，该组的所有问题在同一个段落内，问题之间用空格分隔。
+    - 使用 "A:" 标记答案的开始，答案可以分段。
+    - 不同的问答对之间用空行分隔。
+
+    4. 内容要求：
+    - 确保问答对紧密围绕文本主题，避免偏离主题。
+    - 避免添加文本中未提及的信息，确保信息的真实性。
+    - 如果文本信息不足以回答某个方面，可以在答案中说明 "根据给定信息无法确定"，并尽量提供相关的上下文。
+
+    5. 示例结构（仅供参考，实际内容应基于给定文本）：
+    Q: 问题1 问题2 问题3
+    A: 答案
+
+    Q: 问题1 问题2
+    A: 答案
+
+    给定文本：
+    {chunk_text}
+
+    请基于这个文本生成问答对。
+""")
+
+BATCH_QA_PROMPT = PromptTemplate("qa-batch-v2", """
+    下面给出 {count} 段相互独立的文本，每段以 <<<文本 编号>>> 开始、<<<文本 编号 结束>>> 结束。请分别为每段文本生成多组高质量的问答对：
+    1. 问题：每组问答对围绕该文本的一个主题，创建尽可能多的不同表述的问题（直接询问、请求确认、寻求解释、假设性问题、例子请求等），问题之间用空格分隔，涵盖关键信息、主要概念和细节。
+    2. 答案：提供一个全面、信息丰富、直接基于该段文本的答案，包含日期、名称、职位等具体细节；文本信息不足时说明 "根据给定信息无法确定"。
+    3. 只使用对应文本中的信息，不要混用其他段落的内容。
+
+    只输出如下格式的 JSON，不要输出任何其他内容：
+    {{"results": [{{"id": 文本编号, "pairs": [{{"question": "问题集合", "answer": "答案"}}]}}]}}
+
+    {sections}
+""")
+
+BATCH_SECTION = PromptTemplate("qa-batch-section-v1", """
+    <<<文本 {index}>>>
+    {chunk_text}
+    <<<文本 {index} 结束>>>
+""")
@@ -0,0 +1,214 @@
+"""生成后的QA对质量与冗余过滤：纯 CPU、基于 NumPy
+
+- 答案与原文的重合度：答案中的字符二元组有多大比例出现在原文中，过低说明答案可能不是依据原文生成的
+- 问题去重：问题文本映射为哈希字符 n-gram 向量（本地“嵌入”，无需模型），余弦相似度达到阈值的只保留一个；
+  已保留的问题较多时用随机超平面 LSH 近似最近邻检索候选，避免两两比较
+
+哈希 n-gram 向量只反映字面重合，能识别换了少量字词的重复问题，识别不了措辞完全不同的同义问题。
+过滤按页流式进行，内存中只保留已保留问题的向量和问题文本，不保留答案和原文。
+"""
+import re
+import zlib
+
+import numpy as np
+
+EMBED_DIM = 512
+OVERLAP_DIM = 4096
+DEFAULT_MIN_QUESTION_CHARS = 4
+DEFAULT_MIN_ANSWER_CHARS = 4
+DEFAULT_MIN_OVERLAP = 0.2
+DEFAULT_DUPLICATE_THRESHOLD = 0.9
+# 问题数超过该值时改用 LSH 近似检索
+ANN_MIN_SIZE = 5000
+# LSH 参数：16 个分带，每带 12 个超平面
+LSH_BANDS = 16
+LSH_ROWS = 12
+BATCH_SIZE = 1024
+_IGNORED = re.compile(r"[\s，。！？、；：“”‘’（）《》,.!?;:'\"()\[\]-]+")
+
+
+def _grams(text):
+    """去掉空白和标点后的字符一元组与二元组"""
+    text = _IGNORED.sub("", text.lower())
+    return list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+def _bigrams(text):
+    text = _IGNORED.sub("", text.lower())
+    if len(text) < 2:
+        return [text] if text else []
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+def _hashed_indices(texts, grams, dim):
+    """返回 (行号数组, 列号数组)，列号为 n-gram 的哈希桶"""
+    rows = []
+    cols = []
+    for i, text in enumerate(texts):
+        hashes = [zlib.crc32(gram.encode("utf-8")) % dim for gram in grams(text)]
+        rows.extend([i] * len(hashes))
+        cols.extend(hashes)
+    return np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+
+
+def embed_texts(texts, dim=EMBED_DIM):
+    """把文本映射为 L2 归一化的哈希 n-gram 计数向量，形状 (len(texts), dim)"""
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    rows, cols = _hashed_indices(texts, _grams, dim)
+    np.add.at(matrix, (rows, cols), 1.0)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def overlap_scores(answers, sources, dim=OVERLAP_DIM, batch_size=BATCH_SIZE):
+    """答案的字符二元组出现在对应原文中的比例，分批向量化计算"""
+    scores = np.zeros(len(answers), dtype=np.float32)
+    for start in range(0, len(answers), batch_size):
+        batch_answers = answers[start:start + batch_size]
+        batch_sources = sources[start:start + batch_size]
+        answer_bits = np.zeros((len(batch_answers), dim), dtype=bool)
+        source_bits = np.zeros((len(batch_sources), dim), dtype=bool)
+        answer_bits[_hashed_indices(batch_answers, _bigrams, dim)] = True
+        source_bits[_hashed_indices(batch_sources, _bigrams, dim)] = True
+        totals = answer_bits.sum(axis=1)
+        shared = (answer_bits & source_bits).sum(axis=1)
+        scores[start:start + len(batch_answers)] = np.where(totals > 0, shared / np.maximum(totals, 1), 0.0)
+    return scores
+
+
+class DuplicateIndex:
+    """增量的相似向量索引：query 返回已加入的向量中与给定向量最相似且不低于阈值的一个
+
+    已加入的向量不超过 ann_min_size（默认 ANN_MIN_SIZE）时精确计算，否则只在 LSH 分带签名相同的候选中计算。
+    """
+
+    def __init__(self, threshold, dim=EMBED_DIM, ann_min_size=None, bands=LSH_BANDS, rows=LSH_ROWS, seed=1):
+        self.threshold = threshold
+        self.ann_min_size = ann_min_size or ANN_MIN_SIZE
+        self.size = 0
+        self._vectors = np.zeros((BATCH_SIZE, dim), dtype=np.float32)
+        rng = np.random.RandomState(seed)
+        self._planes = rng.standard_normal((dim, bands * rows)).astype(np.float32)
+        self._bands = bands
+        self._rows = rows
+        self._weights = 1 << np.arange(rows, dtype=np.int64)
+        self._buckets = [{} for _ in range(bands)]
+
+    def _band_keys(self, vector):
+        bits = ((vector @ self._planes) > 0).reshape(self._bands, self._rows).astype(np.int64)
+        return (bits @ self._weights).tolist()
+
+    def query(self, vector):
+        """返回 (下标, 相似度)，没有达到阈值的向量时返回 (None, 0.0)"""
+        if self.size == 0:
+            return None, 0.0
+        if self.size <= self.ann_min_size:
+            candidates = np.arange(self.size)
+        else:
+            members = set()
+            for band, key in enumerate(self._band_keys(vector)):
+                members.update(self._buckets[band].get(key, ()))
+            if not members:
+                return None, 0.0
+            candidates = np.fromiter(members, dtype=np.int64)
+        sims = self._vectors[candidates] @ vector
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None, 0.0
+        return int(candidates[best]), float(sims[best])
+
+    def add(self, vector):
+        """加入向量，返回其下标"""
+        if self.size == len(self._vectors):
+            self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+        index = self.size
+        self._vectors[index] = vector
+        self.size += 1
+        for band, key in enumerate(self._band_keys(vector)):
+            self._buckets[band].setdefault(key, []).append(index)
+        return index
+
+
+class QAFilterReport:
+    """过滤统计，dropped 为 [(键, 原因, 分数)]，samples 为前若干条被过滤的 (键, 原因, 分数, {"question", "answer"})
+
+    被后出现的重复问题替换的QA对，samples 中只有问题，answer 为 None。
+    """
+
+    def __init__(self, total, kept, dropped, samples=()):
+        self.total = total
+        self.kept = kept
+        self.dropped = dropped
+        self.samples = list(samples)
+
+    def count(self, reason):
+        return sum(1 for _, r, _ in self.dropped if r == reason)
+
+
+class QAFilter:
+    """按长度、答案与原文重合度和问题相似度过滤QA对
+
+    重复的问题中保留答案与原文重合度最高的一个。
+    """
+
+    def __init__(self, min_overlap=DEFAULT_MIN_OVERLAP, duplicate_threshold=DEFAULT_DUPLICATE_THRESHOLD,
+                 min_question_chars=DEFAULT_MIN_QUESTION_CHARS, min_answer_chars=DEFAULT_MIN_ANSWER_CHARS):
+        self.min_overlap = min_overlap
+        self.duplicate_threshold = duplicate_threshold
+        self.min_question_chars = min_question_chars
+        self.min_answer_chars = min_answer_chars
+
+    def filter_pages(self, pages, max_samples=50):
+        """逐页过滤 pages（每页为 [(键, QA对)]，QA对为含 question、answer、chunk 的字典），返回 QAFilterReport
+
+        内存中只保留已保留问题的向量、键和问题文本；后出现的重复问题重合度更高时替换先保留的问题。
+        """
+        index = DuplicateIndex(self.duplicate_threshold)
+        owners = []  # 索引中每个向量当前保留的 (键, 重合度, 问题)
+        dropped = []
+        samples = []
+        total = 0
+
+        def drop(key, reason, score, question, answer=None):
+            dropped.append((key, reason, score))
+            if len(samples) < max_samples:
+                samples.append((key, reason, score, {"question": question, "answer": answer}))
+
+        for page in pages:
+            total += len(page)
+            candidates = []
+            for key, qa_pair in page:
+                question, answer = qa_pair["question"].strip(), qa_pair["answer"].strip()
+                if len(question) < self.min_question_chars or len(answer) < self.min_answer_chars:
+                    drop(key, "too_short", float(min(len(question), len(answer))), question, answer)
+                else:
+                    candidates.append((key, question, answer, qa_pair.get("chunk", "")))
+            if not candidates:
+                continue
+            scores = overlap_scores([c[2] for c in candidates], [c[3] for c in candidates])
+            vectors = embed_texts([c[1] for c in candidates])
+            for (key, question, answer, _), score, vector in zip(candidates, scores.tolist(), vectors):
+                if score < self.min_overlap:
+                    drop(key, "low_overlap", score, question, answer)
+                    continue
+                match, similarity = index.query(vector)
+                if match is None:
+                    index.add(vector)
+                    owners.append((key, score, question))
+                elif score > owners[match][1]:
+                    # 重合度更高的重复问题替换先保留的问题，索引中仍用先加入的向量代表这一组
+                    old_key, _, old_question = owners[match]
+                    drop(old_key, "duplicate", similarity, old_question)
+                    owners[match] = (key, score, question)
+                else:
+                    drop(key, "duplicate", similarity, question, answer)
+
+        dropped.sort(key=lambda item: item[0])
+        return QAFilterReport(total, total - len(dropped), dropped, samples)
+
+    def filter(self, qa_pairs):
+        """返回 (保留的QA对, QAFilterReport)，report.dropped 中的键为 qa_pairs 的下标"""
+        report = self.filter_pages([list(enumerate(qa_pairs))])
+        dropped = {i for i, _, _ in report.dropped}
+        return [qa_pair for i, qa_pair in enumerate(qa_pairs) if i not in dropped], report
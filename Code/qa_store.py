@@ -0,0 +1,181 @@
+"""QA对会话存储：生成的QA对保存在磁盘上的 SQLite 文件中，而不是 Streamlit 会话内存里
+
+原文文本块按内容哈希只保存一份，QA对通过 ID 引用；预览和插入按页读取。
+每个浏览器会话只在 session_state 中保存存储文件的路径。
+"""
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from checkpoint import content_hash
+from export import qa_export_record
+
+DEFAULT_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "sessions")
+DEFAULT_PAGE_SIZE = 200
+# 超过该时间（秒）未修改的会话存储视为已废弃，创建新存储时清理
+DEFAULT_MAX_AGE = 3 * 24 * 3600
+
+
+class QASessionStore:
+    """一次生成结果的QA对存储，QA对按生成位置排序"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (id INTEGER PRIMARY KEY, hash TEXT UNIQUE, text TEXT, metadata TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS qa_pairs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, position INTEGER, question TEXT, answer TEXT, chunk_id INTEGER)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS qa_pairs_position ON qa_pairs (position, id)")
+        self._conn.commit()
+
+    @classmethod
+    def create(cls, directory=DEFAULT_STORE_DIR, max_age=DEFAULT_MAX_AGE, source=None):
+        """在 directory 下创建新的存储文件（给出 source 时复制其内容），并清理超过 max_age 秒未修改的旧存储
+
+        directory 下只应存放会话自己的存储；后台任务读写的存储放在任务目录中，不会被清理。
+        """
+        os.makedirs(directory, exist_ok=True)
+        cutoff = time.time() - max_age
+        for path in glob.glob(os.path.join(directory, "*.sqlite3")):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    cls.remove(path)
+            except OSError:
+                pass
+        path = os.path.join(directory, f"{uuid.uuid4().hex}.sqlite3")
+        if source is not None:
+            source.backup(path)
+        return cls(path)
+
+    @staticmethod
+    def remove(path):
+        """删除存储文件（含 WAL 文件）"""
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    def backup(self, path):
+        """把存储复制到新文件 path（SQLite 在线备份，包含尚未写回主文件的 WAL 内容）"""
+        target = sqlite3.connect(path)
+        try:
+            with self._lock:
+                self._conn.backup(target)
+        finally:
+            target.close()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _chunk_id(self, text, metadata=None):
+        chunk_hash = content_hash(text)
+        self._conn.execute(
+            "INSERT OR IGNORE INTO chunks (hash, text, metadata) VALUES (?, ?, ?)",
+            (chunk_hash, text, json.dumps(metadata, ensure_ascii=False, default=str) if metadata else None),
+        )
+        return self._conn.execute("SELECT id FROM chunks WHERE hash = ?", (chunk_hash,)).fetchone()[0]
+
+    def add_many(self, items):
+        """写入 [(位置, qa_pair)] 或 [(位置, qa_pair, 文本块元数据)]，qa_pair 含 question、answer、chunk"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO qa_pairs (position, question, answer, chunk_id) VALUES (?, ?, ?, ?)",
+                [(item[0], item[1]["question"], item[1]["answer"],
+                  self._chunk_id(item[1]["chunk"], item[2] if len(item) > 2 else None))
+                 for item in items],
+            )
+            self._conn.commit()
+
+    def add(self, position, qa_pair, metadata=None):
+        self.add_many([(position, qa_pair, metadata)])
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM qa_pairs").fetchone()[0]
+
+    def _rows(self, sql, params):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT q.id, q.question, q.answer, q.chunk_id, c.text FROM qa_pairs q JOIN chunks c ON c.id = q.chunk_id "
+                + sql,
+                params,
+            ).fetchall()
+        # 同一页内引用同一文本块的QA对共享同一个字符串对象
+        texts = {}
+        return [(row_id, {"question": question, "answer": answer, "chunk": texts.setdefault(chunk_id, text)})
+                for row_id, question, answer, chunk_id, text in rows]
+
+    def page(self, offset, limit):
+        """按位置返回第 offset 条起的 limit 条 [(id, qa_pair)]"""
+        return self._rows("ORDER BY q.position, q.id LIMIT ? OFFSET ?", (limit, offset))
+
+    def iter_pages(self, page_size=DEFAULT_PAGE_SIZE):
+        """逐页产出 (起始序号, [(id, qa_pair)])，按位置顺序；按上一页末尾的位置续读，不随页数变慢"""
+        offset = 0
+        last = (-1, 0)
+        while True:
+            with self._lock:
+                keys = self._conn.execute(
+                    "SELECT position, id FROM qa_pairs WHERE (position, id) > (?, ?) ORDER BY position, id LIMIT ?",
+                    (*last, page_size),
+                ).fetchall()
+            if not keys:
+                return
+            rows = self._rows(
+                "WHERE (q.position, q.id) > (?, ?) AND (q.position, q.id) <= (?, ?) ORDER BY q.position, q.id",
+                (*last, *keys[-1]),
+            )
+            yield offset, rows
+            offset += len(rows)
+            last = tuple(keys[-1])
+
+    def iter_export_records(self, page_size=DEFAULT_PAGE_SIZE):
+        """按位置顺序逐条产出QA对的导出记录（见 export.qa_export_record），含原文文本块的哈希、来源和元数据"""
+        last = (-1, 0)
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT q.position, q.id, q.question, q.answer, c.text, c.hash, c.metadata "
+                    "FROM qa_pairs q JOIN chunks c ON c.id = q.chunk_id "
+                    "WHERE (q.position, q.id) > (?, ?) ORDER BY q.position, q.id LIMIT ?",
+                    (*last, page_size),
+                ).fetchall()
+            if not rows:
+                return
+            for _, _, question, answer, text, chunk_hash, metadata in rows:
+                yield qa_export_record({"question": question, "answer": answer, "chunk": text}, chunk_hash,
+                                       json.loads(metadata) if metadata else None)
+            last = tuple(rows[-1][:2])
+
+    def delete(self, ids):
+        """删除QA对，不再被引用的文本块一并删除"""
+        with self._lock:
+            self._conn.executemany("DELETE FROM qa_pairs WHERE id = ?", [(row_id,) for row_id in ids])
+            self._conn.execute("DELETE FROM chunks WHERE id NOT IN (SELECT chunk_id FROM qa_pairs)")
+            self._conn.commit()
+
+    def chunk_texts(self):
+        """逐条产出被QA对引用的原文文本块"""
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, text FROM chunks WHERE id > ? ORDER BY id LIMIT ?", (last_id, DEFAULT_PAGE_SIZE)
+                ).fetchall()
+            if not rows:
+                return
+            for _, text in rows:
+                yield text
+            last_id = rows[-1][0]
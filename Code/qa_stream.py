@@ -0,0 +1,130 @@
+"""模型响应中 Q:/A: 问答对的解析：完整响应一次解析出全部问答对，流式响应随 Token 到达增量解析"""
+import re
+
+# 行首（或文本开头）的问题/答案标记，兼容全角冒号、小写、编号（Q1:）、列表前缀（1. Q: / - Q:）、
+# Markdown 加粗（**Q:** / **Q**:）以及中文标记（问题：/答案：/问：/答：）
+_MARKER_PATTERN = re.compile(
+    r"(?:^|\n)[ \t]*(?:[-*>#]+[ \t]*)?(?:\d+[.、)）][ \t]*)?(?:\*\*)?"
+    r"([QqAa]|问题|答案|问|答)[ \t]*\d*[ \t]*(?:\*\*)?[ \t]*[:：][ \t]*(?:\*\*)?"
+)
+# 答案末尾的分隔线（如 "---"）
+_TRAILING_RULE_PATTERN = re.compile(r"(?:\n[ \t]*[-*_=]{3,}[ \t]*)+$")
+# 收到这么多字符后仍未出现 "Q:" 或 "A:" 标记，视为响应格式异常
+MALFORMED_PREFIX_CHARS = 400
+
+
+def _marker_kind(label):
+    return "Q" if label in ("Q", "q", "问题", "问") else "A"
+
+
+def _label_style(label):
+    return "latin" if label in ("Q", "q", "A", "a") else len(label)
+
+
+def _markers(text, styles, start=0):
+    """返回 text 中的 [(开始, 结束, "Q"/"A")]
+
+    问题标记和答案标记各自以第一次出现的写法（Q/A、问题/答案、问/答）为准，其他写法视为正文，
+    这样答案中以 "问：" 开头的行不会被当作新的问题。styles 保存已确定的写法，在多次调用之间共享。
+    """
+    markers = []
+    for m in _MARKER_PATTERN.finditer(text, start):
+        kind = _marker_kind(m.group(1))
+        style = styles.setdefault(kind, _label_style(m.group(1)))
+        if style == _label_style(m.group(1)):
+            markers.append((m.start(), m.end(), kind))
+    return markers
+
+
+def _body(text):
+    return _TRAILING_RULE_PATTERN.sub("", text.strip()).strip()
+
+
+def parse_qa_pairs(response):
+    """解析完整响应中的全部问答对，返回 [{"question", "answer"}]，按出现顺序排列
+
+    一个 "Q:" 之后紧跟的多个 "Q:"（如 Q1:、Q2:）合并为同一组问题，以空格连接；连续的多个 "A:" 合并为同一个答案。
+    第一个标记为 "A:" 时，其前面的文本作为问题。缺少问题或答案的块被忽略。
+    """
+    if not response:
+        return []
+    markers = _markers(response, {})
+    pairs = []
+    pair = None
+    for k, (start, end, kind) in enumerate(markers):
+        next_start = markers[k + 1][0] if k + 1 < len(markers) else len(response)
+        body = _body(response[end:next_start])
+        if kind == "Q":
+            if pair is not None and pair["answer"]:
+                pairs.append(pair)
+                pair = None
+            if pair is None:
+                pair = {"question": body, "answer": ""}
+            elif body:
+                pair["question"] = f"{pair['question']} {body}".strip()
+        elif pair is None:
+            pair = {"question": _body(response[:start]), "answer": body}
+        elif body:
+            pair["answer"] = f"{pair['answer']}\n{body}".strip()
+    if pair is not None:
+        pairs.append(pair)
+    return [pair for pair in pairs if _complete(pair)]
+
+
+def _complete(pair):
+    return bool(pair["question"] and pair["answer"])
+
+
+class CompletionCancelled(Exception):
+    """流式生成被取消或因响应格式异常被提前终止"""
+
+
+class IncrementalQAParser:
+    """随 Token 到达增量解析 Q:/A: 块
+
+    已完成的问答对（其后出现了新的 "Q:"）保存在 pairs 中，不再重复扫描；
+    current 为正在生成的问答对，供界面实时展示。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.pairs = []
+        self.current = None
+        self._scan_from = 0
+        self._styles = {}
+
+    def feed(self, delta):
+        """追加一段新文本并更新解析结果；全部文本到达后，完整的问答对与 parse_qa_pairs 的结果一致"""
+        self.text += delta
+        # 标记可能被拆分在两次增量之间，从上一个已完成问答对之后的问题标记处重新扫描
+        markers = _markers(self.text, self._styles, self._scan_from)
+        pair = None
+        for k, (start, end, kind) in enumerate(markers):
+            next_start = markers[k + 1][0] if k + 1 < len(markers) else len(self.text)
+            body = _body(self.text[end:next_start])
+            if kind == "Q":
+                if pair is not None and pair["answer"]:
+                    # 新问题开始，上一个问答对已完整
+                    if _complete(pair):
+                        self.pairs.append(pair)
+                    self._scan_from = start
+                    pair = None
+                if pair is None:
+                    pair = {"question": body, "answer": ""}
+                elif body:
+                    pair["question"] = f"{pair['question']} {body}".strip()
+            elif pair is not None:
+                if body:
+                    pair["answer"] = f"{pair['answer']}\n{body}".strip()
+            else:
+                pair = {"question": _body(self.text[:start]), "answer": body}
+        self.current = pair
+        return self
+
+    def looks_malformed(self):
+        """已收到足够多的内容但仍没有任何 Q:/A: 标记"""
+        return len(self.text) >= MALFORMED_PREFIX_CHARS and not self.pairs and self.current is None
+
+    def snapshot(self):
+        """返回当前所有问答对（含正在生成、可能还没有答案的一个）"""
+        return self.pairs + ([self.current] if self.current else [])
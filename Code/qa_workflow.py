@@ -0,0 +1,456 @@
+"""QA对生成流程：解析文件、调用大模型生成QA对、写入 Collection
+
+页面（AutoQAG.py）、后台任务和命令行（run_pipeline.py）共用这些函数。连接、缓存和索引由调用方传入，
+进度、警告和错误通过回调或返回值报告，接口请求失败时抛出异常，可在工作线程中调用。
+"""
+import json
+import re
+import time
+
+import requests
+
+from chunking import count_tokens, project_generation_cost
+from completion_cache import make_cache_key
+from doc_parsing import CHUNK_OVERLAP, CHUNK_SIZE, parse_files
+from ingest import IngestReport
+from llm_pool import estimate_tokens, run_ordered
+from metrics import REGISTRY as METRICS
+from prompts import BATCH_QA_PROMPT, BATCH_SECTION, QA_PROMPT
+from qa_store import DEFAULT_PAGE_SIZE, QASessionStore
+from qa_stream import CompletionCancelled, IncrementalQAParser, parse_qa_pairs
+from sharding import DEFAULT_SHARD_CAPACITY, ShardedCollection
+
+DEFAULT_LLM_MODEL = "qwen25-72b"
+DEFAULT_LLM_MAX_WORKERS = 8
+DEFAULT_BATCH_TOKEN_BUDGET = 6000
+# 写入知识库的QA对内容字数上限
+QA_CONTENT_MAX_CHARS = 4000
+# Collection 接口的请求超时（秒）
+API_TIMEOUT = 30
+
+
+def request_completion(router, prompt, model=DEFAULT_LLM_MODEL):
+    """通过 router（llm_router.LLMRouter）获取模型的响应，出错时抛出异常"""
+    def request(endpoint):
+        endpoint.limiter.acquire(estimate_tokens(prompt))
+        with METRICS.timer("autoqag_llm_request_seconds", endpoint=endpoint.name, mode="plain"):
+            response = endpoint.client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+            )
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            METRICS.inc("autoqag_llm_prompt_tokens_total", usage.prompt_tokens or 0, endpoint=endpoint.name)
+            METRICS.inc("autoqag_llm_completion_tokens_total", usage.completion_tokens or 0, endpoint=endpoint.name)
+        if usage is not None and usage.completion_tokens:
+            endpoint.limiter.charge(usage.completion_tokens)
+        return response.choices[0].message.content
+
+    return router.call(request)
+
+
+def stream_completion(router, prompt, model=DEFAULT_LLM_MODEL, on_text=None, cancel_event=None):
+    """流式获取模型的响应
+
+    on_text(delta) 在每次收到新内容时回调，返回 False 时提前终止；cancel_event 被设置时同样终止，
+    终止时抛出 CompletionCancelled。已经送出部分内容后端点出错时不再换端点重试。
+    """
+    parts = []
+
+    def request(endpoint):
+        endpoint.limiter.acquire(estimate_tokens(prompt))
+        with METRICS.timer("autoqag_llm_request_seconds", endpoint=endpoint.name, mode="stream"):
+            stream = endpoint.client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+                stream=True,
+            )
+            try:
+                for event in stream:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise CompletionCancelled("生成已取消")
+                    if not event.choices:
+                        continue
+                    delta = event.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        if on_text is not None and on_text(delta) is False:
+                            raise CompletionCancelled("响应格式异常，已提前终止")
+            finally:
+                # 关闭连接，让服务端停止继续生成
+                stream.close()
+                completion_tokens = estimate_tokens("".join(parts))
+                endpoint.limiter.charge(completion_tokens)
+                METRICS.inc("autoqag_llm_prompt_tokens_total", estimate_tokens(prompt), endpoint=endpoint.name)
+                METRICS.inc("autoqag_llm_completion_tokens_total", completion_tokens, endpoint=endpoint.name)
+        return "".join(parts)
+
+    return router.call(request, can_retry=lambda: not parts)
+
+
+def estimate_generation_cost(text_chunks, batch_size=1, batch_max_tokens=None):
+    """预估生成阶段的大模型调用次数和输入Token数，batch_size 大于 1 时按批量提示分组计算"""
+    overhead_tokens = QA_PROMPT.overhead_tokens
+    if batch_size <= 1:
+        return project_generation_cost(text_chunks, overhead_tokens)
+    groups = group_chunks_for_batching([chunk.page_content for chunk in text_chunks], batch_size, batch_max_tokens)
+    batch_overhead = BATCH_QA_PROMPT.overhead_tokens + BATCH_SECTION.overhead_tokens
+    chunk_tokens = sum(count_tokens(chunk.page_content) for chunk in text_chunks)
+    input_tokens = chunk_tokens + sum(overhead_tokens if len(group) == 1 else batch_overhead for group in groups)
+    return {"calls": len(groups), "chunk_tokens": chunk_tokens, "input_tokens": input_tokens}
+
+
+def chunk_token_budget(prompt_budget):
+    """扣除提示词模板后，每个文本块可用的Token数"""
+    return prompt_budget - QA_PROMPT.overhead_tokens
+
+
+def parse_qa_response(response, chunk_text):
+    """解析模型响应中的全部问答对并附上原文文本块，无法解析时返回空列表"""
+    qa_pairs = parse_qa_pairs(response)
+    for qa_pair in qa_pairs:
+        qa_pair["chunk"] = chunk_text
+    return qa_pairs
+
+
+def complete_chunk(router, chunk_text, model=DEFAULT_LLM_MODEL, cache=None, on_text=None, cancel_event=None):
+    """为单个文本块生成响应，传入 cache（completion_cache.CompletionCache）时优先读取缓存
+
+    传入 on_text 时以流式方式请求，参数含义同 stream_completion。
+    """
+    key = make_cache_key(model, QA_PROMPT.version, chunk_text)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            if on_text is not None:
+                on_text(cached)
+            return cached
+    prompt, _ = QA_PROMPT.build(chunk_text=chunk_text)
+    if on_text is not None:
+        response = stream_completion(router, prompt, model=model, on_text=on_text, cancel_event=cancel_event)
+    else:
+        response = request_completion(router, prompt, model=model)
+    if cache is not None and response:
+        cache.put(key, response)
+    return response
+
+
+def build_batch_qa_prompt(chunk_texts, record=False):
+    """构造一次请求处理多个文本块的提示词，各文本块以编号标记，要求以 JSON 返回；record 为 True 时计入提示词Token数指标"""
+    sections = "\n\n".join(
+        BATCH_SECTION.render(index=i, chunk_text=chunk_text) for i, chunk_text in enumerate(chunk_texts, 1)
+    )
+    if record:
+        return BATCH_QA_PROMPT.build(count=len(chunk_texts), sections=sections)[0]
+    return BATCH_QA_PROMPT.render(count=len(chunk_texts), sections=sections)
+
+
+def parse_batch_qa_response(response):
+    """解析批量请求的 JSON 响应，返回 {文本编号: [{"question", "answer"}]}，无法解析时返回空字典
+
+    每项可以是 {"id", "pairs": [...]}，也可以是旧格式的单个 {"id", "question", "answer"}。
+    """
+    start = response.find("{")
+    end = response.rfind("}")
+    if start < 0 or end < start:
+        return {}
+    try:
+        data = json.loads(response[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    results = {}
+    for item in data.get("results", []) if isinstance(data, dict) else []:
+        try:
+            chunk_id = int(item["id"])
+            pairs = item["pairs"] if "pairs" in item else [item]
+            qa_pairs = [{"question": str(pair["question"]).strip(), "answer": str(pair["answer"]).strip()}
+                        for pair in pairs]
+        except (KeyError, TypeError, ValueError):
+            continue
+        qa_pairs = [qa_pair for qa_pair in qa_pairs if qa_pair["question"] and qa_pair["answer"]]
+        if qa_pairs:
+            results[chunk_id] = qa_pairs
+    return results
+
+
+def group_chunks_for_batching(chunk_texts, batch_size, max_tokens=None):
+    """按顺序把文本块分组，每组不超过 batch_size 个且文本总Token数不超过 max_tokens，返回下标分组"""
+    max_tokens = max_tokens or DEFAULT_BATCH_TOKEN_BUDGET
+    groups = []
+    current = []
+    current_tokens = 0
+    for i, chunk_text in enumerate(chunk_texts):
+        tokens = count_tokens(chunk_text) if batch_size > 1 else 0
+        if current and (len(current) >= batch_size or current_tokens + tokens > max_tokens):
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def complete_batch(router, chunk_texts, model=DEFAULT_LLM_MODEL, cache=None):
+    """在一次请求中为多个文本块生成响应，返回与输入对应的 [(响应, 错误)]
+
+    批量响应中缺失或无法解析的文本块回退为单独调用，响应统一为以空行分隔的 "Q: ...\\nA: ..." 格式。
+    """
+    if len(chunk_texts) == 1:
+        try:
+            return [(complete_chunk(router, chunk_texts[0], model=model, cache=cache), None)]
+        except Exception as e:
+            return [(None, e)]
+    keys = [make_cache_key(model, BATCH_QA_PROMPT.version, chunk_text) for chunk_text in chunk_texts]
+    responses = [cache.get(key) if cache is not None else None for key in keys]
+    pending = [i for i, response in enumerate(responses) if response is None]
+    if len(pending) > 1:
+        raw = request_completion(router, build_batch_qa_prompt([chunk_texts[i] for i in pending], record=True),
+                                 model=model)
+        parsed = parse_batch_qa_response(raw or "")
+        for j, i in enumerate(pending, 1):
+            if j in parsed:
+                responses[i] = "\n\n".join(f"Q: {qa_pair['question']}\nA: {qa_pair['answer']}" for qa_pair in parsed[j])
+                if cache is not None:
+                    cache.put(keys[i], responses[i])
+    results = []
+    for i, response in enumerate(responses):
+        if response is not None:
+            results.append((response, None))
+            continue
+        try:
+            results.append((complete_chunk(router, chunk_texts[i], model=model, cache=cache), None))
+        except Exception as e:
+            results.append((None, e))
+    return results
+
+
+def generate_qa_pairs(router, text_chunks, model=DEFAULT_LLM_MODEL, cache=None, max_workers=None, batch_size=1,
+                      batch_max_tokens=None, stream=False, store=None, on_chunk_done=None, on_progress=None,
+                      on_tick=None, cancel_event=None):
+    """并发生成问答对，结果保持输入顺序
+
+    batch_size 大于 1 时把多个短文本块合并到一次请求中。stream 为 True 时逐Token接收响应，
+    响应格式异常时提前终止该请求，流式模式下不合并文本块；on_tick(live_parsers) 在等待期间定期回调，
+    live_parsers 为 {文本块下标: 正在生成的 IncrementalQAParser}，可用于实时展示。
+    on_chunk_done(index, qa_pairs, error) 在每个文本块完成时回调，无法解析时 qa_pairs 为空列表、error 为 ValueError；
+    on_progress(completed, total) 在每组文本块完成后回调。回调均在调用线程中执行，抛出异常时取消其余请求。
+    传入 store（QASessionStore）时QA对生成后立即写入 store、不在内存中保留，返回 store。
+    """
+    qa_by_index = [[] for _ in text_chunks] if store is None else None
+    groups = group_chunks_for_batching([chunk.page_content for chunk in text_chunks], 1 if stream else batch_size,
+                                       batch_max_tokens)
+    live_parsers = {}
+    completed = 0
+
+    def stream_group(group):
+        i = group[0]
+        parser = live_parsers[i] = IncrementalQAParser()
+
+        def on_text(delta):
+            return not parser.feed(delta).looks_malformed()
+
+        try:
+            return [(complete_chunk(router, text_chunks[i].page_content, model=model, cache=cache, on_text=on_text,
+                                    cancel_event=cancel_event), None)]
+        except Exception as e:
+            return [(None, e)]
+        finally:
+            live_parsers.pop(i, None)
+
+    def handle_response(i, response, error):
+        qa_pairs = []
+        if error is None and response:
+            try:
+                qa_pairs = parse_qa_response(response, text_chunks[i].page_content)
+                if not qa_pairs:
+                    error = ValueError(f"无法解析响应: {response}")
+            except Exception as e:
+                error = ValueError(f"处理响应时出错: {e}")
+        if qa_pairs and store is not None:
+            store.add_many((i, qa_pair, text_chunks[i].metadata) for qa_pair in qa_pairs)
+        elif qa_pairs:
+            qa_by_index[i] = qa_pairs
+        if on_chunk_done is not None:
+            on_chunk_done(i, qa_pairs, error)
+
+    def on_done(g, results, error):
+        nonlocal completed
+        for k, i in enumerate(groups[g]):
+            response, chunk_error = results[k] if results else (None, error)
+            handle_response(i, response, chunk_error)
+        completed += len(groups[g])
+        if on_progress is not None:
+            on_progress(completed, len(text_chunks))
+
+    run_ordered(
+        stream_group if stream else (
+            lambda group: complete_batch(router, [text_chunks[i].page_content for i in group], model=model, cache=cache)
+        ),
+        groups,
+        max_workers=max_workers or DEFAULT_LLM_MAX_WORKERS,
+        on_done=on_done,
+        on_tick=(lambda: on_tick(dict(live_parsers))) if on_tick is not None else None,
+        cancel_event=cancel_event,
+    )
+    if store is not None:
+        return store
+    return [qa_pair for qa_pairs in qa_by_index for qa_pair in qa_pairs]
+
+
+def parse_documents(files, max_workers=None, chunking=None, on_done=None):
+    """多进程并行解析 [(文件名, 内容)] 并分割为文本块，返回 (按文件顺序排列的文本块, 错误信息列表)
+
+    chunking 为 (分割方式, 块大小, 重叠)，分割方式 "chars" 按字符、"tokens" 按Token，默认按字符分割；
+    on_done(index) 在每个文件解析完成后回调。
+    """
+    mode, chunk_size, chunk_overlap = chunking or ("chars", CHUNK_SIZE, CHUNK_OVERLAP)
+    results = parse_files(files, max_workers=max_workers, on_done=on_done, mode=mode, chunk_size=chunk_size,
+                          chunk_overlap=chunk_overlap)
+    text_chunks = []
+    errors = []
+    for (name, _), (chunks, error) in zip(files, results):
+        if error:
+            errors.append(f"处理文件 {name} 时发生错误: {error}")
+        elif chunks is None:
+            errors.append(f"文件 {name} 处理失败，请检查文件格式是否正确。")
+        else:
+            text_chunks.extend(chunks)
+    return text_chunks, errors
+
+
+def deduplicate_chunks(text_chunks, index, use_history=True):
+    """用 index（dedup.NearDuplicateIndex）过滤近重复的文本块，返回 (保留的文本块, 去重统计)"""
+    kept, report = index.filter([chunk.page_content for chunk in text_chunks], use_history=use_history)
+    return [text_chunks[i] for i in kept], report
+
+
+def build_qa_content(qa_pair):
+    """拼接写入知识库的QA对内容，超过 QA_CONTENT_MAX_CHARS 字时截断，格式无效时返回 None"""
+    if "question" in qa_pair and "answer" in qa_pair and "chunk" in qa_pair:
+        content = f"问题：{qa_pair['question']}\n答案：{qa_pair['answer']}\n原文：{qa_pair['chunk']}"
+        return content[:QA_CONTENT_MAX_CHARS]
+    return None
+
+
+def ingest_pages(ingestor, collection_id, pages, upserter=None, sharded=None, on_result=None, after_page=None):
+    """逐页写入 chunk 内容，返回 IngestReport
+
+    on_result(index, result) 在每条记录写入后回调，index 为跨页的记录序号，result 为 ingest.ChunkIngestor 的逐条结果。
+    传入 upserter（record_index.Upserter）时幂等写入；传入 sharded（ShardedCollection）时按分片容量分配写入位置。
+    after_page() 在每页写完（并登记写入索引）后回调，可在其中抛出异常中止写入。
+    返回的逐条结果中不保留接口返回的 chunk，避免占用内存。
+    """
+    start = time.perf_counter()
+    results = []
+    for contents in pages:
+        offset = len(results)
+
+        def on_page_result(i, result):
+            if on_result is not None:
+                on_result(offset + i, result)
+
+        if upserter is not None:
+            report = upserter.upsert(contents, on_result=on_page_result)
+        elif sharded is not None:
+            report = sharded.ingest(ingestor, contents, on_result=on_page_result)
+        else:
+            report = ingestor.ingest(collection_id, contents, on_result=on_page_result)
+        for result in report.results:
+            result["index"] += offset
+            result["chunk"] = None
+        results.extend(report.results)
+        if after_page is not None:
+            after_page()
+    return IngestReport(results, time.perf_counter() - start)
+
+
+def insert_qa_pairs(ingestor, collection_id, qa_pairs, upserter=None, sharded=None, on_result=None, after_page=None,
+                    page_size=DEFAULT_PAGE_SIZE):
+    """把QA对（列表或 QASessionStore，后者按页读取）写入 Collection，返回 (IngestReport, 格式无效的QA对数)
+
+    on_result(index, result) 在每个QA对处理后回调，index 为QA对序号，格式无效的QA对 result 为 None；
+    upserter、sharded、after_page 含义同 ingest_pages。
+    """
+    valid_indices = []
+    invalid = 0
+
+    def content_pages():
+        nonlocal invalid
+        if isinstance(qa_pairs, QASessionStore):
+            pages = qa_pairs.iter_pages(page_size)
+        else:
+            pages = [(0, list(enumerate(qa_pairs)))]
+        for offset, rows in pages:
+            contents = []
+            for k, (_, qa_pair) in enumerate(rows):
+                content = build_qa_content(qa_pair)
+                if content is None:
+                    invalid += 1
+                    if on_result is not None:
+                        on_result(offset + k, None)
+                    continue
+                valid_indices.append(offset + k)
+                contents.append(content)
+            if contents:
+                yield contents
+
+    def on_ingested(j, result):
+        if on_result is not None:
+            on_result(valid_indices[j], result)
+
+    report = ingest_pages(ingestor, collection_id, content_pages(), upserter=upserter, sharded=sharded,
+                          on_result=on_ingested, after_page=after_page)
+    return report, invalid
+
+
+class CollectionClient:
+    """TaskingAI Collection 接口，请求失败时抛出 requests.RequestException"""
+
+    def __init__(self, base_url, headers, timeout=API_TIMEOUT):
+        self.base_url = base_url
+        self.headers = headers
+        self.timeout = timeout
+
+    def request(self, method, path, **kwargs):
+        response = requests.request(method, f"{self.base_url}{path}", headers=self.headers, timeout=self.timeout,
+                                    **kwargs)
+        response.raise_for_status()
+        return response.json().get("data")
+
+    def list(self):
+        return self.request("GET", "collections")
+
+    def get(self, collection_id):
+        return self.request("GET", f"collections/{collection_id}")
+
+    def create(self, name, embedding_model_id, capacity):
+        data = {"name": name, "embedding_model_id": embedding_model_id, "capacity": capacity}
+        return self.request("POST", "collections", json=data)
+
+
+def open_sharded_collection(client, manifest, collection_id, capacity=DEFAULT_SHARD_CAPACITY, embedding_model_id=None):
+    """以 collection_id 所在的分片组创建 ShardedCollection，写满后通过 client（CollectionClient）创建新的分片
+
+    不在任何分片组中的 Collection 以自身的 collection_id 作为分片组，新分片命名为 "<名称>_partN"；
+    新分片沿用原 Collection 的 Embedding 模型，未能获取时使用 embedding_model_id。
+    """
+    details = client.get(collection_id) or {"collection_id": collection_id}
+    group = manifest.group_of(collection_id)
+    embedding_model_id = details.get("embedding_model_id") or embedding_model_id
+    return ShardedCollection(
+        group or collection_id,
+        lambda name, shard_capacity: client.create(name, embedding_model_id, shard_capacity),
+        manifest=manifest,
+        capacity=details.get("capacity") or capacity,
+        base_collection=details,
+        name=re.sub(r"_part\d+$", "", details.get("name") or collection_id),
+        collections=None if group else client.list(),
+    )
+
+
+def record_scope(manifest, collection_id):
+    """记录索引和文档清单的范围：Collection 所在的分片组（manifest 为 ShardManifest），不在分片组中时为 collection_id"""
+    return manifest.group_of(collection_id) or collection_id
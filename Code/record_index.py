@@ -0,0 +1,208 @@
+"""幂等写入：本地 SQLite 索引记录每条内容对应的远端 chunk，重复写入时跳过未变化的记录、更新已变化的记录
+
+QA对内容（问题/答案/原文）以去掉首尾空白的“问题 + 答案 + 原文”的哈希为记录标识，同一文本块中问题相同、答案不同的
+QA对是不同的记录；完整内容的哈希作为版本，只有格式变化（如截断长度）时才原地更新。其他内容以内容哈希同时作为标识和版本。
+索引的范围为分片组（不在分片组中的 Collection 为其自身的 collection_id），同一 Collection 不论是否启用分片都使用同一范围。
+索引可由 Collection 中已有的 chunk 重建。
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from ingest import IngestReport
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "records.sqlite3")
+# 与 AutoQAG.build_qa_content 的拼接格式对应
+_QA_CONTENT_PATTERN = re.compile(r"^问题：(?P<question>.*?)\n答案：(?P<answer>.*?)\n原文：(?P<source>.*)$", re.S)
+
+
+def _hash(*parts):
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def record_keys(content):
+    """返回内容的 (记录标识, 版本哈希)"""
+    match = _QA_CONTENT_PATTERN.match(content)
+    if match is None:
+        digest = _hash(content)
+        return digest, digest
+    question, answer, source = (match.group(name).strip() for name in ("question", "answer", "source"))
+    return _hash(question, answer, source), _hash(content)
+
+
+class RecordIndex:
+    """记录索引：(范围, 记录标识) -> (版本哈希, collection_id, chunk_id)
+
+    范围为分片组（同一组的记录可能分布在多个分片 Collection 中），不在分片组中的 Collection 为其 collection_id。
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "scope TEXT, identity TEXT, version TEXT, collection_id TEXT, chunk_id TEXT, "
+            "PRIMARY KEY (scope, identity))"
+        )
+        self._conn.commit()
+
+    def get(self, scope, identity):
+        """返回 (version, collection_id, chunk_id)，不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version, collection_id, chunk_id FROM records WHERE scope = ? AND identity = ?", (scope, identity)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def put_many(self, scope, rows):
+        """写入 [(identity, version, collection_id, chunk_id)]"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO records (scope, identity, version, collection_id, chunk_id) VALUES (?, ?, ?, ?, ?)",
+                [(scope, *row) for row in rows],
+            )
+            self._conn.commit()
+
+    def remove_chunks(self, scope, chunk_ids):
+        """删除指向已删除远端 chunk 的记录，之后写入相同内容时会重新插入"""
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM records WHERE scope = ? AND chunk_id = ?", [(scope, chunk_id) for chunk_id in chunk_ids]
+            )
+            self._conn.commit()
+
+    def count(self, scope):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM records WHERE scope = ?", (scope,)).fetchone()[0]
+
+    def rebuild(self, scope, chunks):
+        """用远端已有的 chunk（含 content、chunk_id、collection_id）重建某个范围的索引，返回登记的记录数"""
+        rows = {}
+        for chunk in chunks:
+            content = chunk.get("content")
+            if not content or not chunk.get("chunk_id"):
+                continue
+            identity, version = record_keys(content)
+            rows[identity] = (identity, version, chunk.get("collection_id"), chunk["chunk_id"])
+        with self._lock:
+            self._conn.execute("DELETE FROM records WHERE scope = ?", (scope,))
+            self._conn.executemany(
+                "INSERT INTO records (scope, identity, version, collection_id, chunk_id) VALUES (?, ?, ?, ?, ?)",
+                [(scope, *row) for row in rows.values()],
+            )
+            self._conn.commit()
+        return len(rows)
+
+
+class Upserter:
+    """按记录索引把内容幂等地写入 Collection（或分片组）
+
+    未变化的记录直接跳过，已变化的记录原地更新远端 chunk，新记录插入；传入 sharded 时新记录按分片分配。
+    scope 为索引范围，默认为 sharded 的分片组或 collection_id。
+    """
+
+    def __init__(self, index, ingestor, collection_id, sharded=None, scope=None):
+        self.index = index
+        self.ingestor = ingestor
+        self.collection_id = collection_id
+        self.sharded = sharded
+        self.scope = scope or (sharded.group if sharded is not None else collection_id)
+        self._inflight = {}  # 正在写入的标识 -> 写入结束时设置的 Event
+        self._lock = threading.Lock()
+
+    def _skipped(self, i, existing):
+        _, collection_id, chunk_id = existing
+        return {"index": i, "ok": True, "chunk": {"chunk_id": chunk_id, "collection_id": collection_id},
+                "chunk_id": chunk_id, "collection_id": collection_id, "attempts": 0, "error": None, "skipped": True}
+
+    def plan(self, contents):
+        """返回 (各条内容的 (标识, 版本), 待发送的 [(下标, 索引中已有的记录或 None)], 已跳过的结果)"""
+        keys = [record_keys(content) for content in contents]
+        pending = []
+        skipped = []
+        seen = set()
+        for i, (identity, version) in enumerate(keys):
+            existing = self.index.get(self.scope, identity)
+            if identity in seen or (existing is not None and existing[0] == version):
+                skipped.append(self._skipped(i, existing or (version, None, None)))
+                continue
+            seen.add(identity)
+            pending.append((i, existing))
+        return keys, pending, skipped
+
+    def upsert(self, contents, on_result=None):
+        """并行写入 contents，返回覆盖全部内容的 IngestReport，on_result(index, result) 同 ChunkIngestor.ingest"""
+        start = time.perf_counter()
+        keys, pending, skipped = self.plan(contents)
+        results = [None] * len(contents)
+        for result in skipped:
+            results[result["index"]] = result
+            if on_result is not None:
+                on_result(result["index"], result)
+
+        inserts = [i for i, existing in pending if existing is None]
+        targets = dict(zip(inserts, self.sharded.allocate(len(inserts)))) if self.sharded is not None else {}
+        items = []
+        for i, existing in pending:
+            if existing is None:
+                items.append((targets.get(i, self.collection_id), contents[i]))
+            else:
+                items.append((existing[1], contents[i], existing[2]))
+
+        def on_sent(j, result):
+            result["index"] = pending[j][0]
+            if on_result is not None:
+                on_result(pending[j][0], result)
+
+        report = self.ingestor.ingest_routed(items, on_result=on_sent)
+        for j, result in enumerate(report.results):
+            result["index"] = pending[j][0]
+            results[pending[j][0]] = result
+        if self.sharded is not None:
+            self.sharded.record(
+                [result for (_, existing), result in zip(pending, report.results) if existing is None],
+                [keys[i][0] for i in range(len(contents))],
+            )
+        self.index.put_many(self.scope, [
+            (*keys[result["index"]], result["collection_id"], result["chunk_id"])
+            for result in report.results if result["ok"]
+        ])
+        return IngestReport(results, time.perf_counter() - start)
+
+    def upsert_one(self, content):
+        """写入单条内容，返回 (chunk, 是否跳过)，供流水线等逐条写入的场景使用
+
+        同一记录正在由其他线程写入时等待其结束，再按写入后的索引返回远端 chunk（写入失败时由本线程重试）。
+        """
+        identity, version = record_keys(content)
+        while True:
+            with self._lock:
+                existing = self.index.get(self.scope, identity)
+                if existing is not None and existing[0] == version:
+                    return self._skipped(0, existing)["chunk"], True
+                done = self._inflight.get(identity)
+                if done is None:
+                    self._inflight[identity] = threading.Event()
+                    break
+            done.wait()
+        try:
+            if existing is not None:
+                chunk, _ = self.ingestor.update_chunk(existing[1], existing[2], content)
+                collection_id, chunk_id = existing[1], chunk.get("chunk_id", existing[2])
+            elif self.sharded is not None:
+                chunk = self.sharded.create_chunk(self.ingestor, content, key=identity)
+                collection_id, chunk_id = chunk.get("collection_id"), chunk.get("chunk_id")
+            else:
+                chunk, _ = self.ingestor.create_chunk(self.collection_id, content)
+                collection_id, chunk_id = self.collection_id, chunk.get("chunk_id")
+            self.index.put_many(self.scope, [(identity, version, collection_id, chunk_id)])
+            return chunk, False
+        finally:
+            with self._lock:
+                self._inflight.pop(identity).set()
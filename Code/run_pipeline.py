@@ -0,0 +1,209 @@
+"""命令行批量流水线：解析文件 -> 生成QA对 -> 插入Collection，无需打开 Streamlit 页面
+
+示例：
+    python run_pipeline.py --run-dir runs/handbook --collection-id COLLECTION_ID docs/*.pdf
+
+中断后使用相同的 --run-dir 和文件重新执行即可从检查点继续。
+"""
+import argparse
+import json
+import os
+import sys
+
+from checkpoint import CheckpointJournal, content_hash
+from completion_cache import open_cache
+from dedup import NearDuplicateIndex
+from ingest import ChunkIngestor
+from llm_router import LLMRouter
+from metrics import write_report
+from qa_filter import QAFilter
+from qa_workflow import (
+    DEFAULT_LLM_MAX_WORKERS, DEFAULT_LLM_MODEL, chunk_token_budget, deduplicate_chunks, estimate_generation_cost,
+    generate_qa_pairs, insert_qa_pairs, parse_documents, record_scope,
+)
+from record_index import RecordIndex, Upserter
+from sharding import ShardManifest
+
+# 按Token预算分割时相邻文本块的默认重叠Token数
+DEFAULT_OVERLAP_TOKENS = 0
+
+
+def read_files(paths):
+    """读取本地文件，返回 [(文件名, 内容)]"""
+    files = []
+    for path in paths:
+        with open(path, "rb") as f:
+            files.append((os.path.basename(path), f.read()))
+    return files
+
+
+def print_progress(completed, total):
+    print(f"\r进度: {completed}/{total}", end="\n" if completed >= total else "", flush=True)
+
+
+def chunk_key(index, text):
+    return f"{index}:{content_hash(text)}"
+
+
+def generate_stage(journal, router, text_chunks, model, max_workers, cache=None, batch_size=1):
+    """生成尚未完成的文本块，返回按文本块顺序排列的 [(key, qa_pair)]
+
+    一个文本块可生成多个QA对，第 n 个QA对的 key 为 "<文本块 key>#n"。
+    """
+    done = {key: event for key, event in journal.latest("generate").items() if event["status"] == "done"}
+    keys = [chunk_key(i, chunk.page_content) for i, chunk in enumerate(text_chunks)]
+    pending = [i for i, key in enumerate(keys) if key not in done]
+    print(f"文本块: {len(text_chunks)} | 已完成: {len(text_chunks) - len(pending)} | 待生成: {len(pending)}")
+
+    def on_chunk_done(j, qa_pairs, error):
+        key = keys[pending[j]]
+        if qa_pairs:
+            done[key] = {"stage": "generate", "key": key, "status": "done", "qa_pairs": qa_pairs}
+            journal.append(done[key])
+        else:
+            journal.append({"stage": "generate", "key": key, "status": "failed", "error": str(error)})
+            print(f"文本块 {pending[j] + 1} 生成失败: {error}", file=sys.stderr)
+
+    if pending:
+        generate_qa_pairs(
+            router,
+            [text_chunks[i] for i in pending],
+            model=model,
+            cache=cache,
+            max_workers=max_workers,
+            batch_size=batch_size,
+            on_chunk_done=on_chunk_done,
+            on_progress=print_progress,
+        )
+    generated = []
+    for key in keys:
+        if key in done:
+            generated.extend((f"{key}#{n}", qa_pair) for n, qa_pair in enumerate(done[key]["qa_pairs"]))
+    return generated
+
+
+def insert_stage(journal, ingestor, collection_id, generated):
+    """插入尚未成功插入的QA对，已写入过且未变化的QA对按本地记录索引跳过"""
+    inserted = {key for key, event in journal.latest("insert").items() if event["status"] == "done"}
+    pending = [(key, qa_pair) for key, qa_pair in generated if key not in inserted]
+    print(f"QA对: {len(generated)} | 已插入: {len(generated) - len(pending)} | 待插入: {len(pending)}")
+    completed = 0
+
+    def on_result(j, result):
+        nonlocal completed
+        key = pending[j][0]
+        if result and result["ok"]:
+            journal.append({"stage": "insert", "key": key, "status": "done", "chunk_id": (result["chunk"] or {}).get("chunk_id")})
+        else:
+            journal.append({"stage": "insert", "key": key, "status": "failed"})
+            print(f"QA对 {key} 插入失败: {result['error'] if result else 'QA对格式无效'}", file=sys.stderr)
+        completed += 1
+        print_progress(completed, len(pending))
+
+    if not pending:
+        return 0, 0
+    upserter = Upserter(RecordIndex(), ingestor, collection_id, scope=record_scope(ShardManifest(), collection_id))
+    report, invalid = insert_qa_pairs(ingestor, collection_id, [qa_pair for _, qa_pair in pending], upserter=upserter,
+                                      on_result=on_result)
+    return report.success_count, report.fail_count + invalid
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="批量生成QA对并插入 TaskingAI Collection（支持断点续跑）")
+    parser.add_argument("files", nargs="+", help="待处理的文档路径")
+    parser.add_argument("--run-dir", required=True, help="任务目录，用于保存检查点日志和输出")
+    parser.add_argument("--collection-id", help="插入的目标 Collection ID，不指定则只生成不插入")
+    parser.add_argument("--workers", type=int, default=DEFAULT_LLM_MAX_WORKERS, help="并发请求数")
+    parser.add_argument("--parse-workers", type=int, help="并行解析文件的进程数，默认使用全部CPU核心")
+    parser.add_argument("--model", default=DEFAULT_LLM_MODEL, help="生成QA对使用的模型")
+    parser.add_argument("--no-cache", action="store_true", help="不使用生成缓存")
+    parser.add_argument("--batch-size", type=int, default=1, help="每次请求合并的文本块数，1 表示不合并")
+    parser.add_argument("--token-budget", type=int,
+                        help="按Token预算分割：每次请求的输入Token上限（含提示词模板），不指定则按字符分割")
+    parser.add_argument("--overlap-tokens", type=int, default=DEFAULT_OVERLAP_TOKENS, help="按Token预算分割时相邻文本块的重叠Token数")
+    parser.add_argument("--dedup-threshold", type=float,
+                        help="跳过本次输入中相似度不低于该阈值的近重复文本块（不与历史运行比较，断点续跑由检查点负责）")
+    parser.add_argument("--qa-filter", action="store_true",
+                        help="插入前过滤过短、答案与原文重合度过低以及问题重复的QA对")
+    parser.add_argument("--taskingai-base-url", default=os.environ.get("TASKINGAI_BASE_URL"))
+    parser.add_argument("--taskingai-api-key", default=os.environ.get("TASKINGAI_API_KEY"))
+    parser.add_argument("--llm-base-url", default=os.environ.get("OPENAI_BASE_URL"))
+    parser.add_argument("--llm-api-key", default=os.environ.get("OPENAI_API_KEY"))
+    parser.add_argument("--llm-endpoints",
+                        help="多端点配置 JSON 文件，内容为 [{\"base_url\", \"api_key\", \"weight\", \"max_concurrency\"}, ...]")
+    parser.add_argument("--metrics-out",
+                        help="运行结束后写出各阶段耗时与计数，扩展名为 .prom 时为 Prometheus 文本格式，否则为 JSON 运行报告")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        return run(args)
+    finally:
+        if args.metrics_out:
+            write_report(args.metrics_out)
+            print(f"运行指标已保存到 {args.metrics_out}")
+
+
+def build_router(args):
+    """由 --llm-endpoints 或 --llm-base-url/--llm-api-key 创建大模型端点路由"""
+    if args.llm_endpoints:
+        with open(args.llm_endpoints, encoding="utf-8") as f:
+            return LLMRouter.from_config(json.load(f))
+    if not args.llm_base_url or not args.llm_api_key:
+        raise SystemExit("请通过 --llm-base-url/--llm-api-key（或 OPENAI_BASE_URL/OPENAI_API_KEY）或 --llm-endpoints 指定大模型接口")
+    return LLMRouter.from_config([{"base_url": args.llm_base_url, "api_key": args.llm_api_key}])
+
+
+def run(args):
+    router = build_router(args)
+    ingestor = None
+    if args.collection_id:
+        if not args.taskingai_base_url:
+            raise SystemExit("插入 Collection 需要通过 --taskingai-base-url（或 TASKINGAI_BASE_URL）指定 TaskingAI 接口")
+        ingestor = ChunkIngestor(args.taskingai_base_url, {"Authorization": f"Bearer {args.taskingai_api_key}"})
+    journal = CheckpointJournal(os.path.join(args.run_dir, "journal.jsonl"))
+
+    chunking = None
+    if args.token_budget:
+        chunking = ("tokens", chunk_token_budget(args.token_budget), args.overlap_tokens)
+    text_chunks, errors = parse_documents(read_files(args.files), max_workers=args.parse_workers, chunking=chunking)
+    for error in errors:
+        print(error, file=sys.stderr)
+    if not text_chunks:
+        print("文件处理失败，请检查文件格式是否正确。", file=sys.stderr)
+        return 1
+    if args.dedup_threshold:
+        text_chunks, dedup_report = deduplicate_chunks(
+            text_chunks, NearDuplicateIndex(threshold=args.dedup_threshold), use_history=False
+        )
+        print(f"跳过近重复文本块 {dedup_report.saved_calls} 个，节省 {dedup_report.saved_calls} 次大模型调用")
+    projection = estimate_generation_cost(text_chunks, args.batch_size)
+    print(f"预计调用大模型 {projection['calls']} 次，输入约 {projection['input_tokens']} Token")
+
+    cache = None if args.no_cache else open_cache()
+    generated = generate_stage(journal, router, text_chunks, args.model, args.workers, cache, args.batch_size)
+    if args.qa_filter:
+        _, filter_report = QAFilter().filter([qa_pair for _, qa_pair in generated])
+        dropped = {i for i, _, _ in filter_report.dropped}
+        generated = [item for i, item in enumerate(generated) if i not in dropped]
+        print(f"过滤掉 {len(dropped)} 个QA对（过短 {filter_report.count('too_short')}，"
+              f"重合度过低 {filter_report.count('low_overlap')}，问题重复 {filter_report.count('duplicate')}）")
+    output_path = os.path.join(args.run_dir, "qa_pairs.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"qa_pairs": [qa_pair for _, qa_pair in generated]}, f, ensure_ascii=False, indent=4)
+    print(f"已生成 {len(generated)} 个QA对，已保存到 {output_path}")
+    for stat in router.stats():
+        print(f"端点 {stat['name']}: 状态 {stat['state']} | 请求 {stat['requests']} | 失败 {stat['failures']}")
+
+    if ingestor is not None:
+        success_count, fail_count = insert_stage(journal, ingestor, args.collection_id, generated)
+        print(f"数据插入完成！成功: {success_count} | 失败: {fail_count}")
+        if fail_count:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""Collection 自动分片：跟踪各分片的已用容量，写满后自动创建新分片，并在本地清单中记录每条记录写入的分片
+
+分片组以一个稳定的键（通常是首个分片的 collection_id）标识，分片 Collection 命名为 "<名称>_part1"、"<名称>_part2"……
+首次使用时会登记已存在的同名 _partN Collection。清单保存在 SQLite 中，可在多次导入之间复用；
+分配写入位置和创建新分片在清单的写事务中进行，多个进程同时写入同一分片组时不会重复创建分片。
+"""
+import os
+import re
+import sqlite3
+import threading
+
+from checkpoint import content_hash
+
+DEFAULT_MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "shards.sqlite3")
+DEFAULT_SHARD_CAPACITY = 1000
+# 等待其他进程完成分配（可能包含一次创建 Collection 的请求）的最长时间
+MANIFEST_LOCK_TIMEOUT = 120
+
+
+def shard_name(name, index):
+    return f"{name}_part{index}"
+
+
+def existing_shards(name, collections, capacity):
+    """从已有的 Collection 列表中找出名为 "<name>_partN" 的分片，按序号返回分片列表"""
+    pattern = re.compile(re.escape(name) + r"_part(\d+)")
+    shards = []
+    for collection in collections or ():
+        match = pattern.fullmatch(collection.get("name") or "")
+        if match and collection.get("collection_id"):
+            shards.append({"collection_id": collection["collection_id"], "shard_index": int(match.group(1)),
+                           "capacity": collection.get("capacity") or capacity, "used": collection.get("num_chunks") or 0})
+    return sorted(shards, key=lambda shard: shard["shard_index"])
+
+
+class ShardManifest:
+    """分片清单：分片组 -> 分片 Collection 及其已用容量，记录键 -> 所在分片"""
+
+    def __init__(self, path=DEFAULT_MANIFEST_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=MANIFEST_LOCK_TIMEOUT, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS shards ("
+            "collection_id TEXT PRIMARY KEY, group_name TEXT, shard_index INTEGER, capacity INTEGER, used INTEGER)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "group_name TEXT, record_key TEXT, collection_id TEXT, chunk_id TEXT, PRIMARY KEY (group_name, record_key))"
+        )
+        self._conn.commit()
+
+    def _shards(self, group):
+        rows = self._conn.execute(
+            "SELECT collection_id, shard_index, capacity, used FROM shards WHERE group_name = ? ORDER BY shard_index",
+            (group,),
+        ).fetchall()
+        return [dict(zip(("collection_id", "shard_index", "capacity", "used"), row)) for row in rows]
+
+    def _insert_shard(self, group, shard):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO shards (collection_id, group_name, shard_index, capacity, used) VALUES (?, ?, ?, ?, ?)",
+            (shard["collection_id"], group, shard["shard_index"], shard["capacity"], shard["used"]),
+        )
+
+    def _transaction(self, fn):
+        """在写事务（BEGIN IMMEDIATE）中执行 fn，其他进程的写事务会等待本事务结束"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn()
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+            return result
+
+    def shards(self, group):
+        """按分片序号返回 [{"collection_id", "shard_index", "capacity", "used"}]"""
+        with self._lock:
+            return self._shards(group)
+
+    def group_of(self, collection_id):
+        """返回 Collection 所属的分片组，不在清单中时返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT group_name FROM shards WHERE collection_id = ?", (collection_id,)).fetchone()
+        return row[0] if row else None
+
+    def init_group(self, group, shards):
+        """分片组还没有分片时登记 shards（已存在的 Collection），返回分片组当前的分片列表"""
+        def init():
+            if not self._shards(group):
+                for shard in shards:
+                    self._insert_shard(group, shard)
+            return self._shards(group)
+        return self._transaction(init)
+
+    def allocate(self, group, count, add_shard, start=0):
+        """为 count 条记录分配分片并计入已用容量，返回 (collection_id 列表, 分配后的分片列表)
+
+        从第 start 个有空间的分片开始轮流分配；所有分片都写满时调用 add_shard(shard_index) 创建新分片，
+        它应返回 (collection_id, capacity)。整个过程在一个写事务中完成。
+        """
+        def allocate():
+            shards = self._shards(group)
+            targets = []
+            position = start
+            while len(targets) < count:
+                open_shards = [shard for shard in shards if shard["used"] < shard["capacity"]]
+                if not open_shards:
+                    index = (shards[-1]["shard_index"] if shards else 0) + 1
+                    collection_id, capacity = add_shard(index)
+                    shard = {"collection_id": collection_id, "shard_index": index, "capacity": capacity, "used": 0}
+                    self._insert_shard(group, shard)
+                    shards.append(shard)
+                    continue
+                shard = open_shards[position % len(open_shards)]
+                position += 1
+                shard["used"] += 1
+                targets.append(shard["collection_id"])
+            self._conn.executemany(
+                "UPDATE shards SET used = ? WHERE collection_id = ?",
+                [(shard["used"], shard["collection_id"]) for shard in shards],
+            )
+            return targets, shards
+        return self._transaction(allocate)
+
+    def release(self, counts):
+        """归还已用容量，counts 为 {collection_id: 条数}"""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE shards SET used = MAX(used - ?, 0) WHERE collection_id = ?",
+                [(count, collection_id) for collection_id, count in counts.items()],
+            )
+            self._conn.commit()
+
+    def add_records(self, group, rows):
+        """记录写入位置，rows 为 [(record_key, collection_id, chunk_id)]"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO records (group_name, record_key, collection_id, chunk_id) VALUES (?, ?, ?, ?)",
+                [(group, key, collection_id, chunk_id) for key, collection_id, chunk_id in rows],
+            )
+            self._conn.commit()
+
+    def lookup(self, group, record_key):
+        """返回 (collection_id, chunk_id)，没有记录时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT collection_id, chunk_id FROM records WHERE group_name = ? AND record_key = ?", (group, record_key)
+            ).fetchone()
+        return tuple(row) if row else None
+
+
+class ShardedCollection:
+    """一组分片 Collection
+
+    allocate() 在仍有空间的分片之间轮流分配写入位置，使并行写入分散到各个分片；
+    所有分片都写满时调用 create_collection(name, capacity) 创建新分片，该函数应返回包含 collection_id 的字典。
+    group 为分片组在清单中的键，name 为分片 Collection 的名称前缀（默认同 group）。
+    首次使用时登记 base_collection（已有的 Collection，作为第 1 个分片）或 collections 中已存在的 "<name>_partN"。
+    """
+
+    def __init__(self, group, create_collection, manifest=None, capacity=DEFAULT_SHARD_CAPACITY, base_collection=None,
+                 name=None, collections=None):
+        self.group = group
+        self.name = name or group
+        self.create_collection = create_collection
+        self.manifest = manifest or ShardManifest()
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._next = 0
+        self._shards = self.manifest.shards(group)
+        if not self._shards:
+            found = existing_shards(self.name, collections, capacity)
+            if base_collection is not None and base_collection["collection_id"] not in {s["collection_id"] for s in found}:
+                # 已有 Collection 视为第 1 个分片（已有 _part1 时排在它之前），已有记录数计入已用容量
+                found.insert(0, {"collection_id": base_collection["collection_id"],
+                                 "shard_index": 0 if found and found[0]["shard_index"] <= 1 else 1,
+                                 "capacity": base_collection.get("capacity") or capacity,
+                                 "used": base_collection.get("num_chunks") or 0})
+            if found:
+                self._shards = self.manifest.init_group(group, found)
+
+    @property
+    def collection_ids(self):
+        return [shard["collection_id"] for shard in self._shards]
+
+    def _add_shard(self, index):
+        name = shard_name(self.name, index)
+        collection = self.create_collection(name, self.capacity)
+        if not collection or "collection_id" not in collection:
+            raise RuntimeError(f"创建分片 Collection {name} 失败")
+        return collection["collection_id"], self.capacity
+
+    def allocate(self, count):
+        """为 count 条记录分配写入的分片，返回与记录一一对应的 collection_id 列表"""
+        if count <= 0:
+            return []
+        with self._lock:
+            targets, self._shards = self.manifest.allocate(self.group, count, self._add_shard, self._next)
+            self._next += count
+        return targets
+
+    def release(self, collection_ids):
+        """归还写入失败的记录占用的容量"""
+        counts = {}
+        for collection_id in collection_ids:
+            counts[collection_id] = counts.get(collection_id, 0) + 1
+        if counts:
+            self.manifest.release(counts)
+
+    def record(self, results, keys):
+        """根据写入结果登记成功的记录并归还失败记录的容量，results 为 ChunkIngestor 的逐条结果"""
+        self.release([result["collection_id"] for result in results if not result["ok"]])
+        self.manifest.add_records(
+            self.group,
+            [(keys[result["index"]], result["collection_id"], result["chunk_id"]) for result in results if result["ok"]],
+        )
+
+    def ingest(self, ingestor, contents, keys=None, on_result=None):
+        """把 contents 分配到各分片并行写入，返回 IngestReport
+
+        keys 为各条记录在清单中的键，默认使用内容哈希。
+        """
+        keys = keys or [content_hash(content) for content in contents]
+        targets = self.allocate(len(contents))
+        report = ingestor.ingest_routed(list(zip(targets, contents)), on_result=on_result)
+        self.record(report.results, keys)
+        return report
+
+    def create_chunk(self, ingestor, content, key=None):
+        """写入单条记录，返回接口返回的 chunk"""
+        collection_id = self.allocate(1)[0]
+        try:
+            chunk, _ = ingestor.create_chunk(collection_id, content)
+        except Exception:
+            self.release([collection_id])
+            raise
+        chunk.setdefault("collection_id", collection_id)
+        self.manifest.add_records(self.group, [(key or content_hash(content), collection_id, chunk.get("chunk_id"))])
+        return chunk
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Code/ 下的模块以扁平方式互相导入
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Code"))
@@ -0,0 +1,64 @@
+import pytest
+import requests
+
+from export import CollectionExporter
+from metrics import REGISTRY
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+        self.headers = {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}")
+
+    def json(self):
+        return {"data": self.data}
+
+
+class FakeSession:
+    """列表接口只返回 chunk_id，详情接口返回内容；chunk_id 为 bad 的详情请求返回 404"""
+
+    def __init__(self, chunk_ids):
+        self.chunk_ids = chunk_ids
+
+    def request(self, method, url, params=None, **kwargs):
+        if url.endswith("/chunks"):
+            ids = self.chunk_ids
+            if params.get("after"):
+                ids = ids[ids.index(params["after"]) + 1:]
+            return FakeResponse([{"chunk_id": chunk_id} for chunk_id in ids[:params["limit"]]])
+        chunk_id = url.rsplit("/", 1)[-1]
+        if chunk_id == "bad":
+            return FakeResponse(None, 404)
+        return FakeResponse({"chunk_id": chunk_id, "content": f"content {chunk_id}"})
+
+
+def metric_values():
+    report = REGISTRY.report()
+    counters = {(item["name"], tuple(sorted(item["labels"].items()))): item["value"] for item in report["counters"]}
+    histograms = {(item["name"], tuple(sorted(item["labels"].items()))): item["count"] for item in report["histograms"]}
+    return counters, histograms
+
+
+def test_iter_chunks_pages_and_records_read_metrics():
+    REGISTRY.reset()
+    ids = [f"c{i}" for i in range(5)]
+    exporter = CollectionExporter("http://api/", {}, page_size=2, max_workers=2, session=FakeSession(ids))
+    assert [chunk["chunk_id"] for chunk in exporter.iter_chunks("col")] == ids
+    counters, histograms = metric_values()
+    assert counters[("autoqag_chunks_read_total", ())] == 5
+    assert histograms[("autoqag_chunk_read_seconds", (("op", "list"),))] == 3
+    assert histograms[("autoqag_chunk_read_seconds", (("op", "detail"),))] == 5
+
+
+def test_failed_detail_read_is_counted():
+    REGISTRY.reset()
+    exporter = CollectionExporter("http://api/", {}, page_size=10, session=FakeSession(["c0", "bad"]))
+    with pytest.raises(requests.HTTPError):
+        list(exporter.iter_chunks("col"))
+    counters, _ = metric_values()
+    assert counters[("autoqag_chunk_read_errors_total", (("op", "detail"),))] == 1
@@ -0,0 +1,138 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import jobs
+from jobs import CANCELLED, FAILED, FINISHED_STATES, QUEUED, RUNNING, SUCCEEDED, JobScheduler, JobStore
+
+
+def wait_finished(store, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = store.get(job_id)
+        if job["status"] in FINISHED_STATES:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"任务 {job_id} 未在 {timeout} 秒内结束")
+
+
+def make_scheduler(tmp_path, handlers, **kwargs):
+    return JobScheduler(JobStore(str(tmp_path / "jobs.sqlite3")), handlers, job_dir=str(tmp_path / "jobs"), **kwargs)
+
+
+def test_inputs_are_copied_into_the_job_dir(tmp_path):
+    def read_inputs(ctx):
+        contents = []
+        for path in ctx.inputs:
+            with open(path, "rb") as f:
+                contents.append(f.read())
+        return [content.decode() for content in contents]
+
+    def write_copy(path):
+        with open(path, "wb") as f:
+            f.write(b"copy")
+
+    scheduler = make_scheduler(tmp_path, {"read": read_inputs})
+    job_id = scheduler.submit("read", inputs=[("a.txt", b"bytes"), ("b.sqlite3", write_copy)])
+    job = wait_finished(scheduler.store, job_id)
+    assert job["status"] == SUCCEEDED
+    assert job["result"] == ["bytes", "copy"]
+    assert all(path.startswith(str(tmp_path / "jobs" / job_id)) for path in job["inputs"])
+
+
+def test_timeout_is_enforced_while_the_handler_blocks(tmp_path):
+    release = threading.Event()
+
+    def blocking(ctx):
+        # 模拟阻塞在不检查取消的网络请求中
+        release.wait(10)
+        return "late"
+
+    scheduler = make_scheduler(tmp_path, {"block": blocking}, heartbeat_interval=0.05, cancel_grace=0.1)
+    start = time.monotonic()
+    job_id = scheduler.submit("block", limits={"timeout": 0.2})
+    job = wait_finished(scheduler.store, job_id)
+    release.set()
+    assert time.monotonic() - start < 5
+    assert job["status"] == FAILED
+    assert "超过运行时长上限" in job["error"]
+    assert scheduler.running() == []
+    time.sleep(0.1)
+    assert scheduler.store.get(job_id)["status"] == FAILED
+
+
+def test_abandoned_handler_keeps_its_slot_until_it_exits(tmp_path):
+    release = threading.Event()
+
+    def blocking(ctx):
+        release.wait(10)
+
+    scheduler = make_scheduler(tmp_path, {"block": blocking}, kind_limits={"block": 1},
+                               heartbeat_interval=0.05, cancel_grace=0.1)
+    first = scheduler.submit("block", limits={"timeout": 0.2})
+    assert wait_finished(scheduler.store, first)["status"] == FAILED
+    second = scheduler.submit("block")
+    time.sleep(0.3)
+    # 被放弃的处理函数仍在阻塞，同类型的任务继续排队
+    assert scheduler.store.get(second)["status"] == QUEUED
+    release.set()
+    assert wait_finished(scheduler.store, second)["status"] == SUCCEEDED
+
+
+def test_cancelled_handler_stops_through_cancel_event(tmp_path):
+    def cooperative(ctx):
+        while True:
+            ctx.check_cancelled()
+            ctx.cancel_event.wait(0.01)
+
+    scheduler = make_scheduler(tmp_path, {"loop": cooperative}, heartbeat_interval=0.05)
+    job_id = scheduler.submit("loop")
+    while scheduler.store.get(job_id)["status"] != RUNNING:
+        time.sleep(0.01)
+    scheduler.cancel(job_id)
+    job = wait_finished(scheduler.store, job_id)
+    assert job["status"] == CANCELLED
+
+
+def test_cancel_from_another_scheduler_reaches_the_owner(tmp_path, monkeypatch):
+    # 两个调度器共用任务表，模拟两个进程：所属进程视为仍在运行
+    monkeypatch.setattr(jobs, "pid_alive", lambda pid: pid is not None)
+
+    def cooperative(ctx):
+        while True:
+            ctx.check_cancelled()
+            ctx.cancel_event.wait(0.01)
+
+    owner = make_scheduler(tmp_path, {"loop": cooperative}, heartbeat_interval=0.05)
+    job_id = owner.submit("loop")
+    while owner.store.get(job_id)["status"] != RUNNING:
+        time.sleep(0.01)
+    other = make_scheduler(tmp_path, {"loop": cooperative})
+    assert other.store.get(job_id)["status"] == RUNNING
+    other.cancel(job_id)
+    assert wait_finished(other.store, job_id)["status"] == CANCELLED
+
+
+def test_recover_only_fails_jobs_without_a_live_owner(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    live = os.getppid()
+    now = time.time()
+    jobs_by_owner = {
+        "alive": (RUNNING, live, now),
+        "dead": (RUNNING, exited.pid, now),
+        "stale": (RUNNING, live, now - 3600),
+        "queued_alive": (QUEUED, live, None),
+        "queued_dead": (QUEUED, exited.pid, None),
+    }
+    for job_id, (status, pid, heartbeat) in jobs_by_owner.items():
+        store.insert(job_id, "noop", job_id, {}, {}, [])
+        store.update(job_id, status=status, owner_pid=pid, heartbeat_at=heartbeat)
+    assert store.recover() == ["queued_dead"]
+    assert store.get("alive")["status"] == RUNNING
+    assert store.get("dead")["status"] == FAILED
+    assert store.get("stale")["status"] == FAILED
+    assert store.get("queued_alive")["status"] == QUEUED
@@ -0,0 +1,79 @@
+import io
+import json
+
+import pytest
+
+from json_stream import JsonRecordStream, iter_batches, record_content
+
+
+def read_all(text, read_size=16, **kwargs):
+    stream = JsonRecordStream(io.BytesIO(text.encode("utf-8")), read_size=read_size, **kwargs)
+    return list(stream), stream
+
+
+def test_jsonl_with_long_first_record():
+    records = [{"content": "x" * 200}, {"content": "y"}, {"content": "z" * 50}]
+    text = "\n".join(json.dumps(record) for record in records) + "\n"
+    result, stream = read_all(text)
+    assert result == records
+    assert stream.layout == "jsonl"
+    assert stream.records == 3
+
+
+def test_jsonl_first_record_ends_at_read_boundary():
+    records = [{"content": "a" * 40, "meta": {"k": [1, 2, 3]}}, {"content": "b"}]
+    text = "\n".join(json.dumps(record) for record in records)
+    for read_size in range(1, 64):
+        assert read_all(text, read_size)[0] == records
+
+
+def test_single_object_is_one_record_jsonl():
+    result, stream = read_all('{"content": "only one"}\n')
+    assert result == [{"content": "only one"}]
+    assert stream.layout == "jsonl"
+
+
+@pytest.mark.parametrize("key", ["chunks", "qa_pairs"])
+def test_record_array_under_key(key):
+    records = [{"content": f"c{i}"} for i in range(20)]
+    text = json.dumps({"collection_id": "abc", key: records, "extra": 1})
+    result, stream = read_all(text)
+    assert result == records
+    assert stream.layout == key
+
+
+def test_top_level_array_and_bom():
+    records = [{"question": "q", "answer": "a"}, {"content": "c"}]
+    result, stream = read_all("﻿" + json.dumps(records))
+    assert result == records
+    assert stream.layout == "array"
+
+
+def test_empty_inputs():
+    assert read_all("")[0] == []
+    assert read_all("[]")[0] == []
+    assert read_all('{"chunks": []}')[0] == []
+
+
+@pytest.mark.parametrize("text", ['[{"content": "a"}, "text"]', '{"chunks": [1]}', '{"content": "a"}\n{"content": "b"}\n[1, 2]\n'])
+def test_non_object_records_are_rejected(text):
+    with pytest.raises(ValueError, match="不是 JSON 对象"):
+        read_all(text)
+
+
+@pytest.mark.parametrize("text", ['{"chunks": null}', '{"id": 1, "qa_pairs": {"question": "q"}}\n{"id": 2}\n'])
+def test_record_key_must_hold_an_array(text):
+    with pytest.raises(ValueError, match="键的值应为记录数组"):
+        read_all(text)
+
+
+def test_object_followed_by_garbage_is_rejected():
+    with pytest.raises(ValueError, match="缺少"):
+        read_all('{"content": "a"} 42')
+
+
+def test_record_content_and_batches():
+    assert record_content({"content": "c"}) == "c"
+    assert record_content({"question": "q", "answer": "a"}) == "q\na"
+    assert record_content({"other": 1}) is None
+    assert list(iter_batches(range(5), 2)) == [[0, 1], [2, 3], [4]]
@@ -0,0 +1,12 @@
+from llm_router import LLMRouter
+
+
+def test_from_config_default_and_explicit_max_retries():
+    router = LLMRouter.from_config([
+        {"base_url": "http://127.0.0.1:1/v1", "api_key": "k"},
+        {"base_url": "http://127.0.0.1:2/v1", "api_key": "k", "max_retries": 5},
+    ])
+    assert [endpoint.client.max_retries for endpoint in router.endpoints] == [0, 5]
+
+    single = LLMRouter.from_config([{"base_url": "http://127.0.0.1:3/v1", "api_key": "k"}])
+    assert single.endpoints[0].client.max_retries == 2
@@ -0,0 +1,40 @@
+from qa_filter import DuplicateIndex, QAFilter, embed_texts
+
+SOURCE = "北京师范大学创建于1902年，是教育部直属重点大学，位于北京市海淀区新街口外大街。"
+
+
+def pair(question, answer, chunk=SOURCE):
+    return {"question": question, "answer": answer, "chunk": chunk}
+
+
+def test_filter_reasons_and_best_duplicate_kept():
+    qa_pairs = [
+        pair("北京师范大学创建于哪一年？", "创建于1902年，今天天气很好，我们出去玩吧"),
+        pair("短", "答案很长很长"),
+        pair("学校位于哪里？", "完全无关的回答内容在这里出现"),
+        pair("北京师范大学创建于哪一年?", "北京师范大学创建于1902年"),
+    ]
+    kept, report = QAFilter(min_overlap=0.3, duplicate_threshold=0.9).filter(qa_pairs)
+    assert kept == [qa_pairs[3]]
+    assert [(i, reason) for i, reason, _ in report.dropped] == [(0, "duplicate"), (1, "too_short"), (2, "low_overlap")]
+    assert report.total == 4 and report.kept == 1
+
+
+def test_filter_pages_matches_single_page():
+    qa_pairs = [pair(f"北京师范大学第{i % 7}个问题是什么？", "北京师范大学创建于1902年") for i in range(40)]
+    qa_filter = QAFilter(duplicate_threshold=0.95)
+    _, whole = qa_filter.filter(qa_pairs)
+    rows = list(enumerate(qa_pairs))
+    paged = qa_filter.filter_pages(rows[i:i + 6] for i in range(0, len(rows), 6))
+    assert paged.dropped == whole.dropped
+    assert paged.kept == 7
+
+
+def test_duplicate_index_lsh_path_finds_near_duplicates():
+    questions = [f"问题编号{i}的具体内容是什么呢" for i in range(300)]
+    vectors = embed_texts(questions)
+    index = DuplicateIndex(0.99, ann_min_size=10)
+    for vector in vectors:
+        index.add(vector)
+    match, similarity = index.query(vectors[123])
+    assert match == 123 and similarity > 0.99
@@ -0,0 +1,27 @@
+import os
+
+from qa_store import QASessionStore
+
+
+def test_create_from_source_copies_uncheckpointed_pairs(tmp_path):
+    source = QASessionStore(str(tmp_path / "job.sqlite3"))
+    source.add_many((i, {"question": f"Q{i}", "answer": "A", "chunk": "原文"}, {"source": "doc.txt"}) for i in range(3))
+    copy = QASessionStore.create(str(tmp_path / "sessions"), source=source)
+    assert copy.path != source.path
+    assert [qa["question"] for _, qa in copy.page(0, 10)] == ["Q0", "Q1", "Q2"]
+    copy.close()
+    QASessionStore.remove(copy.path)
+    assert source.count() == 3
+    source.close()
+
+
+def test_create_only_purges_its_own_directory(tmp_path):
+    job_store = QASessionStore(str(tmp_path / "job.sqlite3"))
+    job_store.close()
+    os.utime(job_store.path, (0, 0))
+    stale = QASessionStore.create(str(tmp_path / "sessions"))
+    stale.close()
+    os.utime(stale.path, (0, 0))
+    QASessionStore.create(str(tmp_path / "sessions")).close()
+    assert not os.path.exists(stale.path)
+    assert os.path.exists(job_store.path)
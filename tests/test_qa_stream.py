@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from qa_stream import IncrementalQAParser, parse_qa_pairs
+
+MULTI = """Q: 什么是AutoQAG？ AutoQAG有什么用？
+A: AutoQAG 是一个问答对生成工具。
+它可以批量处理文档。
+
+Q: 支持哪些格式？
+A: 支持 PDF、Word 和 Markdown。
+"""
+
+
+def questions_and_answers(pairs):
+    return [(pair["question"], pair["answer"]) for pair in pairs]
+
+
+def test_multiple_pairs():
+    assert questions_and_answers(parse_qa_pairs(MULTI)) == [
+        ("什么是AutoQAG？ AutoQAG有什么用？", "AutoQAG 是一个问答对生成工具。\n它可以批量处理文档。"),
+        ("支持哪些格式？", "支持 PDF、Word 和 Markdown。"),
+    ]
+
+
+def test_numbered_questions_are_merged():
+    response = "Q1: 第一个问法\nQ2: 第二个问法\nA1: 答案\n\nQ3: 另一个问题\nA3: 另一个答案"
+    assert questions_and_answers(parse_qa_pairs(response)) == [
+        ("第一个问法 第二个问法", "答案"),
+        ("另一个问题", "另一个答案"),
+    ]
+
+
+@pytest.mark.parametrize("response", [
+    "**Q:** 问题内容\n**A:** 答案内容",
+    "**Q**: 问题内容\n**A**: 答案内容",
+    "Q：问题内容\nA：答案内容",
+    "1. Q: 问题内容\n   A: 答案内容",
+    "- q: 问题内容\n- a: 答案内容\n---",
+    "问题：问题内容\n答案：答案内容",
+    "问：问题内容\n答：答案内容",
+])
+def test_marker_variants(response):
+    assert questions_and_answers(parse_qa_pairs(response)) == [("问题内容", "答案内容")]
+
+
+def test_leading_text_before_first_answer_is_question():
+    response = "这款产品的保修期是多久？\nA: 保修期为两年。\n\nQ: 如何申请保修？\nA: 联系客服。"
+    assert questions_and_answers(parse_qa_pairs(response)) == [
+        ("这款产品的保修期是多久？", "保修期为两年。"),
+        ("如何申请保修？", "联系客服。"),
+    ]
+
+
+def test_chinese_short_label_inside_answer_is_kept():
+    response = "Q: 访谈记录里说了什么？\nA: 记录如下：\n问：你好吗？\n答：很好。\n\nQ: 下一个问题\nA: 下一个答案"
+    assert questions_and_answers(parse_qa_pairs(response)) == [
+        ("访谈记录里说了什么？", "记录如下：\n问：你好吗？\n答：很好。"),
+        ("下一个问题", "下一个答案"),
+    ]
+
+
+def test_incomplete_blocks_are_dropped():
+    assert parse_qa_pairs("Q: 只有问题") == []
+    assert parse_qa_pairs("") == []
+    assert parse_qa_pairs("没有任何标记的文本") == []
+
+
+RESPONSES = [
+    MULTI,
+    "Q1: 第一个问法\nQ2: 第二个问法\nA1: 答案\n\nQ3: 另一个问题\nA3: 另一个答案",
+    "**Q:** 问题一\n**A:** 答案一\n\n---\n\n**Q:** 问题二\n**A:** 答案二\n",
+    "前言文本\nA: 第一段答案\n\nQ: 问题\nA: 答案\nA: 补充答案",
+    "问题：问题一\n答案：答案一\n问：引用\n\n问题：问题二\n答案：答案二",
+    "Q:\nA: 没有问题的答案\n\nQ: 有问题\nA: 有答案",
+]
+
+
+@pytest.mark.parametrize("response", RESPONSES)
+def test_incremental_matches_full_parse_under_random_splits(response):
+    expected = parse_qa_pairs(response)
+    rng = random.Random(0)
+    for _ in range(200):
+        cuts = sorted(rng.sample(range(1, len(response)), rng.randint(0, min(12, len(response) - 1))))
+        parser = IncrementalQAParser()
+        for start, end in zip([0] + cuts, cuts + [len(response)]):
+            parser.feed(response[start:end])
+        complete = [pair for pair in parser.snapshot() if pair["question"] and pair["answer"]]
+        assert complete == expected
+
+
+@pytest.mark.parametrize("response", RESPONSES)
+def test_incremental_matches_full_parse_char_by_char(response):
+    parser = IncrementalQAParser()
+    for char in response:
+        parser.feed(char)
+    assert [pair for pair in parser.snapshot() if pair["question"] and pair["answer"]] == parse_qa_pairs(response)
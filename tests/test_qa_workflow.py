@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import qa_workflow
+from ingest import ChunkIngestor
+from qa_store import QASessionStore
+from qa_workflow import QA_CONTENT_MAX_CHARS, build_qa_content, generate_qa_pairs, insert_qa_pairs
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Code")
+
+
+def make_chunks(*texts):
+    return [SimpleNamespace(page_content=text, metadata={"source": "doc.txt"}) for text in texts]
+
+
+def fake_completion(router, prompt, model):
+    if "坏文本" in prompt:
+        return "无法生成"
+    return "Q: 问题一？\nA: 答案一\n\nQ: 问题二？\nA: 答案二"
+
+
+class FakeIngestor(ChunkIngestor):
+    def __init__(self):
+        super().__init__("http://example.invalid/", {})
+        self.created = []
+
+    def create_chunk(self, collection_id, content):
+        if "失败" in content:
+            raise ValueError("写入失败")
+        self.created.append(content)
+        return {"chunk_id": f"c{len(self.created)}"}, 1
+
+
+def test_generate_keeps_order_and_reports_failures(monkeypatch):
+    monkeypatch.setattr(qa_workflow, "request_completion", fake_completion)
+    done = {}
+    progress = []
+    qa_pairs = generate_qa_pairs(
+        None, make_chunks("文本一", "坏文本", "文本三"), max_workers=3,
+        on_chunk_done=lambda i, pairs, error: done.__setitem__(i, (len(pairs), error)),
+        on_progress=lambda completed, total: progress.append((completed, total)),
+    )
+    assert [qa_pair["chunk"] for qa_pair in qa_pairs] == ["文本一", "文本一", "文本三", "文本三"]
+    assert done[0] == (2, None) and done[2] == (2, None)
+    assert done[1][0] == 0 and isinstance(done[1][1], ValueError)
+    assert progress[-1] == (3, 3)
+
+
+def test_generate_writes_into_store(monkeypatch, tmp_path):
+    monkeypatch.setattr(qa_workflow, "request_completion", fake_completion)
+    store = QASessionStore.create(str(tmp_path))
+    assert generate_qa_pairs(None, make_chunks("文本一", "文本二"), store=store) is store
+    assert store.count() == 4
+    store.close()
+
+
+def test_insert_maps_results_to_qa_pair_indices():
+    qa_pairs = [
+        {"question": "Q1", "answer": "A1", "chunk": "S"},
+        {"question": "Q2", "answer": "A2"},
+        {"question": "Q3", "answer": "失败", "chunk": "S"},
+        {"question": "Q4", "answer": "A4", "chunk": "S"},
+    ]
+    results = {}
+    report, invalid = insert_qa_pairs(FakeIngestor(), "collection", qa_pairs,
+                                      on_result=lambda i, result: results.__setitem__(i, result))
+    assert invalid == 1
+    assert (report.success_count, report.fail_count) == (2, 1)
+    assert results[1] is None
+    assert results[0]["ok"] and results[3]["ok"] and not results[2]["ok"]
+
+
+def test_qa_content_is_truncated_and_validated():
+    assert build_qa_content({"question": "Q", "answer": "A"}) is None
+    content = build_qa_content({"question": "Q", "answer": "A", "chunk": "x" * QA_CONTENT_MAX_CHARS})
+    assert len(content) == QA_CONTENT_MAX_CHARS
+
+
+def test_cli_does_not_import_the_app():
+    code = "import sys, run_pipeline; assert 'streamlit' not in sys.modules and 'AutoQAG' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], cwd=CODE_DIR, check=True)
@@ -0,0 +1,82 @@
+import threading
+import time
+
+from doc_manifest import DocumentManifest
+from record_index import RecordIndex, Upserter, record_keys
+
+
+def qa_content(question, answer, source):
+    return f"问题：{question}\n答案：{answer}\n原文：{source}"
+
+
+def test_pairs_sharing_a_question_have_distinct_identities():
+    first = record_keys(qa_content("什么是X？", "答案一", "原文"))
+    second = record_keys(qa_content("什么是X？", "答案二", "原文"))
+    assert first[0] != second[0]
+
+
+def test_identity_ignores_surrounding_whitespace():
+    assert record_keys(qa_content("Q", "A", "S"))[0] == record_keys(qa_content(" Q", "A \n", "S"))[0]
+
+
+def test_plain_content_identity_is_content_hash():
+    identity, version = record_keys("plain chunk")
+    assert identity == version
+
+
+def test_plan_keeps_same_question_pairs(tmp_path):
+    upserter = Upserter(RecordIndex(str(tmp_path / "records.sqlite3")), None, "collection")
+    contents = [qa_content("Q", "A1", "S"), qa_content("Q", "A2", "S"), qa_content("Q", "A1", "S")]
+    _, pending, skipped = upserter.plan(contents)
+    assert [i for i, _ in pending] == [0, 1]
+    assert [result["index"] for result in skipped] == [2]
+
+
+def test_scope_defaults_and_override(tmp_path):
+    index = RecordIndex(str(tmp_path / "records.sqlite3"))
+    assert Upserter(index, None, "collection").scope == "collection"
+    assert Upserter(index, None, "part2", scope="group").scope == "group"
+
+
+class SlowIngestor:
+    def __init__(self):
+        self.created = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def create_chunk(self, collection_id, content):
+        self.started.set()
+        self.release.wait(5)
+        self.created.append(content)
+        return {"chunk_id": f"c{len(self.created)}"}, 1
+
+
+def test_identical_pairs_in_flight_share_chunk_and_survive_removal(tmp_path):
+    ingestor = SlowIngestor()
+    upserter = Upserter(RecordIndex(str(tmp_path / "records.sqlite3")), ingestor, "collection")
+    manifest = DocumentManifest(str(tmp_path / "documents.sqlite3"))
+    content = qa_content("Q", "A", "S")
+    results = {}
+
+    def write(chunk_hash):
+        results[chunk_hash] = upserter.upsert_one(content)[0]
+
+    first = threading.Thread(target=write, args=("h1",))
+    first.start()
+    assert ingestor.started.wait(5)
+    second = threading.Thread(target=write, args=("h2",))
+    second.start()
+    time.sleep(0.2)
+    ingestor.release.set()
+    first.join(5)
+    second.join(5)
+    assert len(ingestor.created) == 1
+    assert results["h1"]["chunk_id"] == results["h2"]["chunk_id"] == "c1"
+
+    hashes = manifest.diff("collection", "doc.txt", ["文本一", "文本二"]).hashes
+    for chunk_hash, key in zip(hashes, ("h1", "h2")):
+        manifest.add("collection", "doc.txt", chunk_hash, "collection", results[key]["chunk_id"])
+    # 新版本中删去了文本一，它生成的 chunk 仍被文本二共用，不应删除
+    removed = manifest.diff("collection", "doc.txt", ["文本二"]).removed
+    assert len(removed) == 1
+    assert manifest.shared_chunk_ids("collection", removed) == {"c1"}
@@ -0,0 +1,66 @@
+import threading
+
+from sharding import ShardedCollection, ShardManifest
+
+
+class FakeCollections:
+    def __init__(self):
+        self.created = []
+        self._lock = threading.Lock()
+
+    def __call__(self, name, capacity):
+        with self._lock:
+            self.created.append(name)
+            return {"collection_id": f"id-{name}", "name": name, "capacity": capacity}
+
+
+def test_new_shards_use_part_names(tmp_path):
+    create = FakeCollections()
+    sharded = ShardedCollection("corpus", create, manifest=ShardManifest(str(tmp_path / "shards.sqlite3")), capacity=2)
+    targets = sharded.allocate(5)
+    assert create.created == ["corpus_part1", "corpus_part2", "corpus_part3"]
+    assert sorted(targets) == ["id-corpus_part1"] * 2 + ["id-corpus_part2"] * 2 + ["id-corpus_part3"]
+
+
+def test_existing_part_collections_are_adopted(tmp_path):
+    create = FakeCollections()
+    collections = [
+        {"collection_id": "a", "name": "corpus_part1", "capacity": 2, "num_chunks": 2},
+        {"collection_id": "b", "name": "corpus_part2", "capacity": 2, "num_chunks": 1},
+        {"collection_id": "c", "name": "other_part1", "capacity": 2, "num_chunks": 0},
+    ]
+    sharded = ShardedCollection("corpus", create, manifest=ShardManifest(str(tmp_path / "shards.sqlite3")),
+                                capacity=2, collections=collections)
+    assert sharded.allocate(2) == ["b", "id-corpus_part3"]
+    assert create.created == ["corpus_part3"]
+
+
+def test_base_collection_is_first_shard(tmp_path):
+    create = FakeCollections()
+    base = {"collection_id": "base", "name": "manual", "capacity": 1, "num_chunks": 0}
+    sharded = ShardedCollection("base", create, manifest=ShardManifest(str(tmp_path / "shards.sqlite3")),
+                                capacity=1, base_collection=base, name="manual")
+    assert sharded.allocate(2) == ["base", "id-manual_part2"]
+
+
+def test_concurrent_instances_create_one_shard(tmp_path):
+    path = str(tmp_path / "shards.sqlite3")
+    create = FakeCollections()
+    instances = [ShardedCollection("corpus", create, manifest=ShardManifest(path), capacity=10) for _ in range(4)]
+    results = []
+    threads = [threading.Thread(target=lambda s=s: results.extend(s.allocate(5))) for s in instances]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert create.created == ["corpus_part1", "corpus_part2"]
+    assert sorted(results) == ["id-corpus_part1"] * 10 + ["id-corpus_part2"] * 10
+    assert [shard["used"] for shard in ShardManifest(path).shards("corpus")] == [10, 10]
+
+
+def test_release_returns_capacity(tmp_path):
+    manifest = ShardManifest(str(tmp_path / "shards.sqlite3"))
+    sharded = ShardedCollection("corpus", FakeCollections(), manifest=manifest, capacity=3)
+    targets = sharded.allocate(3)
+    sharded.release(targets[:2])
+    assert manifest.shards("corpus")[0]["used"] == 1